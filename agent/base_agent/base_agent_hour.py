@@ -20,8 +20,13 @@ import sys
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
 
-from tools.general_tools import extract_conversation, extract_tool_messages, get_config_value, write_config_value
-from tools.price_tools import add_no_trade_record
+from tools.general_tools import extract_conversation, extract_tool_messages, get_config_value, write_config_value, config_batch
+from tools.history_compaction import compact_history, estimate_tokens
+from tools.llm_cache import LLMCacheMiss
+from tools.market_context import prefetch_market_day_context
+from tools.price_tools import add_no_trade_record, get_trading_calendar
+from tools.session_log import get_log_writer
+from tools.session_metrics import SessionMetrics, metrics_path_for
 from prompts.agent_prompt import get_agent_system_prompt, STOP_SIGNAL
 
 # Load environment variables
@@ -50,6 +55,7 @@ class BaseAgent_Hour(BaseAgent):
         
         # Set up logging
         log_file = self._setup_logging(today_date)
+        self._session_metrics = SessionMetrics(metrics_path_for(log_file), self.signature, self.basemodel, today_date)
         write_config_value("LOG_FILE", log_file)
         
         # Update system prompt
@@ -80,7 +86,7 @@ class BaseAgent_Hour(BaseAgent):
         message = user_query.copy()
         
         # Log initial message
-        self._log_message(log_file, user_query)
+        await self._log_message(log_file, user_query)
         
         # Trading loop
         current_step = 0
@@ -89,17 +95,25 @@ class BaseAgent_Hour(BaseAgent):
             print(f"🔄 Step {current_step}/{self.max_steps}")
             
             try:
+                self._session_metrics.start_step(current_step)
+
+                # 只压缩发送给模型的副本，完整历史仍写入日志
+                request_messages = compact_history(message, self.history_compaction)
+                history_tokens = estimate_tokens(request_messages)
+                print(f"🧮 History: {len(request_messages)} messages, ~{history_tokens} tokens")
+
                 # Call agent
-                response = await self._ainvoke_with_retry(message)
+                response = await self._ainvoke_with_retry(request_messages)
                 
                 # Extract agent response
                 agent_response = extract_conversation(response, "final")
+                await self._session_metrics.end_step(history_tokens)
                 
                 # Check stop signal
                 if STOP_SIGNAL in agent_response:
                     print("✅ Received stop signal, trading session ended")
                     print(agent_response)
-                    self._log_message(log_file, [{"role": "assistant", "content": agent_response}])
+                    await self._log_message(log_file, [{"role": "assistant", "content": agent_response}])
                     break
                 
                 # Extract tool messages with None check
@@ -116,14 +130,20 @@ class BaseAgent_Hour(BaseAgent):
                 message.extend(new_messages)
                 
                 # Log messages
-                self._log_message(log_file, new_messages[0])
-                self._log_message(log_file, new_messages[1])
+                await self._log_message(log_file, new_messages[0])
+                await self._log_message(log_file, new_messages[1])
                 
             except Exception as e:
                 print(f"❌ Trading session error: {str(e)}")
                 print(f"Error details: {e}")
+                await self._session_metrics.end_session(status="error")
+                await get_log_writer().flush(fsync=True)
                 raise
         
+        # 会话结束时把日志和指标写完并落盘
+        await self._session_metrics.end_session()
+        await get_log_writer().flush(fsync=True)
+
         # Handle trading results
         await self._handle_trading_result(today_date)
     
@@ -150,32 +170,9 @@ class BaseAgent_Hour(BaseAgent):
         else:
             raise ValueError("Only support hour-level trading. Please use YYYY-MM-DD HH:MM:SS format.")
         
-        # Get merged.jsonl path
-        base_dir = Path(__file__).resolve().parents[2]
-        merged_file = base_dir / "data" / "merged.jsonl"
-        
-        if not merged_file.exists():
-            return []
-        
-        # Collect all timestamps from merged.jsonl
-        all_timestamps = set()
-        
-        with merged_file.open("r", encoding="utf-8") as f:
-            for line in f:
-                if not line.strip():
-                    continue
-                try:
-                    doc = json.loads(line)
-                    # 查找所有以 "Time Series" 开头的键
-                    for key, value in doc.items():
-                        if key.startswith("Time Series"):
-                            if isinstance(value, dict):
-                                all_timestamps.update(value.keys())
-                            break
-                except Exception:
-                    continue
-        
-        if not all_timestamps:
+        # Trading calendar built from merged.jsonl (cached per process)
+        calendar = get_trading_calendar("us")
+        if calendar is None or len(calendar) == 0:
             return []
         # Determine min_datetime based on init_date and last processed date in position file
         min_datetime = init_dt
@@ -220,34 +217,12 @@ class BaseAgent_Hour(BaseAgent):
             if not has_time:
                 last_processed_dt = last_processed_dt.date()
         
-        # Filter timestamps within the range
-        trading_times = []
-        if not has_time:
-            min_datetime = min_datetime.date()
-            end_dt = end_dt.date()
-    
-        for ts_str in all_timestamps:
-            try:
-                if has_time:
-                    ts_dt = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-                else:
-                    ts_dt = datetime.strptime(ts_str, "%Y-%m-%d").date()
-                # Check if timestamp is in range with boundary rules
-                in_lower = False
-                if last_processed_dt is None:
-                    in_lower = ts_dt >= min_datetime
-                else:
-                    in_lower = ts_dt > min_datetime
-                if in_lower and ts_dt <= end_dt:
-                    trading_times.append(ts_str)
-                    
-            except Exception as e:
-                print(f"❌ Error processing timestamp: {ts_str}")
-                print(e)
-                continue
-        
-        # Sort and remove duplicates
-        trading_times = sorted(list(set(trading_times)))
+        # Filter timestamps within the range: bisect the calendar, lower bound is exclusive
+        # once something has been processed
+        trading_times = calendar.range(
+            min_datetime.strftime("%Y-%m-%d %H:%M:%S"), end_dt.strftime("%Y-%m-%d %H:%M:%S"),
+            include_start=last_processed_dt is None,
+        )
         if REGISTER:
             print("REGISTER date will not be considered")
             trading_times = trading_times[1:]
@@ -272,18 +247,35 @@ class BaseAgent_Hour(BaseAgent):
         print(f"📊 Trading days to process: {trading_dates}")
         
         # Process each trading day
-        for date in trading_dates:
+        prefetch: Optional[asyncio.Task] = None
+        for index, date in enumerate(trading_dates):
             print(f"🔄 Processing {self.signature} - Date: {date}")
+
+            # 等待上一轮的预取完成，再在本交易日运行期间预取下一个交易日的市场数据
+            if prefetch is not None:
+                await prefetch
+            if index + 1 < len(trading_dates):
+                prefetch = asyncio.create_task(prefetch_market_day_context(trading_dates[index + 1], self.market))
+            else:
+                prefetch = None
             
             # Set configuration
-            write_config_value("TODAY_DATE", date)
-            write_config_value("SIGNATURE", self.signature)
+            with config_batch():
+                write_config_value("TODAY_DATE", date)
+                write_config_value("SIGNATURE", self.signature)
+            self._set_trading_context(date)
             
             try:
                 await self.run_with_retry(date)
+            except LLMCacheMiss:
+                if prefetch is not None:
+                    prefetch.cancel()
+                raise
             except Exception as e:
                 print(f"❌ Error processing {self.signature} - Date: {date}")
                 print(e)
+                if prefetch is not None:
+                    prefetch.cancel()
                 raise
         
         print(f"✅ {self.signature} processing completed")
@@ -84,9 +84,20 @@ class DeepSeekChatOpenAI(ChatOpenAI):
 
 from prompts.agent_prompt_astock import (STOP_SIGNAL,
                                          get_agent_system_prompt_astock)
-from tools.general_tools import (extract_conversation, extract_tool_messages,
-                                 get_config_value, write_config_value)
+from tools.general_tools import (_resolve_runtime_env_path,
+                                 extract_conversation, extract_tool_messages,
+                                 config_batch, get_config_value,
+                                 write_config_value)
+from tools.inproc_tools import get_mcp_tools, mcp_connection
+from tools.llm_cache import LLMCacheMiss, get_llm_cache
+from tools.history_compaction import (compact_history, estimate_tokens,
+                                      resolve_history_compaction)
+from tools.market_context import prefetch_market_day_context
 from tools.price_tools import add_no_trade_record
+from tools.session_log import get_log_writer
+from tools.session_metrics import SessionMetrics, metrics_path_for
+from tools.trading_context import (attach_context_headers,
+                                   update_context_headers)
 
 # Load environment variables
 load_dotenv()
@@ -174,6 +185,7 @@ class BaseAgentAStock:
         initial_cash: float = 100000.0,  # 默认10万人民币
         init_date: str = "2025-10-09",
         market: str = "cn",  # 接受但忽略此参数，始终使用"cn"
+        history_compaction: Optional[Dict[str, Any]] = None,
     ):
         """
         Initialize BaseAgentAStock
@@ -192,6 +204,7 @@ class BaseAgentAStock:
             initial_cash: Initial cash amount (default: 100000.0 RMB)
             init_date: Initialization date
             market: Market type (accepted for compatibility, but always uses "cn")
+            history_compaction: History compaction policy (see tools/history_compaction.py), None for the defaults
         """
         self.signature = signature
         self.basemodel = basemodel
@@ -208,6 +221,7 @@ class BaseAgentAStock:
         self.base_delay = base_delay
         self.initial_cash = initial_cash
         self.init_date = init_date
+        self.history_compaction = resolve_history_compaction(history_compaction)
 
         # Set MCP configuration
         self.mcp_config = mcp_config or self._get_default_mcp_config()
@@ -227,9 +241,13 @@ class BaseAgentAStock:
 
         # Initialize components
         self.client: Optional[MultiServerMCPClient] = None
+        # 随每次 MCP 工具调用发送的交易上下文请求头
+        self._context_headers: List[Dict[str, str]] = []
         self.tools: Optional[List] = None
         self.model: Optional[ChatOpenAI] = None
         self.agent: Optional[Any] = None
+        # 当前交易会话的指标收集器（写入 log/<date>/metrics.jsonl）
+        self._session_metrics: Optional[SessionMetrics] = None
 
         # Data paths
         self.data_path = os.path.join(self.base_log_path, self.signature)
@@ -237,23 +255,12 @@ class BaseAgentAStock:
 
     def _get_default_mcp_config(self) -> Dict[str, Dict[str, Any]]:
         """Get default MCP configuration"""
+        # MCP_TRANSPORT=inproc: 在 agent 进程内直接调用工具函数，无需启动 MCP 服务；combined: 连接单进程合并服务
         return {
-            "math": {
-                "transport": "streamable_http",
-                "url": f"http://localhost:{os.getenv('MATH_HTTP_PORT', '8000')}/mcp",
-            },
-            "stock_local": {
-                "transport": "streamable_http",
-                "url": f"http://localhost:{os.getenv('GETPRICE_HTTP_PORT', '8003')}/mcp",
-            },
-            "search": {
-                "transport": "streamable_http",
-                "url": f"http://localhost:{os.getenv('SEARCH_HTTP_PORT', '8004')}/mcp",
-            },
-            "trade": {
-                "transport": "streamable_http",
-                "url": f"http://localhost:{os.getenv('TRADE_HTTP_PORT', '8002')}/mcp",
-            },
+            "math": mcp_connection("math", "MATH_HTTP_PORT", "8000"),
+            "stock_local": mcp_connection("price", "GETPRICE_HTTP_PORT", "8003"),
+            "search": mcp_connection("search", "SEARCH_HTTP_PORT", "8004"),
+            "trade": mcp_connection("trade", "TRADE_HTTP_PORT", "8002"),
         }
 
     async def initialize(self) -> None:
@@ -270,10 +277,10 @@ class BaseAgentAStock:
 
         try:
             # Create MCP client
-            self.client = MultiServerMCPClient(self.mcp_config)
-
-            # Get tools
-            self.tools = await self.client.get_tools()
+            # 交易上下文（签名、日期等）通过请求头随每次工具调用发送，MCP 服务无需读取共享配置文件
+            self._context_headers = attach_context_headers(self.mcp_config)
+            # inproc 连接的工具在本进程内加载，其余连接由 MultiServerMCPClient 管理
+            self.client, self.tools = await get_mcp_tools(self.mcp_config)
             if not self.tools:
                 print("⚠️  Warning: No MCP tools loaded. MCP services may not be running.")
                 print(f"   MCP configuration: {self.mcp_config}")
@@ -296,6 +303,7 @@ class BaseAgentAStock:
                     api_key=self.openai_api_key,
                     max_retries=3,
                     timeout=30,
+                    cache=get_llm_cache(),
                 )
             else:
                 self.model = ChatOpenAI(
@@ -304,6 +312,7 @@ class BaseAgentAStock:
                     api_key=self.openai_api_key,
                     max_retries=3,
                     timeout=30,
+                    cache=get_llm_cache(),
                 )
         except Exception as e:
             raise RuntimeError(f"❌ Failed to initialize AI model: {e}")
@@ -320,20 +329,27 @@ class BaseAgentAStock:
             os.makedirs(log_path)
         return os.path.join(log_path, "log.jsonl")
 
-    def _log_message(self, log_file: str, new_messages: List[Dict[str, str]]) -> None:
-        """Log messages to log file"""
+    async def _log_message(self, log_file: str, new_messages: List[Dict[str, str]]) -> None:
+        """Queue messages for the log file (written by the background log writer)"""
         log_entry = {"timestamp": datetime.now().isoformat(), "signature": self.signature, "new_messages": new_messages}
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        await get_log_writer().write(log_file, log_entry)
 
     async def _ainvoke_with_retry(self, message: List[Dict[str, str]]) -> Any:
         """Agent invocation with retry"""
         for attempt in range(1, self.max_retries + 1):
             try:
-                return await self.agent.ainvoke({"messages": message}, {"recursion_limit": 100})
+                return await self.agent.ainvoke(
+                    {"messages": message},
+                    {"recursion_limit": 100, "callbacks": [self._session_metrics] if self._session_metrics else None},
+                )
+            except LLMCacheMiss:
+                # 回放模式下缓存未命中，重试没有意义
+                raise
             except Exception as e:
                 if attempt == self.max_retries:
                     raise e
+                if self._session_metrics is not None:
+                    await self._session_metrics.record_retry(attempt, e)
                 print(f"⚠️ Attempt {attempt} failed, retrying after {self.base_delay * attempt} seconds...")
                 print(f"Error details: {e}")
                 await asyncio.sleep(self.base_delay * attempt)
@@ -349,6 +365,7 @@ class BaseAgentAStock:
 
         # Set up logging
         log_file = self._setup_logging(today_date)
+        self._session_metrics = SessionMetrics(metrics_path_for(log_file), self.signature, self.basemodel, today_date)
 
         # Update system prompt - 使用A股专用提示词
         self.agent = create_agent(
@@ -362,7 +379,7 @@ class BaseAgentAStock:
         message = user_query.copy()
 
         # Log initial message
-        self._log_message(log_file, user_query)
+        await self._log_message(log_file, user_query)
 
         # Trading loop
         current_step = 0
@@ -371,17 +388,25 @@ class BaseAgentAStock:
             print(f"🔄 Step {current_step}/{self.max_steps}")
 
             try:
+                self._session_metrics.start_step(current_step)
+
+                # 只压缩发送给模型的副本，完整历史仍写入日志
+                request_messages = compact_history(message, self.history_compaction)
+                history_tokens = estimate_tokens(request_messages)
+                print(f"🧮 History: {len(request_messages)} messages, ~{history_tokens} tokens")
+
                 # Call agent
-                response = await self._ainvoke_with_retry(message)
+                response = await self._ainvoke_with_retry(request_messages)
 
                 # Extract agent response
                 agent_response = extract_conversation(response, "final")
+                await self._session_metrics.end_step(history_tokens)
 
                 # Check stop signal
                 if STOP_SIGNAL in agent_response:
                     print("✅ Received stop signal, trading session ended")
                     print(agent_response)
-                    self._log_message(log_file, [{"role": "assistant", "content": agent_response}])
+                    await self._log_message(log_file, [{"role": "assistant", "content": agent_response}])
                     break
 
                 # Extract tool messages
@@ -398,14 +423,20 @@ class BaseAgentAStock:
                 message.extend(new_messages)
 
                 # Log messages
-                self._log_message(log_file, new_messages[0])
-                self._log_message(log_file, new_messages[1])
+                await self._log_message(log_file, new_messages[0])
+                await self._log_message(log_file, new_messages[1])
 
             except Exception as e:
                 print(f"❌ Trading session error: {str(e)}")
                 print(f"Error details: {e}")
+                await self._session_metrics.end_session(status="error")
+                await get_log_writer().flush(fsync=True)
                 raise
 
+        # 会话结束时把日志和指标写完并落盘
+        await self._session_metrics.end_session()
+        await get_log_writer().flush(fsync=True)
+
         # Handle trading results
         await self._handle_trading_result(today_date)
 
@@ -474,7 +505,7 @@ class BaseAgentAStock:
         Returns:
             List of trading dates (excluding weekends and holidays)
         """
-        from tools.price_tools import is_trading_day
+        from tools.price_tools import get_trading_calendar
 
         dates = []
         max_date = None
@@ -504,17 +535,21 @@ class BaseAgentAStock:
             return []
 
         # Generate trading date list, filtered by actual trading days (A-shares market)
-        trading_dates = []
-        current_date = max_date_obj + timedelta(days=1)
-
-        while current_date <= end_date_obj:
-            date_str = current_date.strftime("%Y-%m-%d")
-            # Check if this is an actual trading day in A-shares market
-            if is_trading_day(date_str, market="cn"):
-                trading_dates.append(date_str)
-            current_date += timedelta(days=1)
-
-        return trading_dates
+        calendar = get_trading_calendar("cn")
+        if calendar is None:
+            return []
+        return calendar.trading_days(max_date, end_date, include_start=False)
+
+    def _set_trading_context(self, today_date: str) -> None:
+        """Send SIGNATURE/TODAY_DATE/LOG_PATH/... with all subsequent MCP tool calls"""
+        update_context_headers(
+            self._context_headers,
+            SIGNATURE=self.signature,
+            TODAY_DATE=today_date,
+            LOG_PATH=self.base_log_path,
+            MARKET=self.market,
+            RUNTIME_ENV_PATH=_resolve_runtime_env_path(),
+        )
 
     async def run_with_retry(self, today_date: str) -> None:
         """Run method with retry"""
@@ -524,6 +559,9 @@ class BaseAgentAStock:
                 await self.run_trading_session(today_date)
                 print(f"✅ {self.signature} - {today_date} run successful")
                 return
+            except LLMCacheMiss:
+                # replay 模式下未命中不重试：重跑会重复执行已回放步骤的交易
+                raise
             except Exception as e:
                 print(f"❌ Attempt {attempt} failed: {str(e)}")
                 if attempt == self.max_retries:
@@ -554,18 +592,35 @@ class BaseAgentAStock:
         print(f"📊 Trading days to process: {trading_dates}")
 
         # Process each trading day
-        for date in trading_dates:
+        prefetch: Optional[asyncio.Task] = None
+        for index, date in enumerate(trading_dates):
             print(f"🔄 Processing {self.signature} - Date: {date}")
 
+            # 等待上一轮的预取完成，再在本交易日运行期间预取下一个交易日的市场数据
+            if prefetch is not None:
+                await prefetch
+            if index + 1 < len(trading_dates):
+                prefetch = asyncio.create_task(prefetch_market_day_context(trading_dates[index + 1], self.market))
+            else:
+                prefetch = None
+
             # Set configuration
-            write_config_value("TODAY_DATE", date)
-            write_config_value("SIGNATURE", self.signature)
+            with config_batch():
+                write_config_value("TODAY_DATE", date)
+                write_config_value("SIGNATURE", self.signature)
+            self._set_trading_context(date)
 
             try:
                 await self.run_with_retry(date)
+            except LLMCacheMiss:
+                if prefetch is not None:
+                    prefetch.cancel()
+                raise
             except Exception as e:
                 print(f"❌ Error processing {self.signature} - Date: {date}")
                 print(e)
+                if prefetch is not None:
+                    prefetch.cancel()
                 raise
 
         print(f"✅ {self.signature} processing completed")
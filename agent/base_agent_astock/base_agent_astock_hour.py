@@ -33,7 +33,10 @@ from agent.base_agent_astock.base_agent_astock import BaseAgentAStock
 from prompts.agent_prompt_astock import STOP_SIGNAL, get_agent_system_prompt_astock
 from tools.general_tools import (extract_conversation, extract_tool_messages,
                                  get_config_value, write_config_value)
-from tools.price_tools import add_no_trade_record
+from tools.history_compaction import compact_history, estimate_tokens
+from tools.price_tools import add_no_trade_record, get_trading_calendar
+from tools.session_log import get_log_writer
+from tools.session_metrics import SessionMetrics, metrics_path_for
 
 # Load environment variables
 load_dotenv()
@@ -149,32 +152,9 @@ class BaseAgentAStock_Hour(BaseAgentAStock):
         else:
             raise ValueError("Only support hour-level trading. Please use YYYY-MM-DD HH:MM:SS format.")
 
-        # Get merged_hourly.jsonl path (A-shares specific)
-        base_dir = Path(__file__).resolve().parents[2]
-        merged_file = base_dir / "data" / "A_stock" / "merged_hourly.jsonl"
-
-        if not merged_file.exists():
-            return []
-
-        # Collect all timestamps from merged_hourly.jsonl
-        all_timestamps = set()
-
-        with merged_file.open("r", encoding="utf-8") as f:
-            for line in f:
-                if not line.strip():
-                    continue
-                try:
-                    doc = json.loads(line)
-                    # Find all keys starting with "Time Series"
-                    for key, value in doc.items():
-                        if key.startswith("Time Series"):
-                            if isinstance(value, dict):
-                                all_timestamps.update(value.keys())
-                            break
-                except Exception:
-                    continue
-
-        if not all_timestamps:
+        # Trading calendar built from merged_hourly.jsonl (cached per process)
+        calendar = get_trading_calendar("cn", init_date)
+        if calendar is None or len(calendar) == 0:
             return []
         # Determine min_datetime based on init_date and last processed date in position file
         min_datetime = init_dt
@@ -219,34 +199,12 @@ class BaseAgentAStock_Hour(BaseAgentAStock):
             if not has_time:
                 last_processed_dt = last_processed_dt.date()
 
-        # Filter timestamps within the range
-        trading_times = []
-        if not has_time:
-            min_datetime = min_datetime.date()
-            end_dt = end_dt.date()
-
-        for ts_str in all_timestamps:
-            try:
-                if has_time:
-                    ts_dt = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-                else:
-                    ts_dt = datetime.strptime(ts_str, "%Y-%m-%d").date()
-                # Check if timestamp is in range with boundary rules
-                in_lower = False
-                if last_processed_dt is None:
-                    in_lower = ts_dt >= min_datetime
-                else:
-                    in_lower = ts_dt > min_datetime
-                if in_lower and ts_dt <= end_dt:
-                    trading_times.append(ts_str)
-
-            except Exception as e:
-                print(f"❌ Error processing timestamp: {ts_str}")
-                print(e)
-                continue
-
-        # Sort and remove duplicates
-        trading_times = sorted(list(set(trading_times)))
+        # Filter timestamps within the range: bisect the calendar, lower bound is exclusive
+        # once something has been processed
+        trading_times = calendar.range(
+            min_datetime.strftime("%Y-%m-%d %H:%M:%S"), end_dt.strftime("%Y-%m-%d %H:%M:%S"),
+            include_start=last_processed_dt is None,
+        )
         if REGISTER:
             # Only skip the very first timestamp if it exactly equals init_date to avoid double-processing
             if trading_times and trading_times[0] == init_date:
@@ -265,6 +223,7 @@ class BaseAgentAStock_Hour(BaseAgentAStock):
 
         # Set up logging
         log_file = self._setup_logging(today_date)
+        self._session_metrics = SessionMetrics(metrics_path_for(log_file), self.signature, self.basemodel, today_date)
         write_config_value("LOG_FILE", log_file)
 
         # Update system prompt - use A-shares specific prompt
@@ -279,7 +238,7 @@ class BaseAgentAStock_Hour(BaseAgentAStock):
         message = user_query.copy()
 
         # Log initial message
-        self._log_message(log_file, user_query)
+        await self._log_message(log_file, user_query)
 
         # Trading loop
         current_step = 0
@@ -288,17 +247,25 @@ class BaseAgentAStock_Hour(BaseAgentAStock):
             print(f"🔄 Step {current_step}/{self.max_steps}")
 
             try:
+                self._session_metrics.start_step(current_step)
+
+                # 只压缩发送给模型的副本，完整历史仍写入日志
+                request_messages = compact_history(message, self.history_compaction)
+                history_tokens = estimate_tokens(request_messages)
+                print(f"🧮 History: {len(request_messages)} messages, ~{history_tokens} tokens")
+
                 # Call agent
-                response = await self._ainvoke_with_retry(message)
+                response = await self._ainvoke_with_retry(request_messages)
 
                 # Extract agent response
                 agent_response = extract_conversation(response, "final")
+                await self._session_metrics.end_step(history_tokens)
 
                 # Check stop signal
                 if STOP_SIGNAL in agent_response:
                     print("✅ Received stop signal, trading session ended")
                     print(agent_response)
-                    self._log_message(log_file, [{"role": "assistant", "content": agent_response}])
+                    await self._log_message(log_file, [{"role": "assistant", "content": agent_response}])
                     break
 
                 # Extract tool messages with None check (enhanced error handling)
@@ -315,14 +282,20 @@ class BaseAgentAStock_Hour(BaseAgentAStock):
                 message.extend(new_messages)
 
                 # Log messages
-                self._log_message(log_file, new_messages[0])
-                self._log_message(log_file, new_messages[1])
+                await self._log_message(log_file, new_messages[0])
+                await self._log_message(log_file, new_messages[1])
 
             except Exception as e:
                 print(f"❌ Trading session error: {str(e)}")
                 print(f"Error details: {e}")
+                await self._session_metrics.end_session(status="error")
+                await get_log_writer().flush(fsync=True)
                 raise
 
+        # 会话结束时把日志和指标写完并落盘
+        await self._session_metrics.end_session()
+        await get_log_writer().flush(fsync=True)
+
         # Handle trading results
         await self._handle_trading_result(today_date)
 
@@ -0,0 +1,93 @@
+"""
+Combined MCP tool server: all toolsets in one process on one port.
+
+Instead of one process per toolset (start_mcp_services.py), this server imports every toolset of
+TOOL_SERVICES and serves it under its own path, so the toolsets share one price store, trading
+calendar and position snapshot cache:
+
+    http://localhost:$MCP_HTTP_PORT/<service>/mcp    one toolset (math, search, trade, price, crypto)
+    http://localhost:$MCP_HTTP_PORT/mcp              all toolsets mounted on one FastMCP server
+    http://localhost:$MCP_HTTP_PORT/health           status and tools of every toolset
+
+Agents use the per-toolset paths with MCP_TRANSPORT=combined, so each agent still only sees the
+tools of its own market.
+
+Usage:
+    python agent_tools/mcp_server.py
+    python agent_tools/start_mcp_services.py --combined
+"""
+
+import importlib
+import os
+import sys
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from dotenv import load_dotenv
+from fastmcp import FastMCP
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+# Add project root directory to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from tools.inproc_tools import TOOL_SERVICES
+from tools.trading_context import TradingContextMiddleware
+
+load_dotenv()
+
+
+def load_toolsets():
+    """Import the FastMCP server of every tool service: {service: FastMCP}"""
+    return {service: importlib.import_module(module).mcp for service, module in TOOL_SERVICES.items()}
+
+
+def create_app(toolsets=None) -> Starlette:
+    """
+    Build the ASGI app serving every toolset under /<service>/mcp, all of them under /mcp,
+    and a /health endpoint.
+    """
+    toolsets = toolsets or load_toolsets()
+
+    combined = FastMCP("AI-Trader Tools")
+    # 合并端点上的每次工具调用也使用请求头中的交易上下文
+    combined.add_middleware(TradingContextMiddleware())
+    for server in toolsets.values():
+        combined.mount(server)
+
+    apps = {service: server.http_app(path="/mcp") for service, server in toolsets.items()}
+    combined_app = combined.http_app(path="/mcp")
+
+    async def health(request: Request) -> JSONResponse:
+        status = {}
+        for service, server in toolsets.items():
+            try:
+                status[service] = {"status": "ok", "tools": sorted((await server.get_tools()).keys())}
+            except Exception as e:
+                status[service] = {"status": "error", "error": str(e)}
+        healthy = all(s["status"] == "ok" for s in status.values())
+        return JSONResponse({"status": "ok" if healthy else "degraded", "toolsets": status}, status_code=200 if healthy else 503)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # 每个 FastMCP 子应用都要运行自己的 session manager
+        async with AsyncExitStack() as stack:
+            for sub_app in [*apps.values(), combined_app]:
+                await stack.enter_async_context(sub_app.lifespan(sub_app))
+            yield
+
+    routes = [Route("/health", health, methods=["GET"])]
+    routes += [Mount(f"/{service}", app=sub_app) for service, sub_app in apps.items()]
+    routes.append(Mount("/", app=combined_app))
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.getenv("MCP_HTTP_PORT", "8010"))
+    print(f"Running combined MCP server on port {port}: {', '.join(TOOL_SERVICES)}")
+    uvicorn.run(create_app(), host="0.0.0.0", port=port)
@@ -1,15 +1,29 @@
 #!/usr/bin/env python3
 """
 MCP Service Startup Script (Python Version)
-Start all four MCP services: Math, Search, TradeTools, LocalPrices
+Start all MCP services: Math, Search, TradeTools, LocalPrices, CryptoTradeTools
+
+A service counts as ready once an MCP list_tools round trip succeeds. While running, dead services
+are restarted with exponential backoff and a latency report of every service is appended to
+logs/mcp_health.jsonl.
+
+Usage:
+    python start_mcp_services.py              # one process and port per service
+    python start_mcp_services.py --combined   # all toolsets in one process on MCP_HTTP_PORT (mcp_server.py)
+    python start_mcp_services.py status [--combined]
+    python start_mcp_services.py --wait-ready [--combined] [--timeout 120]   # block until the services are ready
 """
 
+import argparse
+import asyncio
+import json
 import os
 import signal
 import subprocess
 import sys
 import threading
 import time
+from datetime import datetime
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -17,10 +31,32 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+async def _list_tools(url, timeout):
+    """One MCP session: initialize + list_tools"""
+    from fastmcp import Client
+
+    async with Client(url, timeout=timeout, init_timeout=timeout) as client:
+        return await client.list_tools()
+
+
 class MCPServiceManager:
-    def __init__(self):
+    def __init__(
+        self,
+        combined=False,
+        restart_base_delay=2.0,
+        restart_max_delay=60.0,
+        max_restarts=10,
+        report_interval=60.0,
+    ):
         self.services = {}
         self.running = True
+        self.combined = combined
+
+        # Supervisor settings: 服务退出后按指数退避重启，定期记录各服务的 list_tools 延迟
+        self.restart_base_delay = restart_base_delay
+        self.restart_max_delay = restart_max_delay
+        self.max_restarts = max_restarts
+        self.report_interval = report_interval
 
         # Set default ports
         self.ports = {
@@ -29,6 +65,7 @@ class MCPServiceManager:
             "trade": int(os.getenv("TRADE_HTTP_PORT", "8002")),
             "price": int(os.getenv("GETPRICE_HTTP_PORT", "8003")),
             "crypto": int(os.getenv("CRYPTO_HTTP_PORT", "8005")),
+            "combined": int(os.getenv("MCP_HTTP_PORT", "8010")),
         }
 
         # Service configurations
@@ -41,10 +78,20 @@ class MCPServiceManager:
             "price": {"script": os.path.join(mcp_server_dir, "tool_get_price_local.py"), "name": "LocalPrices", "port": self.ports["price"]},
             "crypto": {"script": os.path.join(mcp_server_dir, "tool_crypto_trade.py"), "name": "CryptoTradeTools", "port": self.ports["crypto"]},
         }
-
-        # Create logs directory
-        self.log_dir = Path("../logs")
+        if combined:
+            # 所有工具集在同一进程、同一端口，共享价格数据和持仓缓存；健康检查走聚合端点 /mcp
+            self.service_configs = {
+                "combined": {
+                    "script": os.path.join(mcp_server_dir, "mcp_server.py"),
+                    "name": "CombinedTools",
+                    "port": self.ports["combined"],
+                },
+            }
+
+        # Create logs directory (project_root/logs, independent of the working directory)
+        self.log_dir = Path(mcp_server_dir).parent / "logs"
         self.log_dir.mkdir(exist_ok=True)
+        self.health_report_file = self.log_dir / "mcp_health.jsonl"
 
         # Set signal handlers
         signal.signal(signal.SIGINT, self.signal_handler)
@@ -105,7 +152,7 @@ class MCPServiceManager:
                 return False
         return True
 
-    def start_service(self, service_id, config):
+    def start_service(self, service_id, config, log_mode="w"):
         """Start a single service"""
         script_path = config["script"]
         service_name = config["name"]
@@ -118,12 +165,26 @@ class MCPServiceManager:
         try:
             # Start service process
             log_file = self.log_dir / f"{service_id}.log"
-            with open(log_file, "w") as f:
+            with open(log_file, log_mode) as f:
                 process = subprocess.Popen(
                     [sys.executable, script_path], stdout=f, stderr=subprocess.STDOUT, cwd=os.getcwd()
                 )
 
-            self.services[service_id] = {"process": process, "name": service_name, "port": port, "log_file": log_file}
+            previous = self.services.get(service_id, {})
+            self.services[service_id] = {
+                "process": process,
+                "name": service_name,
+                "port": port,
+                "log_file": log_file,
+                # 连续重启次数（重启后通过就绪探测即清零），达到 max_restarts 后放弃
+                "restarts": previous.get("restarts", 0),
+                "total_restarts": previous.get("total_restarts", 0),
+                # 连续失败次数，决定下次重启前的退避时间；服务恢复健康后清零
+                "failures": previous.get("failures", 0),
+                "next_restart": None,
+                # 重启后尚未通过就绪探测
+                "awaiting_probe": previous.get("restarts", 0) > 0,
+            }
 
             print(f"✅ {service_name} service started (PID: {process.pid}, Port: {port})")
             return True
@@ -132,30 +193,60 @@ class MCPServiceManager:
             print(f"❌ Failed to start {service_name} service: {e}")
             return False
 
+    def probe_service(self, service_id, timeout=5.0):
+        """
+        Readiness probe: an MCP list_tools round trip against the service.
+
+        Returns:
+            {"ok": bool, "latency_ms": float or None, "tools": int, "error": str or None}
+        """
+        url = f"http://localhost:{self.service_configs[service_id]['port']}/mcp"
+        start = time.perf_counter()
+        try:
+            tools = asyncio.run(asyncio.wait_for(_list_tools(url, timeout), timeout))
+        except BaseException as e:
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            return {"ok": False, "latency_ms": None, "tools": 0, "error": str(e) or type(e).__name__}
+        latency_ms = round((time.perf_counter() - start) * 1000, 2)
+        return {"ok": True, "latency_ms": latency_ms, "tools": len(tools), "error": None}
+
     def check_service_health(self, service_id):
-        """Check service health status"""
+        """Check service health status (process alive and answering list_tools)"""
         if service_id not in self.services:
             return False
 
-        service = self.services[service_id]
-        process = service["process"]
-        port = service["port"]
-
         # Check if process is still running
-        if process.poll() is not None:
+        if self.services[service_id]["process"].poll() is not None:
             return False
 
-        # Check if port is responding (simple check)
-        try:
-            import socket
-
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(1)
-            result = sock.connect_ex(("localhost", port))
-            sock.close()
-            return result == 0
-        except Exception:
-            return False
+        return self.probe_service(service_id)["ok"]
+
+    def wait_until_ready(self, service_ids=None, timeout=60.0, interval=1.0):
+        """
+        Block until every service passes the readiness probe or ``timeout`` expires.
+
+        Returns:
+            {service_id: last probe result}
+        """
+        pending = list(service_ids if service_ids is not None else self.service_configs)
+        results = {}
+        deadline = time.monotonic() + timeout
+        while pending:
+            for service_id in list(pending):
+                service = self.services.get(service_id)
+                if service is not None and service["process"].poll() is not None:
+                    # 由本进程启动的服务已退出，不再等待
+                    results[service_id] = {"ok": False, "latency_ms": None, "tools": 0, "error": "process exited"}
+                    pending.remove(service_id)
+                    continue
+                results[service_id] = self.probe_service(service_id)
+                if results[service_id]["ok"]:
+                    pending.remove(service_id)
+            if not pending or time.monotonic() >= deadline:
+                break
+            time.sleep(interval)
+        return results
 
     def start_all_services(self):
         """Start all services"""
@@ -183,13 +274,13 @@ class MCPServiceManager:
             print("\n❌ No services started successfully")
             return
 
-        # Wait for services to start
-        print("\n⏳ Waiting for services to start...")
-        time.sleep(3)
+        # Wait for services to become ready (MCP list_tools round trip)
+        print("\n⏳ Waiting for services to become ready...")
+        results = self.wait_until_ready(self.services.keys())
 
         # Check service status
         print("\n🔍 Checking service status...")
-        healthy_count = self.check_all_services()
+        healthy_count = self.check_all_services(results)
 
         if healthy_count > 0:
             print(f"\n🎉 {healthy_count}/{len(self.services)} MCP services running!")
@@ -200,12 +291,16 @@ class MCPServiceManager:
             print("\n❌ All services failed to start properly")
             self.stop_all_services()
 
-    def check_all_services(self):
+    def check_all_services(self, results=None):
         """Check all service status and return count of healthy services"""
         healthy_count = 0
         for service_id, service in self.services.items():
-            if self.check_service_health(service_id):
-                print(f"✅ {service['name']} service running normally")
+            result = (results or {}).get(service_id)
+            if result is None:
+                result = {"ok": self.check_service_health(service_id)}
+            if result["ok"]:
+                latency = f", list_tools {result['latency_ms']} ms" if result.get("latency_ms") is not None else ""
+                print(f"✅ {service['name']} service running normally{latency}")
                 healthy_count += 1
             else:
                 print(f"❌ {service['name']} service failed to start")
@@ -217,37 +312,109 @@ class MCPServiceManager:
         print("\n📋 Service information:")
         for service_id, service in self.services.items():
             print(f"  - {service['name']}: http://localhost:{service['port']} (PID: {service['process'].pid})")
+        if self.combined:
+            port = self.ports["combined"]
+            print(f"    Toolsets: http://localhost:{port}/<math|search|trade|price|crypto>/mcp, all: http://localhost:{port}/mcp")
+            print("    Agents: set MCP_TRANSPORT=combined")
 
         print(f"\n📁 Log files location: {self.log_dir.absolute()}")
         print("\n🛑 Press Ctrl+C to stop all services")
 
     def keep_alive(self):
-        """Keep services running"""
+        """Keep services running: restart dead services with backoff and report latencies"""
+        next_report = time.monotonic() + self.report_interval
         try:
             while self.running:
                 time.sleep(5)
+                now = time.monotonic()
 
                 # Check service status
-                stopped_services = []
+                given_up = []
                 for service_id, service in self.services.items():
-                    if service["process"].poll() is not None:
-                        stopped_services.append(service["name"])
-
-                if stopped_services:
-                    print(f"\n⚠️  Following service(s) stopped unexpectedly: {', '.join(stopped_services)}")
-                    print(f"📋 Active services: {len(self.services) - len(stopped_services)}/{len(self.services)}")
-
-                    # Only stop all if all services have failed
-                    if len(stopped_services) == len(self.services):
-                        print("❌ All services have stopped, shutting down...")
-                        self.running = False
-                        break
+                    if service["process"].poll() is None:
+                        if service["awaiting_probe"] and self.probe_service(service_id)["ok"]:
+                            self._mark_recovered(service)
+                        continue
+                    if service["restarts"] >= self.max_restarts:
+                        given_up.append(service["name"])
+                        continue
+                    if service["next_restart"] is None:
+                        delay = min(self.restart_base_delay * 2 ** service["failures"], self.restart_max_delay)
+                        service["next_restart"] = now + delay
+                        print(
+                            f"\n⚠️  {service['name']} service stopped unexpectedly "
+                            f"(exit code {service['process'].returncode}), restarting in {delay:.0f}s"
+                        )
+                    elif now >= service["next_restart"]:
+                        self.restart_service(service_id)
+
+                # Only stop all if all services have failed for good
+                if given_up and len(given_up) == len(self.services):
+                    print(f"❌ All services have stopped after {self.max_restarts} consecutive restarts, shutting down...")
+                    self.running = False
+                    break
+
+                if now >= next_report:
+                    self.write_latency_report()
+                    next_report = now + self.report_interval
 
         except KeyboardInterrupt:
             pass
         finally:
             self.stop_all_services()
 
+    def restart_service(self, service_id):
+        """Restart a dead service (keeps appending to its log file)"""
+        service = self.services[service_id]
+        service["restarts"] += 1
+        service["total_restarts"] += 1
+        service["failures"] += 1
+        print(f"🔄 Restarting {service['name']} service ({service['restarts']}/{self.max_restarts})...")
+        if not self.start_service(service_id, self.service_configs[service_id], log_mode="a"):
+            # 启动失败时按退避时间再试
+            service["next_restart"] = None
+
+    def _mark_recovered(self, service):
+        """A restarted service passed its readiness probe: reset the consecutive restart counters"""
+        print(f"✅ {service['name']} service recovered after {service['restarts']} restart(s)")
+        service["restarts"] = 0
+        service["failures"] = 0
+        service["awaiting_probe"] = False
+
+    def write_latency_report(self):
+        """Probe every running service and append one line per service to logs/mcp_health.jsonl"""
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        lines = []
+        for service_id, service in self.services.items():
+            alive = service["process"].poll() is None
+            result = self.probe_service(service_id) if alive else {
+                "ok": False, "latency_ms": None, "tools": 0, "error": "process exited"
+            }
+            if result["ok"]:
+                if service["awaiting_probe"]:
+                    self._mark_recovered(service)
+                service["failures"] = 0
+            else:
+                print(f"⚠️  {service['name']} health check failed: {result['error']}")
+            lines.append(
+                json.dumps(
+                    {
+                        "time": timestamp,
+                        "service": service_id,
+                        "port": service["port"],
+                        "pid": service["process"].pid,
+                        "restarts": service["total_restarts"],
+                        **result,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+        try:
+            with open(self.health_report_file, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"⚠️  Could not write health report {self.health_report_file}: {e}")
+
     def stop_all_services(self):
         """Stop all services"""
         print("\n🛑 Stopping all services...")
@@ -271,25 +438,64 @@ class MCPServiceManager:
         print("=" * 30)
 
         for service_id, config in self.service_configs.items():
-            if service_id in self.services:
-                service = self.services[service_id]
-                if self.check_service_health(service_id):
-                    print(f"✅ {config['name']} service running normally (Port: {config['port']})")
-                else:
-                    print(f"❌ {config['name']} service abnormal (Port: {config['port']})")
+            result = self.probe_service(service_id)
+            if result["ok"]:
+                print(
+                    f"✅ {config['name']} service running normally "
+                    f"(Port: {config['port']}, {result['tools']} tools, list_tools {result['latency_ms']} ms)"
+                )
+            else:
+                print(f"❌ {config['name']} service not ready (Port: {config['port']}): {result['error']}")
+
+    def wait_ready(self, timeout):
+        """--wait-ready: wait for services started elsewhere; returns True if all are ready"""
+        print(f"⏳ Waiting up to {timeout:.0f}s for MCP services to become ready...")
+        results = self.wait_until_ready(timeout=timeout)
+        for service_id, result in results.items():
+            name = self.service_configs[service_id]["name"]
+            if result["ok"]:
+                print(f"✅ {name} ready ({result['tools']} tools, list_tools {result['latency_ms']} ms)")
             else:
-                print(f"❌ {config['name']} service not started (Port: {config['port']})")
+                print(f"❌ {name} not ready: {result['error']}")
+        return all(result["ok"] for result in results.values())
 
 
 def main():
     """Main function"""
-    if len(sys.argv) > 1 and sys.argv[1] == "status":
+    parser = argparse.ArgumentParser(description="Start and supervise the MCP tool services")
+    parser.add_argument("command", nargs="?", default="start", choices=["start", "status"])
+    parser.add_argument("--combined", action="store_true", help="Run all toolsets in one process (mcp_server.py)")
+    parser.add_argument(
+        "--wait-ready",
+        action="store_true",
+        help="Do not start anything; block until the services of MCP_TRANSPORT answer list_tools (exit code 1 on timeout)",
+    )
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait with --wait-ready")
+    parser.add_argument("--max-restarts", type=int, default=10, help="Consecutive restarts of a service without recovering before giving up")
+    parser.add_argument(
+        "--report-interval", type=float, default=60.0, help="Seconds between latency reports in logs/mcp_health.jsonl"
+    )
+    args = parser.parse_args()
+
+    combined = args.combined
+    if args.wait_ready:
+        # 按 agent 使用的传输方式等待：inproc 没有服务可等，combined 只探测合并服务
+        transport = os.getenv("MCP_TRANSPORT", "streamable_http")
+        if transport == "inproc":
+            print("ℹ️  MCP_TRANSPORT=inproc: tools run inside the agent process, nothing to wait for")
+            sys.exit(0)
+        combined = combined or transport == "combined"
+
+    manager = MCPServiceManager(
+        combined=combined, max_restarts=args.max_restarts, report_interval=args.report_interval
+    )
+    if args.wait_ready:
+        sys.exit(0 if manager.wait_ready(args.timeout) else 1)
+    elif args.command == "status":
         # Status check mode
-        manager = MCPServiceManager()
         manager.status()
     else:
         # Startup mode
-        manager = MCPServiceManager()
         manager.start_all_services()
 
 
@@ -1,6 +1,6 @@
 import logging
 import os
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 from dotenv import load_dotenv
@@ -13,6 +13,8 @@ from datetime import datetime, timedelta
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from tools.general_tools import get_config_value
+from tools.news_cache import get_news_cache
+from tools.news_corpus import get_news_corpus
 
 logger = logging.getLogger(__name__)
 
@@ -85,14 +87,46 @@ def parse_date_to_standard(date_str: str) -> str:
     return date_str
 
 
+def get_news_window() -> Tuple[Optional[str], Optional[str]]:
+    """
+    News window of the current session: the 30 days before TODAY_DATE.
+
+    Returns:
+        (time_from, time_to) in Alpha Vantage format (YYYYMMDDTHHMM), or (None, None) when
+        TODAY_DATE is not set or cannot be parsed
+    """
+    # Get today's date for filtering
+    today_date = get_config_value("TODAY_DATE")
+    time_from = None
+    time_to = None
+    
+    if today_date:
+        # Convert TODAY_DATE to Alpha Vantage API format (YYYYMMDDTHHMM)
+        # TODAY_DATE format is "YYYY-MM-DD HH:MM:SS" or "YYYY-MM-DD"
+        try:
+            if " " in today_date:
+                today_datetime = datetime.strptime(today_date, "%Y-%m-%d %H:%M:%S")
+            else:
+                today_datetime = datetime.strptime(today_date, "%Y-%m-%d")
+            # Convert to Alpha Vantage format: YYYYMMDDTHHMM
+            time_to = today_datetime.strftime("%Y%m%dT%H%M")
+            # Set time_from to 30 days before time_to (API may require both parameters)
+            time_from_datetime = today_datetime - timedelta(days=30)
+            time_from = time_from_datetime.strftime("%Y%m%dT%H%M")
+            print(f"Filtering articles published before: {today_date} (API format: time_from={time_from}, time_to={time_to})")
+        except Exception as e:
+            logger.error(f"Failed to parse TODAY_DATE: {e}")
+            print("⚠️ Failed to parse TODAY_DATE, returning all results without date filtering")
+    else:
+        print("⚠️ TODAY_DATE not set, returning all results without date filtering")
+    return time_from, time_to
+
+
 class AlphaVantageNewsTool:
     def __init__(self):
         self.api_key = os.environ.get("ALPHAADVANTAGE_API_KEY")
-        if not self.api_key:
-            raise ValueError(
-                "Alpha Vantage API key not provided! Please set ALPHAADVANTAGE_API_KEY environment variable."
-            )
         self.base_url = "https://www.alphavantage.co/query"
+        self.cache = get_news_cache()
 
     def _fetch_news(
         self,
@@ -131,6 +165,19 @@ class AlphaVantageNewsTool:
         if time_to:
             params["time_to"] = time_to
 
+        # 同一窗口的请求（例如多个模型在同一模拟日期）直接读取本地缓存
+        if self.cache is not None:
+            cached_feed = self.cache.get(params)
+            if cached_feed is not None:
+                print(f"🗄️  News cache hit ({len(cached_feed)} articles)")
+                return cached_feed
+
+        # 缓存命中时不需要 API key，只有真正请求 API 时才检查
+        if not self.api_key:
+            raise ValueError(
+                "Alpha Vantage API key not provided! Please set ALPHAADVANTAGE_API_KEY environment variable."
+            )
+
         try:
             response = requests.get(self.base_url, params=params, timeout=30)
             response.raise_for_status()
@@ -144,13 +191,15 @@ class AlphaVantageNewsTool:
                 raise Exception(f"Alpha Vantage API note: {json_data['Note']}")
 
             # Extract feed data
-            feed = json_data.get("feed", [])
-            
+            feed = json_data.get("feed", [])[: params["limit"]]
+            if self.cache is not None:
+                self.cache.put(params, feed)
+
             if not feed:
                 print(f"⚠️ Alpha Vantage API returned empty feed")
                 return []
 
-            return feed[:params["limit"]]
+            return feed
 
         except requests.exceptions.RequestException as e:
             logger.error(f"Alpha Vantage API request failed: {e}")
@@ -178,30 +227,7 @@ class AlphaVantageNewsTool:
         """
         print(f"Searching Alpha Vantage news: query={query}, tickers={tickers}, topics={topics}")
 
-        # Get today's date for filtering
-        today_date = get_config_value("TODAY_DATE")
-        time_from = None
-        time_to = None
-        
-        if today_date:
-            # Convert TODAY_DATE to Alpha Vantage API format (YYYYMMDDTHHMM)
-            # TODAY_DATE format is "YYYY-MM-DD HH:MM:SS" or "YYYY-MM-DD"
-            try:
-                if " " in today_date:
-                    today_datetime = datetime.strptime(today_date, "%Y-%m-%d %H:%M:%S")
-                else:
-                    today_datetime = datetime.strptime(today_date, "%Y-%m-%d")
-                # Convert to Alpha Vantage format: YYYYMMDDTHHMM
-                time_to = today_datetime.strftime("%Y%m%dT%H%M")
-                # Set time_from to 30 days before time_to (API may require both parameters)
-                time_from_datetime = today_datetime - timedelta(days=30)
-                time_from = time_from_datetime.strftime("%Y%m%dT%H%M")
-                print(f"Filtering articles published before: {today_date} (API format: time_from={time_from}, time_to={time_to})")
-            except Exception as e:
-                logger.error(f"Failed to parse TODAY_DATE: {e}")
-                print("⚠️ Failed to parse TODAY_DATE, returning all results without date filtering")
-        else:
-            print("⚠️ TODAY_DATE not set, returning all results without date filtering")
+        time_from, time_to = get_news_window()
 
         # Fetch articles with date filtering via API
         all_articles = self._fetch_news(
@@ -216,6 +242,46 @@ class AlphaVantageNewsTool:
         return all_articles
 
 
+class LocalNewsTool:
+    """Answers news searches from the offline corpus built with tools/news_corpus.py (NEWS_BACKEND=local)."""
+
+    def __init__(self):
+        self.corpus = get_news_corpus()
+
+    def __call__(
+        self,
+        query: str,
+        tickers: Optional[str] = None,
+        topics: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Search the local corpus for articles published strictly before TODAY_DATE
+
+        Args:
+            query: Search query (full-text matched when neither tickers nor topics are given)
+            tickers: Stock/crypto/forex symbols to filter by
+            topics: News topics to filter by
+
+        Returns:
+            List of news articles in Alpha Vantage feed format
+        """
+        print(f"Searching local news corpus: query={query}, tickers={tickers}, topics={topics}")
+        time_from, time_to = get_news_window()
+        articles = self.corpus.search(
+            query=query, tickers=tickers, topics=topics, time_from=time_from, time_to=time_to, limit=20
+        )
+        print(f"Found {len(articles)} articles in local corpus")
+        return articles
+
+
+def get_news_tool():
+    """News backend selected by NEWS_BACKEND: "alphavantage" (default) or "local"."""
+    backend = os.getenv("NEWS_BACKEND", "alphavantage").strip().lower()
+    if backend == "local":
+        return LocalNewsTool()
+    return AlphaVantageNewsTool()
+
+
 mcp = FastMCP("Search")
 
 
@@ -247,7 +313,7 @@ def get_market_news(
         - Summary: Article summary
     """
     try:
-        tool = AlphaVantageNewsTool()
+        tool = get_news_tool()
         results = tool(query=query, tickers=tickers, topics=topics)
 
         # Check if results are empty
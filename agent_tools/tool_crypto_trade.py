@@ -17,8 +17,12 @@ from tools.price_tools import (get_latest_position, get_open_prices,
                                get_yesterday_date,
                                get_yesterday_open_and_close_price,
                                get_yesterday_profit)
+from tools.position_snapshot import refresh_position_snapshot
+from tools.trading_context import TradingContextMiddleware
 
 mcp = FastMCP("CryptoTradeTools")
+# 每次工具调用的 SIGNATURE / TODAY_DATE / LOG_PATH 优先取自请求头
+mcp.add_middleware(TradingContextMiddleware())
 
 def _position_lock(signature: str):
     """Context manager for file-based lock to serialize position updates per signature."""
@@ -175,6 +179,8 @@ def buy_crypto(symbol: str, amount: float) -> Dict[str, Any]:
                     )
                     + "\n"
                 )
+            # 同步更新 position/latest.json 快照
+            refresh_position_snapshot(Path(position_file_path))
             # Step 7: Return updated position
             write_config_value("IF_TRADE", True)
             print("IF_TRADE", get_config_value("IF_TRADE"))
@@ -319,6 +325,8 @@ def sell_crypto(symbol: str, amount: float) -> Dict[str, Any]:
                 )
                 + "\n"
             )
+        # 同步更新 position/latest.json 快照
+        refresh_position_snapshot(Path(position_file_path))
 
         # Step 7: Return updated position
         write_config_value("IF_TRADE", True)
@@ -3,8 +3,9 @@ import os
 import sys
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
+import numpy as np
 from dotenv import load_dotenv
 from fastmcp import FastMCP
 
@@ -21,6 +22,12 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from tools.general_tools import get_config_value
+from tools.jsonl_index import load_symbol_document
+from tools.price_store import PriceStore, _to_datetime64, get_price_store
+from tools.trading_context import TradingContextMiddleware
+
+# 每次工具调用的 SIGNATURE / TODAY_DATE 优先取自请求头
+mcp.add_middleware(TradingContextMiddleware())
 
 
 def _workspace_data_path(filename: str, symbol: Optional[str] = None) -> Path:
@@ -100,6 +107,59 @@ def get_price_local(symbol: str, date: str) -> Dict[str, Any]:
 
 
 
+def _lookup_ohlcv(symbol: str, date: str, data_path: Path, series_key: str, today_date: Optional[str]) -> Dict[str, Any]:
+    """Look up one symbol's bar in a merged file, masking everything but the open price on ``today_date``.
+
+    Args:
+        symbol: Stock symbol
+        date: Already validated date/timestamp string
+        data_path: Merged JSONL file to read
+        series_key: "Time Series (Daily)" or "Time Series (60min)"
+        today_date: Current simulation date (TODAY_DATE)
+
+    Returns:
+        Dictionary containing symbol, date and ohlcv data, or an error entry.
+    """
+    # 通过旁路索引直接定位该代码所在行，只解析这一行
+    doc = load_symbol_document(data_path, symbol)
+    if doc is None:
+        return {"error": f"No records found for stock {symbol} in local data", "symbol": symbol, "date": date}
+
+    series = doc.get(series_key, {})
+    day = series.get(date)
+    if day is None:
+        sample_dates = sorted(series.keys(), reverse=True)[:5]
+        return {
+            "error": f"Data not found for date {date}. Please verify the date exists in data. Sample available dates: {sample_dates}",
+            "symbol": symbol,
+            "date": date,
+        }
+    if date == today_date:
+        return {
+            "symbol": symbol,
+            "date": date,
+            "ohlcv": {
+                "open": day.get("1. buy price"),
+                "high": "You can not get the current high price",
+                "low": "You can not get the current low price", 
+                "close": "You can not get the next close price",
+                "volume": "You can not get the current volume",
+            },
+        }
+    else:
+        return {
+            "symbol": symbol,
+            "date": date,
+            "ohlcv": {
+                "open": day.get("1. buy price"),
+                "high": day.get("2. high"),
+                "low": day.get("3. low"), 
+                "close": day.get("4. sell price"),
+                "volume": day.get("5. volume"),
+            },
+        }
+
+
 def get_price_local_daily(symbol: str, date: str) -> Dict[str, Any]:
     """Read OHLCV data for specified stock and date. Get historical information for specified stock.
 
@@ -120,50 +180,7 @@ def get_price_local_daily(symbol: str, date: str) -> Dict[str, Any]:
     if not data_path.exists():
         return {"error": f"Data file not found: {data_path}", "symbol": symbol, "date": date}
 
-    with data_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            doc = json.loads(line)
-            meta = doc.get("Meta Data", {})
-            if meta.get("2. Symbol") != symbol:
-                continue
-            series = doc.get("Time Series (Daily)", {})
-            day = series.get(date)
-            if day is None:
-                sample_dates = sorted(series.keys(), reverse=True)[:5]
-                return {
-                    "error": f"Data not found for date {date}. Please verify the date exists in data. Sample available dates: {sample_dates}",
-                    "symbol": symbol,
-                    "date": date,
-                }
-            if date == get_config_value("TODAY_DATE"):
-                return {
-                    "symbol": symbol,
-                    "date": date,
-                    "ohlcv": {
-                        "open": day.get("1. buy price"),
-                        "high": "You can not get the current high price",
-                        "low": "You can not get the current low price", 
-                        "close": "You can not get the next close price",
-                        "volume": "You can not get the current volume",
-                    },
-                }
-            else:
-                return {
-                    "symbol": symbol,
-                    "date": date,
-                    "ohlcv": {
-                        "open": day.get("1. buy price"),
-                        "high": day.get("2. high"),
-                        "low": day.get("3. low"), 
-                        "close": day.get("4. sell price"),
-                        "volume": day.get("5. volume"),
-                    },
-                }
-
-
-    return {"error": f"No records found for stock {symbol} in local data", "symbol": symbol, "date": date}
+    return _lookup_ohlcv(symbol, date, data_path, "Time Series (Daily)", get_config_value("TODAY_DATE"))
 
 
 def get_price_local_hourly(symbol: str, date: str) -> Dict[str, Any]:
@@ -186,49 +203,134 @@ def get_price_local_hourly(symbol: str, date: str) -> Dict[str, Any]:
     if not data_path.exists():
         return {"error": f"Data file not found: {data_path}", "symbol": symbol, "date": date}
 
-    with data_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            doc = json.loads(line)
-            meta = doc.get("Meta Data", {})
-            if meta.get("2. Symbol") != symbol:
-                continue
-            series = doc.get("Time Series (60min)", {})
-            day = series.get(date)
-            if day is None:
-                sample_dates = sorted(series.keys(), reverse=True)[:5]
-                return {
-                    "error": f"Data not found for date {date}. Please verify the date exists in data. Sample available dates: {sample_dates}",
-                    "symbol": symbol,
-                    "date": date
-                }
-            if date == get_config_value("TODAY_DATE"):
-                return {
-                    "symbol": symbol,
-                    "date": date,
-                    "ohlcv": {
-                        "open": day.get("1. buy price"),
-                        "high": "You can not get the current high price",
-                        "low": "You can not get the current low price", 
-                        "close": "You can not get the next close price",
-                        "volume": "You can not get the current volume",
-                    },
-                }
-            else:
-                return {
-                    "symbol": symbol,
-                    "date": date,
-                    "ohlcv": {
-                        "open": day.get("1. buy price"),
-                        "high": day.get("2. high"),
-                        "low": day.get("3. low"), 
-                        "close": day.get("4. sell price"),
-                        "volume": day.get("5. volume"),
-                    },
-                }
-
-    return {"error": f"No records found for stock {symbol} in local data", "symbol": symbol, "date": date}
+    return _lookup_ohlcv(symbol, date, data_path, "Time Series (60min)", get_config_value("TODAY_DATE"))
+
+
+@mcp.tool()
+def get_prices_batch(symbols: List[str], date: str) -> Dict[str, Any]:
+    """Read OHLCV data for multiple stocks at the same date in one call.
+
+    Prefer this over calling get_price_local repeatedly when you need prices for several stocks.
+    Same rules as get_price_local: for the current date only the open price is available.
+
+    Args:
+        symbols: List of stock symbols, e.g. ['AAPL', 'MSFT', 'NVDA'].
+        date: Date in 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' format. Based on your current time format.
+
+    Returns:
+        Dictionary with the date and a "prices" mapping of symbol -> same result as get_price_local.
+    """
+    hourly = ' ' in date or 'T' in date
+    try:
+        if hourly:
+            _validate_date_hourly(date)
+        else:
+            _validate_date_daily(date)
+    except ValueError as e:
+        return {"error": str(e), "symbols": symbols, "date": date}
+
+    # TODAY_DATE 只读取一次，所有代码共用
+    today_date = get_config_value("TODAY_DATE")
+    series_key = "Time Series (60min)" if hourly else "Time Series (Daily)"
+
+    prices: Dict[str, Any] = {}
+    for symbol in dict.fromkeys(symbols):
+        data_path = _workspace_data_path("merged.jsonl", None if hourly else symbol)
+        if not data_path.exists():
+            prices[symbol] = {"error": f"Data file not found: {data_path}", "symbol": symbol, "date": date}
+            continue
+        prices[symbol] = _lookup_ohlcv(symbol, date, data_path, series_key, today_date)
+
+    return {"date": date, "prices": prices}
+
+
+def _datetime64_to_str(value: np.datetime64) -> str:
+    """datetime64 -> 'YYYY-MM-DD HH:MM:SS'"""
+    return str(value.astype("datetime64[s]")).replace("T", " ")
+
+
+def _current_bar_time(store: PriceStore, today_date: str) -> np.datetime64:
+    """
+    Time of the current bar at TODAY_DATE, compared at the store's granularity.
+
+    Daily data: the bar of TODAY_DATE's day. Intraday data: TODAY_DATE itself, or for a date-only
+    TODAY_DATE the first (opening) bar of that day.
+    """
+    today = _to_datetime64(today_date)
+    day = today.astype("datetime64[D]").astype("datetime64[s]")
+    if store.is_daily:
+        return day
+    if " " in today_date or "T" in today_date:
+        return today
+    i = int(np.searchsorted(store.times, day, side="left"))
+    if i < len(store.times) and store.times[i] < day + np.timedelta64(1, "D"):
+        return store.times[i]
+    return today
+
+
+@mcp.tool()
+def get_price_history(symbol: str, start: str, end: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Read a window of OHLCV history for one stock in a single call (columnar format).
+
+    Use this instead of calling get_price_local once per day when you need a trend.
+    Data after the current date is never returned; for the current date only the open price is available.
+
+    Args:
+        symbol: Stock symbol, e.g. 'IBM' or '600243.SHH'.
+        start: Window start (inclusive), 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' format. Based on your current time format.
+        end: Window end (inclusive), same format as start. A date includes all bars of that day.
+        fields: Subset of ['open', 'high', 'low', 'close', 'volume']. Defaults to all of them.
+
+    Returns:
+        Dictionary with symbol, the list of "dates" and one list per requested field aligned with "dates".
+    """
+    hourly = ' ' in start or 'T' in start
+    try:
+        if hourly:
+            _validate_date_hourly(start)
+            _validate_date_hourly(end)
+        else:
+            _validate_date_daily(start)
+            _validate_date_daily(end)
+    except ValueError as e:
+        return {"error": str(e), "symbol": symbol, "start": start, "end": end}
+
+    fields = list(fields) if fields else list(PriceStore.FIELDS)
+    unknown = [f for f in fields if f not in PriceStore.FIELDS]
+    if unknown:
+        return {
+            "error": f"Unknown fields {unknown}. Available fields: {list(PriceStore.FIELDS)}",
+            "symbol": symbol,
+            "start": start,
+            "end": end,
+        }
+
+    data_path = _workspace_data_path("merged.jsonl", None if hourly else symbol)
+    store = get_price_store(data_path)
+    if store is None:
+        return {"error": f"Data file not found: {data_path}", "symbol": symbol, "start": start, "end": end}
+
+    # 日期格式的 end 包含当天所有 K 线（小时数据上不能截断到当天零点）
+    window_end = _to_datetime64(end)
+    if not hourly and not store.is_daily:
+        window_end += np.timedelta64(1, "D") - np.timedelta64(1, "s")
+
+    # 防止前视：窗口截断到当前 K 线，且当前 K 线只暴露开盘价
+    today_date = get_config_value("TODAY_DATE")
+    current_bar = _current_bar_time(store, today_date) if today_date else None
+    if current_bar is not None and window_end > current_bar:
+        window_end = current_bar
+        end = today_date
+
+    history = store.history(symbol, start, _datetime64_to_str(window_end), tuple(fields))
+    if history is None:
+        return {"error": f"No records found for stock {symbol} in local data", "symbol": symbol, "start": start, "end": end}
+    if current_bar is not None and history["dates"] and _to_datetime64(history["dates"][-1]) == current_bar:
+        for field in fields:
+            if field != "open":
+                history[field][-1] = None
+
+    return {"symbol": symbol, "start": start, "end": end, **history}
 
 
 def get_price_local_function(symbol: str, date: str, filename: str = "merged.jsonl") -> Dict[str, Any]:
@@ -251,36 +353,31 @@ def get_price_local_function(symbol: str, date: str, filename: str = "merged.jso
     if not data_path.exists():
         return {"error": f"Data file not found: {data_path}", "symbol": symbol, "date": date}
 
-    with data_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            doc = json.loads(line)
-            meta = doc.get("Meta Data", {})
-            if meta.get("2. Symbol") != symbol:
-                continue
-            series = doc.get("Time Series (Daily)", {})
-            day = series.get(date)
-            if day is None:
-                sample_dates = sorted(series.keys(), reverse=True)[:5]
-                return {
-                    "error": f"Data not found for date {date}. Please verify the date exists in data. Sample available dates: {sample_dates}",
-                    "symbol": symbol,
-                    "date": date,
-                }
-            return {
-                "symbol": symbol,
-                "date": date,
-                "ohlcv": {
-                    "buy price": day.get("1. buy price"),
-                    "high": day.get("2. high"),
-                    "low": day.get("3. low"),
-                    "sell price": day.get("4. sell price"),
-                    "volume": day.get("5. volume"),
-                },
-            }
-
-    return {"error": f"No records found for stock {symbol} in local data", "symbol": symbol, "date": date}
+    # 通过旁路索引直接定位该代码所在行，只解析这一行
+    doc = load_symbol_document(data_path, symbol)
+    if doc is None:
+        return {"error": f"No records found for stock {symbol} in local data", "symbol": symbol, "date": date}
+
+    series = doc.get("Time Series (Daily)", {})
+    day = series.get(date)
+    if day is None:
+        sample_dates = sorted(series.keys(), reverse=True)[:5]
+        return {
+            "error": f"Data not found for date {date}. Please verify the date exists in data. Sample available dates: {sample_dates}",
+            "symbol": symbol,
+            "date": date,
+        }
+    return {
+        "symbol": symbol,
+        "date": date,
+        "ohlcv": {
+            "buy price": day.get("1. buy price"),
+            "high": day.get("2. high"),
+            "low": day.get("3. low"),
+            "sell price": day.get("4. sell price"),
+            "volume": day.get("5. volume"),
+        },
+    }
 
 
 if __name__ == "__main__":
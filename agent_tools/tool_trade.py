@@ -17,8 +17,13 @@ from tools.price_tools import (get_latest_position, get_open_prices,
                                get_yesterday_date,
                                get_yesterday_open_and_close_price,
                                get_yesterday_profit)
+from tools.position_snapshot import (refresh_position_snapshot,
+                                     snapshot_buy_amount)
+from tools.trading_context import TradingContextMiddleware
 
 mcp = FastMCP("TradeTools")
+# 每次工具调用的 SIGNATURE / TODAY_DATE / LOG_PATH 优先取自请求头
+mcp.add_middleware(TradingContextMiddleware())
 
 def _position_lock(signature: str):
     """Context manager for file-based lock to serialize position updates per signature."""
@@ -219,6 +224,8 @@ def buy(symbol: str, amount: int) -> Dict[str, Any]:
                 )
                 + "\n"
             )
+        # 同步更新 position/latest.json 快照
+        refresh_position_snapshot(Path(position_file_path))
         # Step 7: Return updated position
         write_config_value("IF_TRADE", True)
         print("IF_TRADE", get_config_value("IF_TRADE"))
@@ -245,6 +252,15 @@ def _get_today_buy_amount(symbol: str, today_date: str, signature: str) -> int:
     if not os.path.exists(position_file_path):
         return 0
 
+    try:
+        snapshot = refresh_position_snapshot(Path(position_file_path))
+        if snapshot is not None:
+            bought = snapshot_buy_amount(snapshot, today_date, symbol)
+            if bought is not None:
+                return bought
+    except Exception as e:
+        print(f"⚠️  Position snapshot unavailable, scanning ledger: {e}")
+
     total_bought_today = 0
     with open(position_file_path, "r") as f:
         for line in f:
@@ -426,12 +442,183 @@ def sell(symbol: str, amount: int) -> Dict[str, Any]:
             )
             + "\n"
         )
+    # 同步更新 position/latest.json 快照
+    refresh_position_snapshot(Path(position_file_path))
 
     # Step 7: Return updated position
     write_config_value("IF_TRADE", True)
     return new_position
 
 
+@mcp.tool()
+def execute_orders(orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Execute several buy/sell orders at once (all or nothing)
+
+    Prefer this over calling buy/sell repeatedly when rebalancing several stocks.
+    The whole batch is validated against one position read and one price lookup:
+    sells are applied before buys (so sale proceeds can fund the buys), and the same
+    rules as buy/sell apply (sufficient cash/shares, lots of 100 and T+1 for CN market).
+    If any order fails, nothing is executed.
+
+    Args:
+        orders: List of orders, each {"action": "buy" | "sell", "symbol": str, "amount": int},
+                e.g. [{"action": "sell", "symbol": "AAPL", "amount": 5}, {"action": "buy", "symbol": "NVDA", "amount": 10}]
+
+    Returns:
+        Dict[str, Any]:
+          - Success: {"executed": [orders in execution order], "positions": final position dictionary}
+          - Failure: {"error": error message, "order": the failing order, ...}; no order is executed
+
+    Raises:
+        ValueError: Raised when SIGNATURE environment variable is not set
+    """
+    signature = get_config_value("SIGNATURE")
+    if signature is None:
+        raise ValueError("SIGNATURE environment variable is not set")
+    today_date = get_config_value("TODAY_DATE")
+
+    if not orders:
+        return {"error": "No orders given.", "date": today_date}
+
+    # Step 1: 校验每笔订单的格式、数量和 A 股一手规则
+    normalized: List[Dict[str, Any]] = []
+    for order in orders:
+        action = str(order.get("action", "")).lower() if isinstance(order, dict) else ""
+        symbol = order.get("symbol") if isinstance(order, dict) else None
+        if action not in ("buy", "sell") or not isinstance(symbol, str) or not symbol:
+            return {
+                "error": "Each order must be {\"action\": \"buy\" | \"sell\", \"symbol\": str, \"amount\": int}. No order was executed.",
+                "order": order,
+                "date": today_date,
+            }
+        try:
+            amount = int(order.get("amount"))
+        except (TypeError, ValueError):
+            return {
+                "error": f"Invalid amount format. Amount must be an integer for stock trading. You provided: {order.get('amount')}. No order was executed.",
+                "order": order,
+                "date": today_date,
+            }
+        if amount <= 0:
+            return {
+                "error": f"Amount must be positive. You tried to {action} {amount} shares. No order was executed.",
+                "order": order,
+                "date": today_date,
+            }
+        market = "cn" if symbol.endswith((".SH", ".SZ")) else "us"
+        if market == "cn" and amount % 100 != 0:
+            return {
+                "error": f"Chinese A-shares must be traded in multiples of 100 shares (1 lot = 100 shares). You tried to {action} {amount} shares. No order was executed.",
+                "order": order,
+                "date": today_date,
+                "suggestion": f"Please use {(amount // 100) * 100} or {((amount // 100) + 1) * 100} shares instead.",
+            }
+        normalized.append({"action": action, "symbol": symbol, "amount": amount, "market": market})
+
+    # 先卖后买，卖出所得可用于同批次买入
+    normalized.sort(key=lambda o: o["action"] != "sell")
+
+    # Step 2: 一次性获取所有标的的开盘价（每个市场一次查询）
+    prices: Dict[str, Optional[float]] = {}
+    for market in {o["market"] for o in normalized}:
+        symbols = list(dict.fromkeys(o["symbol"] for o in normalized if o["market"] == market))
+        prices.update(get_open_prices(today_date, symbols, market=market))
+
+    log_path = get_config_value("LOG_PATH", "./data/agent_data")
+    if log_path.startswith("./data/"):
+        log_path = log_path[7:]  # Remove "./data/" prefix
+    position_file_path = os.path.join(project_root, "data", log_path, signature, "position", "position.jsonl")
+
+    # Step 3: 在同一把锁内完成 读持仓 -> 逐笔校验 -> 一次性追加
+    with _position_lock(signature):
+        try:
+            current_position, current_action_id = get_latest_position(today_date, signature)
+        except Exception as e:
+            return {"error": f"Failed to load latest position: {e}", "date": today_date}
+
+        new_position = current_position.copy()
+        records: List[Dict[str, Any]] = []
+        for order in normalized:
+            action, symbol, amount, market = order["action"], order["symbol"], order["amount"], order["market"]
+            public_order = {"action": action, "symbol": symbol, "amount": amount}
+
+            if f"{symbol}_price" not in prices:
+                return {
+                    "error": f"Symbol {symbol} not found! No order was executed.",
+                    "order": public_order,
+                    "date": today_date,
+                }
+            price = prices[f"{symbol}_price"]
+            if price is None:
+                return {
+                    "error": f"Price data not available for {symbol} at {today_date}. No order was executed.",
+                    "order": public_order,
+                    "date": today_date,
+                    "market": market,
+                }
+
+            if action == "sell":
+                if symbol not in new_position:
+                    return {
+                        "error": f"No position for {symbol}! No order was executed.",
+                        "order": public_order,
+                        "date": today_date,
+                    }
+                if new_position[symbol] < amount:
+                    return {
+                        "error": "Insufficient shares! No order was executed.",
+                        "order": public_order,
+                        "have": new_position.get(symbol, 0),
+                        "want_to_sell": amount,
+                        "date": today_date,
+                    }
+                # 🇨🇳 T+1: 当天买入的股票不能卖出（同批次的买入总在卖出之后，不影响）
+                if market == "cn":
+                    bought_today = _get_today_buy_amount(symbol, today_date, signature)
+                    sellable_amount = new_position[symbol] - bought_today
+                    if bought_today > 0 and amount > sellable_amount:
+                        return {
+                            "error": f"T+1 restriction violated! You bought {bought_today} shares of {symbol} today and cannot sell them until tomorrow. No order was executed.",
+                            "order": public_order,
+                            "total_position": new_position[symbol],
+                            "bought_today": bought_today,
+                            "sellable_today": max(0, sellable_amount),
+                            "date": today_date,
+                        }
+                new_position[symbol] -= amount
+                new_position["CASH"] = new_position.get("CASH", 0) + price * amount
+            else:
+                cash_left = new_position.get("CASH", 0) - price * amount
+                if cash_left < 0:
+                    return {
+                        "error": "Insufficient cash! No order was executed.",
+                        "order": public_order,
+                        "required_cash": price * amount,
+                        "cash_available": new_position.get("CASH", 0),
+                        "date": today_date,
+                    }
+                new_position["CASH"] = cash_left
+                new_position[symbol] = new_position.get(symbol, 0) + amount
+
+            records.append(
+                {
+                    "date": today_date,
+                    "id": current_action_id + len(records) + 1,
+                    "this_action": public_order,
+                    "positions": new_position.copy(),
+                }
+            )
+
+        # Step 4: 全部校验通过后一次性写入 position.jsonl
+        with open(position_file_path, "a") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+        refresh_position_snapshot(Path(position_file_path))
+
+    write_config_value("IF_TRADE", True)
+    return {"executed": [record["this_action"] for record in records], "positions": new_position}
+
+
 if __name__ == "__main__":
     # new_result = buy("AAPL", 1)
     # print(new_result)
@@ -10,7 +10,7 @@ load_dotenv()
 
 from prompts.agent_prompt import all_nasdaq_100_symbols
 # Import tools and prompts
-from tools.general_tools import get_config_value, write_config_value
+from tools.general_tools import config_batch, get_config_value, write_config_value
 
 # Agent class mapping table - for dynamic import and instantiation
 AGENT_REGISTRY = {
@@ -177,6 +177,7 @@ async def main(config_path=None):
     base_delay = agent_config.get("base_delay", 0.5)
     initial_cash = agent_config.get("initial_cash", 10000.0)
     verbose = agent_config.get("verbose", False)
+    history_compaction = agent_config.get("history_compaction")
 
     # Display enabled model information
     model_names = [m.get("name", m.get("signature")) for m in enabled_models]
@@ -231,10 +232,11 @@ async def main(config_path=None):
                 print(f"🔄 Position file not found, cleared config for fresh start from {INIT_DATE}")
         
         # Write config values to shared config file (from .env RUNTIME_ENV_PATH)
-        write_config_value("SIGNATURE", signature)
-        write_config_value("IF_TRADE", False)
-        write_config_value("MARKET", market)
-        write_config_value("LOG_PATH", log_path)
+        with config_batch():
+            write_config_value("SIGNATURE", signature)
+            write_config_value("IF_TRADE", False)
+            write_config_value("MARKET", market)
+            write_config_value("LOG_PATH", log_path)
         
         print(f"✅ Runtime config initialized: SIGNATURE={signature}, MARKET={market}")
 
@@ -265,7 +267,8 @@ async def main(config_path=None):
                     initial_cash=initial_cash,
                     init_date=INIT_DATE,
                     openai_base_url=openai_base_url,
-                    openai_api_key=openai_api_key
+                    openai_api_key=openai_api_key,
+                    history_compaction=history_compaction
                 )
             else:
                 agent = AgentClass(
@@ -279,7 +282,8 @@ async def main(config_path=None):
                     initial_cash=initial_cash,
                     init_date=INIT_DATE,
                     openai_base_url=openai_base_url,
-                    openai_api_key=openai_api_key
+                    openai_api_key=openai_api_key,
+                    history_compaction=history_compaction
                 )
 
             print(f"✅ {agent_type} instance created successfully: {agent}")
@@ -1,6 +1,8 @@
 import os
 import sys
 import asyncio
+import copy
+import time
 from datetime import datetime
 import json
 from pathlib import Path
@@ -9,7 +11,10 @@ import argparse
 load_dotenv()
 
 # Import tools and prompts
-from tools.general_tools import write_config_value
+from tools.general_tools import config_batch, request_context, write_config_value
+from tools.inproc_tools import get_mcp_tools
+from tools.market_context import precompute_market_contexts
+from tools.trading_context import task_context_interceptor
 from prompts.agent_prompt import all_nasdaq_100_symbols
 
 
@@ -97,63 +102,64 @@ def load_config(config_path=None):
         exit(1)
 
 
-async def _run_model_in_current_process(AgentClass, model_config, INIT_DATE, END_DATE, agent_config, log_config):
+def _prepare_runtime_env(signature, END_DATE):
+    """Point the runtime config of the current context at the model's own file and reset it"""
+    project_root = Path(__file__).resolve().parent
+    runtime_env_dir = project_root / "data" / "agent_data" / signature
+    runtime_env_dir.mkdir(parents=True, exist_ok=True)
+    runtime_env_path = runtime_env_dir / ".runtime_env.json"
+    with request_context({"RUNTIME_ENV_PATH": str(runtime_env_path)}), config_batch():
+        write_config_value("TODAY_DATE", END_DATE)
+        write_config_value("IF_TRADE", False)
+    return runtime_env_path
+
+
+def _create_agent(AgentClass, model_config, INIT_DATE, agent_config, log_config, llm_semaphore=None):
+    """Instantiate the agent for one model config, or return None if the config is incomplete"""
     model_name = model_config.get("name", "unknown")
     basemodel = model_config.get("basemodel")
     signature = model_config.get("signature")
-    openai_base_url = model_config.get("openai_base_url", None)
-    openai_api_key = model_config.get("openai_api_key", None)
 
     if not basemodel:
         print(f"❌ Model {model_name} missing basemodel field")
-        return
+        return None
     if not signature:
         print(f"❌ Model {model_name} missing signature field")
-        return
+        return None
 
     print("=" * 60)
     print(f"🤖 Processing model: {model_name}")
     print(f"📝 Signature: {signature}")
     print(f"🔧 BaseModel: {basemodel}")
 
-    project_root = Path(__file__).resolve().parent
-    runtime_env_dir = project_root / "data" / "agent_data" / signature
-    runtime_env_dir.mkdir(parents=True, exist_ok=True)
-    runtime_env_path = runtime_env_dir / ".runtime_env.json"
-    os.environ["RUNTIME_ENV_PATH"] = str(runtime_env_path)
-    os.environ["SIGNATURE"] = signature
-    write_config_value("TODAY_DATE", END_DATE)
-    write_config_value("IF_TRADE", False)
-
-    max_steps = agent_config.get("max_steps", 10)
-    max_retries = agent_config.get("max_retries", 3)
-    base_delay = agent_config.get("base_delay", 0.5)
-    initial_cash = agent_config.get("initial_cash", 10000.0)
-
-    log_path = log_config.get("log_path", "./data/agent_data")
-
+    agent = AgentClass(
+        signature=signature,
+        basemodel=basemodel,
+        stock_symbols=all_nasdaq_100_symbols,
+        log_path=log_config.get("log_path", "./data/agent_data"),
+        openai_base_url=model_config.get("openai_base_url", None),
+        openai_api_key=model_config.get("openai_api_key", None),
+        max_steps=agent_config.get("max_steps", 10),
+        max_retries=agent_config.get("max_retries", 3),
+        base_delay=agent_config.get("base_delay", 0.5),
+        initial_cash=agent_config.get("initial_cash", 10000.0),
+        init_date=INIT_DATE,
+        llm_semaphore=llm_semaphore,
+        history_compaction=agent_config.get("history_compaction"),
+    )
+    print(f"✅ {AgentClass.__name__} instance created successfully: {agent}")
+    return agent
+
+
+async def _run_agent(agent, model_name, INIT_DATE, END_DATE, shared_tools=None):
+    signature = agent.signature
     try:
-        agent = AgentClass(
-            signature=signature,
-            basemodel=basemodel,
-            stock_symbols=all_nasdaq_100_symbols,
-            log_path=log_path,
-            openai_base_url=openai_base_url,
-            openai_api_key=openai_api_key,
-            max_steps=max_steps,
-            max_retries=max_retries,
-            base_delay=base_delay,
-            initial_cash=initial_cash,
-            init_date=INIT_DATE
-        )
-
-        print(f"✅ {AgentClass.__name__} instance created successfully: {agent}")
-        await agent.initialize()
+        await agent.initialize(shared_tools=shared_tools)
         print("✅ Initialization successful")
         await agent.run_date_range(INIT_DATE, END_DATE)
 
         summary = agent.get_position_summary()
-        print(f"📊 Final position summary:")
+        print(f"📊 Final position summary ({signature}):")
         print(f"   - Latest date: {summary.get('latest_date')}")
         print(f"   - Total records: {summary.get('total_records')}")
         print(f"   - Cash balance: ${summary.get('positions', {}).get('CASH', 0):.2f}")
@@ -168,32 +174,200 @@ async def _run_model_in_current_process(AgentClass, model_config, INIT_DATE, END
     print("=" * 60)
 
 
-async def _spawn_model_subprocesses(config_path, enabled_models):
-    tasks = []
+async def _run_model_in_current_process(AgentClass, model_config, INIT_DATE, END_DATE, agent_config, log_config):
+    agent = _create_agent(AgentClass, model_config, INIT_DATE, agent_config, log_config)
+    if agent is None:
+        return
+
+    os.environ["RUNTIME_ENV_PATH"] = str(_prepare_runtime_env(agent.signature, END_DATE))
+    os.environ["SIGNATURE"] = agent.signature
+    await _run_agent(agent, model_config.get("name", "unknown"), INIT_DATE, END_DATE)
+
+
+async def _load_shared_mcp_tools(mcp_config):
+    """
+    Create one MCP client for all in-process agents and load its tool list.
+
+    Returns:
+        The shared tools, or None if the installed langchain-mcp-adapters has no tool
+        interceptors (each agent then creates its own client)
+    """
+    try:
+        _, tools = await get_mcp_tools(copy.deepcopy(mcp_config), tool_interceptors=[task_context_interceptor])
+    except TypeError:
+        print("⚠️  langchain-mcp-adapters does not support tool interceptors; each agent will create its own MCP client")
+        return None
+    except Exception as e:
+        raise RuntimeError(
+            f"❌ Failed to initialize shared MCP client: {e}\n"
+            f"   Please ensure MCP services are running at the configured ports.\n"
+            f"   Run: python agent_tools/start_mcp_services.py"
+        )
+    print(f"✅ Loaded {len(tools)} shared MCP tools")
+    return tools
+
+
+async def _run_models_in_process(AgentClass, enabled_models, INIT_DATE, END_DATE, agent_config, log_config, max_concurrency=None):
+    """
+    Run all models as asyncio tasks of this process.
+
+    The agents share one MCP client/tool list and this process's price store and market contexts.
+    Each task keeps its own runtime config file (via the request context) and sends its own trading
+    context headers with its tool calls. ``max_concurrency`` caps the LLM calls in flight at once.
+    """
+    llm_semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    agents = []
+    for model_config in enabled_models:
+        agent = _create_agent(AgentClass, model_config, INIT_DATE, agent_config, log_config, llm_semaphore)
+        if agent is not None:
+            agents.append((model_config.get("name", "unknown"), agent))
+    if not agents:
+        return
+
+    shared_tools = await _load_shared_mcp_tools(agents[0][1].mcp_config)
+
+    async def run_one(model_name, agent):
+        runtime_env_path = _prepare_runtime_env(agent.signature, END_DATE)
+        # 每个任务使用自己的运行时配置文件，互不覆盖 TODAY_DATE / IF_TRADE 等
+        with request_context({"RUNTIME_ENV_PATH": str(runtime_env_path)}):
+            await _run_agent(agent, model_name, INIT_DATE, END_DATE, shared_tools)
+
+    results = await asyncio.gather(*(run_one(name, agent) for name, agent in agents), return_exceptions=True)
+    failed = [agent.signature for (_, agent), result in zip(agents, results) if isinstance(result, BaseException)]
+    if failed:
+        print(f"❌ Failed models: {failed}")
+
+
+def _append_job_event(summary_path, event):
+    """Append one scheduler event to the JSONL run summary"""
+    event = {"time": datetime.now().isoformat(timespec="seconds"), **event}
+    try:
+        summary_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(summary_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"⚠️  Could not write run summary {summary_path}: {e}")
+
+
+async def _spawn_model_subprocesses(config_path, enabled_models, INIT_DATE, END_DATE, max_workers=None,
+                                    max_restarts=2, restart_delay=5.0, summary_path=None):
+    """
+    Run one subprocess job per model signature through a bounded worker pool.
+
+    Jobs are queued in descending ``priority`` (model config field, default 0), then in config order.
+    At most ``max_workers`` subprocesses run at once. A job whose subprocess exits with a non-zero
+    code is restarted up to ``max_restarts`` times with exponential backoff. The agent resumes from
+    its position file, so finished dates are not traded again. Every start/exit is appended to
+    ``summary_path`` (JSONL) with its wall time.
+
+    Args:
+        config_path: Configuration file path passed to the subprocesses
+        enabled_models: Model configs to run
+        INIT_DATE: Start date of every job
+        END_DATE: End date of every job
+        max_workers: Maximum concurrent subprocesses (defaults to the CPU count)
+        max_restarts: Maximum restarts of a failed job
+        restart_delay: Backoff before the first restart in seconds, doubled on each further restart
+        summary_path: JSONL file receiving per-job progress, or None to only print it
+
+    Returns:
+        {signature: {"status", "attempts", "returncode", "wall_time"}}
+    """
     python_exec = sys.executable
     this_file = str(Path(__file__).resolve())
-    for model in enabled_models:
-        signature = model.get("signature")
-        if not signature:
-            continue
+
+    jobs = [model for model in enabled_models if model.get("signature")]
+    # sorted() 是稳定排序：优先级相同的模型保持配置文件中的顺序
+    jobs = sorted(jobs, key=lambda model: -model.get("priority", 0))
+    if not jobs:
+        return {}
+    if not max_workers:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(jobs))
+
+    queue = asyncio.Queue()
+    for model in jobs:
+        queue.put_nowait(model["signature"])
+
+    env = dict(os.environ, INIT_DATE=INIT_DATE, END_DATE=END_DATE)
+    results = {}
+
+    def report(event):
+        if summary_path is not None:
+            _append_job_event(summary_path, event)
+
+    async def run_job(signature):
         cmd = [python_exec, this_file]
         if config_path:
             cmd.append(str(config_path))
         cmd.extend(["--signature", signature])
-        print(f"🧩 Spawning subprocess for signature='{signature}': {' '.join(cmd)}")
-        proc = await asyncio.create_subprocess_exec(*cmd)
-        tasks.append(proc.wait())
-    if not tasks:
-        return
-    await asyncio.gather(*tasks)
-
 
-async def main(config_path=None, only_signature: str | None = None):
+        job_start = time.monotonic()
+        returncode = None
+        attempt = 0
+        for attempt in range(1, max_restarts + 2):
+            print(f"🧩 Spawning subprocess for signature='{signature}' (attempt {attempt}): {' '.join(cmd)}")
+            report({"signature": signature, "event": "start", "attempt": attempt,
+                    "init_date": INIT_DATE, "end_date": END_DATE})
+            attempt_start = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(*cmd, env=env)
+            returncode = await proc.wait()
+            elapsed = round(time.monotonic() - attempt_start, 3)
+            report({"signature": signature, "event": "exit", "attempt": attempt,
+                    "returncode": returncode, "wall_time": elapsed})
+            if returncode == 0:
+                print(f"✅ Subprocess '{signature}' finished in {elapsed:.1f}s")
+                break
+            if attempt > max_restarts:
+                print(f"💥 Subprocess '{signature}' failed with code {returncode}; no restarts left")
+                break
+            wait_time = restart_delay * 2 ** (attempt - 1)
+            print(f"⚠️  Subprocess '{signature}' failed with code {returncode}; restarting in {wait_time:.1f}s")
+            await asyncio.sleep(wait_time)
+
+        results[signature] = {
+            "status": "succeeded" if returncode == 0 else "failed",
+            "attempts": attempt,
+            "returncode": returncode,
+            "wall_time": round(time.monotonic() - job_start, 3),
+        }
+        report({"signature": signature, "event": "done", **results[signature]})
+
+    async def worker():
+        while True:
+            try:
+                signature = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await run_job(signature)
+
+    print(f"👷 Running {len(jobs)} jobs with {max_workers} workers")
+    await asyncio.gather(*(worker() for _ in range(max_workers)))
+
+    failed = [sig for sig, result in results.items() if result["status"] != "succeeded"]
+    print(f"📊 Jobs: {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    if failed:
+        print(f"❌ Failed signatures: {failed}")
+    if summary_path is not None:
+        print(f"📁 Run summary: {summary_path}")
+    return results
+
+
+async def main(config_path=None, only_signature: str | None = None, inproc: bool = False,
+               max_concurrency: int | None = None, max_workers: int | None = None,
+               max_restarts: int | None = None):
     """Run trading experiment using Agent class (parallel runner)
     
     Args:
         config_path: Configuration file path, if None use default config
         only_signature: If provided, run only this model signature
+        inproc: Run multiple models as asyncio tasks in this process instead of subprocesses
+        max_concurrency: Maximum in-flight LLM calls in in-process mode
+            (defaults to agent_config.max_concurrent_llm_calls, unlimited if unset)
+        max_workers: Maximum concurrent model subprocesses
+            (defaults to agent_config.max_workers, else the CPU count)
+        max_restarts: Restarts of a failed model subprocess (defaults to agent_config.max_worker_restarts, else 2)
     """
     # Load configuration file
     config = load_config(config_path)
@@ -257,15 +431,49 @@ async def main(config_path=None, only_signature: str | None = None):
             await _run_model_in_current_process(AgentClass, model_config, INIT_DATE, END_DATE, agent_config, log_config)
         print("🎉 All models processing completed!")
     else:
-        print("⚡ Multiple models enabled; running them in parallel using subprocesses...")
-        await _spawn_model_subprocesses(config_path, enabled_models)
-        print("🎉 All model subprocesses completed!")
+        # 所有模型共享同一份按日期预计算的市场上下文，避免每个模型重复计算提示词中的价格
+        market = config.get("market", "us")
+        n_contexts = precompute_market_contexts(market, INIT_DATE, END_DATE)
+        print(f"📦 Precomputed {n_contexts} shared market contexts ({market})")
+        if inproc:
+            if max_concurrency is None:
+                max_concurrency = agent_config.get("max_concurrent_llm_calls")
+            limit = max_concurrency or "unlimited"
+            print(f"⚡ Multiple models enabled; running them as asyncio tasks in this process (LLM concurrency: {limit})...")
+            await _run_models_in_process(AgentClass, enabled_models, INIT_DATE, END_DATE, agent_config, log_config, max_concurrency)
+            print("🎉 All in-process models completed!")
+        else:
+            print("⚡ Multiple models enabled; running them in parallel using subprocesses...")
+            if max_workers is None:
+                max_workers = agent_config.get("max_workers")
+            if max_restarts is None:
+                max_restarts = agent_config.get("max_worker_restarts", 2)
+            log_path = Path(log_config.get("log_path", "./data/agent_data"))
+            summary_path = log_path / "parallel_runs" / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+            await _spawn_model_subprocesses(
+                config_path,
+                enabled_models,
+                INIT_DATE,
+                END_DATE,
+                max_workers=max_workers,
+                max_restarts=max_restarts,
+                summary_path=summary_path,
+            )
+            print("🎉 All model subprocesses completed!")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="AI-Trader parallel runner")
     parser.add_argument("config_path", nargs="?", default=None, help="Path to config JSON")
     parser.add_argument("--signature", dest="signature", default=None, help="Run only this model signature")
+    parser.add_argument("--inproc", action="store_true",
+                        help="Run all models as asyncio tasks in this process, sharing one MCP client")
+    parser.add_argument("--max-concurrency", dest="max_concurrency", type=int, default=None,
+                        help="Maximum in-flight LLM calls with --inproc (default: agent_config.max_concurrent_llm_calls)")
+    parser.add_argument("--max-workers", dest="max_workers", type=int, default=None,
+                        help="Maximum concurrent model subprocesses (default: agent_config.max_workers or CPU count)")
+    parser.add_argument("--max-restarts", dest="max_restarts", type=int, default=None,
+                        help="Restarts of a failed model subprocess (default: agent_config.max_worker_restarts or 2)")
     args = parser.parse_args()
 
     if args.config_path:
@@ -275,5 +483,6 @@ if __name__ == "__main__":
     if args.signature:
         print(f"🎯 Filtering to single signature: {args.signature}")
 
-    asyncio.run(main(args.config_path, args.signature))
+    asyncio.run(main(args.config_path, args.signature, args.inproc, args.max_concurrency,
+                     args.max_workers, args.max_restarts))
 
@@ -14,10 +14,10 @@ from typing import Dict, List, Optional
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 from tools.general_tools import get_config_value
+from tools.market_context import get_prompt_prices
 from tools.price_tools import (all_nasdaq_100_symbols, all_sse_50_symbols,
-                               format_price_dict_with_names, get_open_prices,
+                               format_price_dict_with_names,
                                get_today_init_position, get_yesterday_date,
-                               get_yesterday_open_and_close_price,
                                get_yesterday_profit)
 
 STOP_SIGNAL = "<FINISH_SIGNAL>"
@@ -70,11 +70,10 @@ def get_agent_system_prompt(
     if stock_symbols is None:
         stock_symbols = all_sse_50_symbols if market == "cn" else all_nasdaq_100_symbols
 
-    # Get yesterday's buy and sell prices
-    yesterday_buy_prices, yesterday_sell_prices = get_yesterday_open_and_close_price(
+    # Get yesterday's buy and sell prices and today's buy prices (shared per-date market context)
+    yesterday_buy_prices, yesterday_sell_prices, today_buy_price = get_prompt_prices(
         today_date, stock_symbols, market=market
     )
-    today_buy_price = get_open_prices(today_date, stock_symbols, market=market)
     today_init_position = get_today_init_position(today_date, signature)
     # yesterday_profit = get_yesterday_profit(today_date, yesterday_buy_prices, yesterday_sell_prices, today_init_position)
     
@@ -19,10 +19,11 @@ from typing import Dict, List, Optional
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 from tools.general_tools import get_config_value
+from tools.market_context import (get_context_name_mapping,
+                                  get_prompt_prices)
 from tools.price_tools import (all_sse_50_symbols,
-                               format_price_dict_with_names, get_open_prices,
+                               format_price_dict_with_names,
                                get_today_init_position, get_yesterday_date,
-                               get_yesterday_open_and_close_price,
                                get_yesterday_profit)
 
 STOP_SIGNAL = "<FINISH_SIGNAL>"
@@ -119,11 +120,10 @@ def get_agent_system_prompt_astock(today_date: str, signature: str, stock_symbol
     # 获取前一时间点的买入和卖出价格，硬编码market="cn"
     # 对于日线交易：获取昨日的开盘价和收盘价
     # 对于小时级交易：获取上一小时的开盘价和收盘价
-    yesterday_buy_prices, yesterday_sell_prices = get_yesterday_open_and_close_price(
+    # 同时获取当前时间点的买入价格；所有模型共享同一份按日期预计算的市场上下文
+    yesterday_buy_prices, yesterday_sell_prices, today_buy_price = get_prompt_prices(
         today_date, stock_symbols, market="cn"
     )
-    # 获取当前时间点的买入价格
-    today_buy_price = get_open_prices(today_date, stock_symbols, market="cn")
     # 获取当前持仓
     today_init_position = get_today_init_position(today_date, signature)
     
@@ -135,8 +135,9 @@ def get_agent_system_prompt_astock(today_date: str, signature: str, stock_symbol
     )
 
     # A股市场显示中文股票名称
-    yesterday_sell_prices_display = format_price_dict_with_names(yesterday_sell_prices, market="cn")
-    today_buy_price_display = format_price_dict_with_names(today_buy_price, market="cn")
+    name_map = get_context_name_mapping(today_date, market="cn")
+    yesterday_sell_prices_display = format_price_dict_with_names(yesterday_sell_prices, market="cn", name_map=name_map)
+    today_buy_price_display = format_price_dict_with_names(today_buy_price, market="cn", name_map=name_map)
 
     return agent_system_prompt_astock.format(
         date=today_date,
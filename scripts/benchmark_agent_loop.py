@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Agent-Loop Throughput Benchmark
+Runs N trading dates x M agents with the scripted stand-in model (tools/scripted_llm.py) so that
+only our own code is timed: prompt construction, MCP tool calls, ledger updates and logging.
+
+The MCP services must be running (python agent_tools/start_mcp_services.py), unless MCP_TRANSPORT=inproc
+calls the tools in-process. Agents run as asyncio tasks sharing one MCP client, like
+main_parrallel.py --inproc. Their ledgers and logs go to data/benchmark/, which is cleared at the
+start of every run.
+
+Usage:
+    python scripts/benchmark_agent_loop.py --agents 4 --dates 10
+    python scripts/benchmark_agent_loop.py --agents 8 --dates 5 --policy configs/scripted_policy.json --output bench.json
+    MCP_TRANSPORT=inproc python scripts/benchmark_agent_loop.py --agents 4 --dates 10
+
+Output:
+    sessions/sec plus count / errors / mean / p50 / p95 / max latency (ms) per stage:
+    session, prompt, llm, tool (and tool:<name>), log, result
+    Failed tool calls are listed; the exit code is 1 if none of the policy's trades executed.
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import shutil
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackHandler
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root))
+
+from main_parrallel import get_agent_class
+from tools.general_tools import request_context
+from tools.inproc_tools import get_mcp_tools
+from tools.price_tools import get_trading_calendar
+from tools.scripted_llm import SCRIPTED_MODEL_PREFIX
+from tools.trading_context import task_context_interceptor
+
+BENCH_ROOT = project_root / "data" / "benchmark"
+TRADE_TOOLS = {"buy", "sell", "execute_orders", "buy_crypto", "sell_crypto"}
+
+
+class StageTimer:
+    """Collects wall-clock samples per stage."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        # 工具调用失败次数（MCP 错误或返回 {"error": ...}）
+        self.errors = defaultdict(int)
+
+    def record(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self):
+        out = {}
+        for stage, values in sorted(self.samples.items()):
+            ms = np.array(values) * 1000.0
+            out[stage] = {
+                "count": len(values),
+                "errors": self.errors.get(stage, 0),
+                "total_ms": round(float(ms.sum()), 3),
+                "mean_ms": round(float(ms.mean()), 3),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                "max_ms": round(float(ms.max()), 3),
+            }
+        return out
+
+
+class LLMTimingHandler(AsyncCallbackHandler):
+    """Times chat model calls through LangChain callbacks."""
+
+    def __init__(self, timer):
+        self.timer = timer
+        self.started = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self.started.pop(run_id, None)
+        if start is not None:
+            self.timer.record("llm", time.perf_counter() - start)
+
+
+def is_error_result(result):
+    """True for an MCP error result or a tool result carrying an "error" key."""
+    if getattr(result, "isError", False):
+        return True
+    structured = getattr(result, "structuredContent", None)
+    if isinstance(structured, dict):
+        structured = structured.get("result", structured) if len(structured) == 1 else structured
+        return isinstance(structured, dict) and "error" in structured
+    for content in getattr(result, "content", None) or []:
+        try:
+            data = json.loads(getattr(content, "text", ""))
+        except ValueError:
+            continue
+        if isinstance(data, dict) and "error" in data:
+            return True
+    return False
+
+
+def make_tool_timing_interceptor(timer):
+    async def interceptor(request, handler):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await handler(request)
+            failed = is_error_result(result)
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            timer.record("tool", elapsed)
+            timer.record(f"tool:{request.name}", elapsed)
+            if failed:
+                timer.errors["tool"] += 1
+                timer.errors[f"tool:{request.name}"] += 1
+
+    return interceptor
+
+
+def instrument_agent(agent, timer):
+    """Wrap the agent's session, logging and result handling with stage timers."""
+    run_trading_session = agent.run_trading_session
+    log_message = agent._log_message
+    handle_trading_result = agent._handle_trading_result
+
+    async def timed_session(today_date):
+        with timer.measure("session"):
+            await run_trading_session(today_date)
+
+    async def timed_log(log_file, new_messages):
+        with timer.measure("log"):
+            await log_message(log_file, new_messages)
+
+    async def timed_result(today_date):
+        with timer.measure("result"):
+            await handle_trading_result(today_date)
+
+    agent.run_trading_session = timed_session
+    agent._log_message = timed_log
+    agent._handle_trading_result = timed_result
+
+
+def instrument_prompt(AgentClass, timer):
+    """Time system prompt construction in the modules that build it."""
+    for module_name in {AgentClass.__module__, "agent.base_agent.base_agent"}:
+        module = sys.modules[module_name]
+        build_prompt = getattr(module, "get_agent_system_prompt", None)
+        if build_prompt is None or getattr(build_prompt, "_timed", False):
+            continue
+
+        def timed_prompt(*args, _build_prompt=build_prompt, **kwargs):
+            with timer.measure("prompt"):
+                return _build_prompt(*args, **kwargs)
+
+        timed_prompt._timed = True
+        module.get_agent_system_prompt = timed_prompt
+
+
+def select_dates(agent_type, n_dates, start=None):
+    """Return (init_date, end_date) spanning ``n_dates`` sessions after init_date."""
+    calendar = get_trading_calendar("us")
+    if calendar is None or len(calendar) == 0:
+        raise SystemExit("❌ No US price data found (data/merged.jsonl)")
+    if agent_type == "BaseAgent_Hour":
+        points = calendar.timestamps
+        if start:
+            points = calendar.range(start, points[-1])
+    else:
+        points = calendar.days
+        if start:
+            points = calendar.trading_days(start, points[-1])
+    if len(points) < n_dates + 1:
+        raise SystemExit(f"❌ Only {len(points) - 1} sessions available after {points[0] if points else start}")
+    return points[0], points[n_dates]
+
+
+async def run_benchmark(args):
+    AgentClass = get_agent_class(args.agent_type)
+    timer = StageTimer()
+    instrument_prompt(AgentClass, timer)
+
+    if BENCH_ROOT.exists():
+        shutil.rmtree(BENCH_ROOT)
+    log_path = BENCH_ROOT / "agent_data"
+    init_date, end_date = select_dates(args.agent_type, args.dates, args.start)
+    basemodel = SCRIPTED_MODEL_PREFIX + str(Path(args.policy).resolve())
+
+    agents = [
+        AgentClass(
+            signature=f"bench-{i}",
+            basemodel=basemodel,
+            log_path=str(log_path),
+            max_steps=args.max_steps,
+            max_retries=1,
+            init_date=init_date,
+        )
+        for i in range(args.agents)
+    ]
+
+    mcp_config = copy.deepcopy(agents[0].mcp_config)
+    # 基准测试不调用外部新闻搜索
+    mcp_config.pop("search", None)
+    _, tools = await get_mcp_tools(
+        mcp_config, tool_interceptors=[task_context_interceptor, make_tool_timing_interceptor(timer)]
+    )
+    llm_handler = LLMTimingHandler(timer)
+
+    async def run_one(agent):
+        runtime_env_path = log_path / agent.signature / ".runtime_env.json"
+        with request_context({"RUNTIME_ENV_PATH": str(runtime_env_path), "LOG_PATH": str(log_path)}):
+            await agent.initialize(shared_tools=tools)
+            agent.model.callbacks = [llm_handler]
+            instrument_agent(agent, timer)
+            await agent.run_date_range(init_date, end_date)
+
+    print(f"🏁 Benchmark: {args.agents} agents x {args.dates} sessions ({init_date} -> {end_date})")
+    start = time.perf_counter()
+    await asyncio.gather(*(run_one(agent) for agent in agents))
+    wall_time = time.perf_counter() - start
+
+    stages = timer.summary()
+    sessions = stages.get("session", {}).get("count", 0)
+    result = {
+        "agent_type": args.agent_type,
+        "agents": args.agents,
+        "dates": args.dates,
+        "init_date": init_date,
+        "end_date": end_date,
+        "policy": str(args.policy),
+        "wall_time_s": round(wall_time, 3),
+        "sessions": sessions,
+        "sessions_per_sec": round(sessions / wall_time, 3) if wall_time > 0 else None,
+        "stages": stages,
+    }
+    if not args.keep:
+        shutil.rmtree(BENCH_ROOT, ignore_errors=True)
+    return result
+
+
+def print_report(result):
+    print("=" * 78)
+    print(f"📊 {result['sessions']} sessions in {result['wall_time_s']:.3f}s -> {result['sessions_per_sec']} sessions/sec")
+    print(f"{'stage':<28}{'count':>8}{'errors':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for stage, s in result["stages"].items():
+        print(
+            f"{stage:<28}{s['count']:>8}{s['errors']:>8}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['max_ms']:>10.2f}"
+        )
+    print("=" * 78)
+
+
+def check_tool_errors(result):
+    """
+    Warn about failed tool calls.
+
+    Returns:
+        False if the policy made trade calls and none of them executed (the run measured no trading)
+    """
+    stages = result["stages"]
+    failed = [
+        f"{stage[5:]} {s['errors']}/{s['count']}" for stage, s in stages.items() if stage.startswith("tool:") and s["errors"]
+    ]
+    if failed:
+        print(f"⚠️  Failed tool calls: {', '.join(failed)}")
+    trades = [stages[f"tool:{name}"] for name in TRADE_TOOLS if f"tool:{name}" in stages]
+    if trades and all(s["errors"] == s["count"] for s in trades):
+        print("❌ None of the policy's trades executed; check --agent-type against the price data (e.g. hourly merged.jsonl)")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the agent loop with a scripted model")
+    parser.add_argument("--agents", type=int, default=4, help="Number of concurrent agents (M)")
+    parser.add_argument("--dates", type=int, default=5, help="Number of sessions per agent (N)")
+    parser.add_argument("--agent-type", default="BaseAgent_Hour", choices=["BaseAgent", "BaseAgent_Hour"])
+    parser.add_argument("--start", default=None, help="First date/timestamp (default: first in data)")
+    parser.add_argument("--policy", default=str(project_root / "configs" / "scripted_policy.json"))
+    parser.add_argument("--max-steps", dest="max_steps", type=int, default=10)
+    parser.add_argument("--output", default=None, help="Write the result as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep data/benchmark/ after the run")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_benchmark(args))
+    print_report(result)
+    trades_ok = check_tool_errors(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"📁 Result written to {args.output}")
+    if not trades_ok:
+        sys.exit(1)
@@ -8,6 +8,10 @@ cd "$PROJECT_ROOT"
 
 echo "🤖 正在启动主交易智能体（A股模式）..."
 
+# 等待 MCP 服务（步骤2）就绪
+# （按 MCP_TRANSPORT：inproc 不等待，combined 等待合并服务）
+python agent_tools/start_mcp_services.py --wait-ready || exit 1
+
 python main.py configs/astock_config.json  # 运行A股配置
 
 echo "✅ AI-Trader 已停止"
@@ -8,6 +8,10 @@ cd "$PROJECT_ROOT"
 
 echo "🤖 Now starting the cryptocurrencies trading agent..."
 
+# 等待 MCP 服务（步骤2）就绪
+# （按 MCP_TRANSPORT：inproc 不等待，combined 等待合并服务）
+python agent_tools/start_mcp_services.py --wait-ready || exit 1
+
 python main.py configs/default_crypto_config.json 
 
 echo "✅ AI-Trader 已停止"
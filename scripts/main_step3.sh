@@ -10,6 +10,10 @@ echo "🤖 Now starting the main trading agent..."
 
 # Please create the config file first!!
 
+# Wait until the MCP services (step 2) answer list_tools
+# (follows MCP_TRANSPORT: no wait for inproc, the combined server for combined)
+python agent_tools/start_mcp_services.py --wait-ready || exit 1
+
 # python main.py configs/default_day_config.json #run daily config
 python main.py configs/default_hour_config.json #run hourly config
 
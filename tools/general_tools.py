@@ -1,21 +1,52 @@
 import json
 import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, Optional, Tuple
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def _resolve_runtime_env_path() -> str:
+_PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# 进程内缓存: 路径 -> ((st_ino, st_mtime_ns, st_size), 解析后的配置)
+_RUNTIME_ENV_CACHE: Dict[str, Tuple[Tuple[int, int, int], dict]] = {}
+_RUNTIME_ENV_LOCK = threading.Lock()
+
+# 单次请求的交易上下文（SIGNATURE / TODAY_DATE / LOG_PATH / RUNTIME_ENV_PATH ...），优先于运行时配置文件
+_REQUEST_CONTEXT: ContextVar[Optional[Dict[str, Any]]] = ContextVar("_REQUEST_CONTEXT", default=None)
+
+
+@contextmanager
+def request_context(values: Dict[str, Any]):
+    """Make ``values`` visible to get_config_value for the duration of the block (current context only).
+
+    Used by the MCP servers to serve each tool call with the caller's SIGNATURE/TODAY_DATE/...
+    instead of the shared runtime config file. A RUNTIME_ENV_PATH in ``values`` also redirects
+    reads and writes of the remaining keys (e.g. IF_TRADE) to that caller's config file.
+    """
+    token = _REQUEST_CONTEXT.set(dict(values))
+    try:
+        yield
+    finally:
+        _REQUEST_CONTEXT.reset(token)
+
+
+def _resolve_runtime_env_path(create_dir: bool = False) -> str:
     """Resolve runtime env path from RUNTIME_ENV_PATH in .env file.
     
     Simple strategy:
-    1. Read RUNTIME_ENV_PATH from environment (.env file)
+    1. Read RUNTIME_ENV_PATH from the request context, else from environment (.env file)
     2. If relative path, resolve from project root
-    3. Return the path (will be created by write_config_value if needed)
+    3. Return the path (its directory is created only when ``create_dir`` is set, i.e. by writers)
     """
-    path = os.environ.get("RUNTIME_ENV_PATH")
+    context = _REQUEST_CONTEXT.get()
+    path = context.get("RUNTIME_ENV_PATH") if context else None
+    if not path:
+        path = os.environ.get("RUNTIME_ENV_PATH")
     
     if not path:
         # Fallback to default if not set
@@ -23,31 +54,58 @@ def _resolve_runtime_env_path() -> str:
     
     # If relative path, resolve from project root
     if not os.path.isabs(path):
-        base_dir = Path(__file__).resolve().parents[1]
-        path = str(base_dir / path)
+        path = str(_PROJECT_ROOT / path)
     
-    # Ensure directory exists
-    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    if create_dir:
+        # Ensure directory exists
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
     
     return path
 
 
 def _load_runtime_env() -> dict:
+    """Return the parsed runtime config, re-reading the file only when its inode/mtime/size change.
+
+    The returned dict is shared with the cache and must not be mutated by callers.
+    """
     path = _resolve_runtime_env_path()
-    if path is None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        _RUNTIME_ENV_CACHE.pop(path, None)
         return {}
+    fingerprint = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    cached = _RUNTIME_ENV_CACHE.get(path)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    data = {}
     try:
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    return data
+        with open(path, "r", encoding="utf-8") as f:
+            loaded = json.load(f)
+            if isinstance(loaded, dict):
+                data = loaded
     except Exception:
-        pass
-    return {}
+        # 读取失败时不缓存，下次调用重试
+        return {}
+    _RUNTIME_ENV_CACHE[path] = (fingerprint, data)
+    return data
+
+
+# config_batch() 中尚未落盘的写入；用 ContextVar 使同一线程中的不同 asyncio 任务互不干扰
+_PENDING_CONFIG: ContextVar[Optional[Dict[str, Any]]] = ContextVar("_PENDING_CONFIG", default=None)
 
 
 def get_config_value(key: str, default=None):
+    context = _REQUEST_CONTEXT.get()
+    if context is not None and key in context:
+        return context[key]
+
+    pending = _PENDING_CONFIG.get()
+    if pending is not None and key in pending:
+        return pending[key]
+
     _RUNTIME_ENV = _load_runtime_env()
 
     if key in _RUNTIME_ENV:
@@ -55,18 +113,68 @@ def get_config_value(key: str, default=None):
     return os.getenv(key, default)
 
 
+def _write_runtime_env(updates: Dict[str, Any]) -> None:
+    """Merge ``updates`` into the runtime config file with one atomic write (skipped if nothing changes)."""
+    path = _resolve_runtime_env_path(create_dir=True)
+    with _RUNTIME_ENV_LOCK:
+        current = _load_runtime_env()
+        if all(key in current and current[key] == value for key, value in updates.items()):
+            return
+        _RUNTIME_ENV = dict(current)
+        _RUNTIME_ENV.update(updates)
+        # 写临时文件再原子替换：其他进程不会读到半个文件，且 inode 变化保证缓存失效
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(_RUNTIME_ENV, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, path)
+            stat = os.stat(path)
+            _RUNTIME_ENV_CACHE[path] = ((stat.st_ino, stat.st_mtime_ns, stat.st_size), _RUNTIME_ENV)
+        except Exception as e:
+            print(f"❌ Error writing config to {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
 def write_config_value(key: str, value: Any):
-    path = _resolve_runtime_env_path()
-    if path is None:
-        print(f"⚠️  WARNING: RUNTIME_ENV_PATH not set, config value '{key}' not persisted")
+    pending = _PENDING_CONFIG.get()
+    if pending is not None:
+        # 在 config_batch() 中只记录，退出时统一写入
+        pending[key] = value
         return
-    _RUNTIME_ENV = _load_runtime_env()
-    _RUNTIME_ENV[key] = value
+    _write_runtime_env({key: value})
+
+
+@contextmanager
+def config_batch():
+    """Coalesce several write_config_value calls into a single atomic write.
+
+    Inside the block, writes are buffered and immediately visible to get_config_value in the
+    same context. They are written to the runtime config in one temp-file-and-rename on exit.
+    If the block raises, the buffered writes are discarded. Nested batches are merged into the
+    outermost one.
+
+    Example:
+        >>> with config_batch():
+        ...     write_config_value("TODAY_DATE", "2025-10-30")
+        ...     write_config_value("SIGNATURE", "gpt-5")
+    """
+    if _PENDING_CONFIG.get() is not None:
+        yield
+        return
+
+    pending: Dict[str, Any] = {}
+    token = _PENDING_CONFIG.set(pending)
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(_RUNTIME_ENV, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        print(f"❌ Error writing config to {path}: {e}")
+        yield
+    except BaseException:
+        _PENDING_CONFIG.reset(token)
+        raise
+    _PENDING_CONFIG.reset(token)
+    if pending:
+        _write_runtime_env(pending)
 
 
 def extract_conversation(conversation: dict, output_type: str):
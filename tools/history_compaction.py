@@ -0,0 +1,120 @@
+"""
+Compaction of the conversation history re-sent on every step of a trading session.
+
+The session loop keeps the full history (and logs it), but sends a compacted copy to the model:
+    - the initial query and the last ``keep_last_steps`` steps (assistant reply + tool results) verbatim
+    - position dumps in older tool results are dropped when a later step reports positions again
+    - older tool results are truncated to ``max_tool_result_chars`` characters
+
+Configured with agent_config["history_compaction"], e.g.
+    {"enabled": true, "keep_last_steps": 3, "max_tool_result_chars": 1500, "drop_stale_positions": true}
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+TOOL_RESULTS_PREFIX = "Tool results: "
+STALE_POSITIONS_NOTE = "[positions omitted: superseded by a later update]"
+
+DEFAULT_HISTORY_COMPACTION = {
+    "enabled": True,
+    "keep_last_steps": 3,
+    "max_tool_result_chars": 1500,
+    "drop_stale_positions": True,
+}
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken 未安装或编码表不可用时按字符数估算
+    _ENCODING = None
+
+
+def resolve_history_compaction(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Merge a (partial) history_compaction config over the defaults."""
+    policy = dict(DEFAULT_HISTORY_COMPACTION)
+    if config:
+        policy.update(config)
+    return policy
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Approximate token count of the message contents (cl100k_base if tiktoken is available, else chars/4)."""
+    text = "\n".join(str(m.get("content", "")) for m in messages)
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4
+
+
+def _is_positions(value: Any) -> bool:
+    return isinstance(value, dict) and "CASH" in value
+
+
+def _has_positions(line: str) -> bool:
+    try:
+        doc = json.loads(line)
+    except ValueError:
+        return False
+    return _is_positions(doc) or (isinstance(doc, dict) and _is_positions(doc.get("positions")))
+
+
+def _drop_positions(line: str) -> str:
+    """Replace a position dump (a bare positions dict, or a "positions" field) by a short note."""
+    try:
+        doc = json.loads(line)
+    except ValueError:
+        return line
+    if _is_positions(doc):
+        return STALE_POSITIONS_NOTE
+    if isinstance(doc, dict) and _is_positions(doc.get("positions")):
+        doc["positions"] = STALE_POSITIONS_NOTE
+        return json.dumps(doc, ensure_ascii=False)
+    return line
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text) - max_chars} more characters truncated]"
+
+
+def compact_history(messages: List[Dict[str, str]], policy: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+    """
+    Return the compacted copy of a session history to send to the model.
+
+    Args:
+        messages: Full history: the initial user query followed by (assistant, "Tool results: ...") pairs
+        policy: Compaction policy (see DEFAULT_HISTORY_COMPACTION); None uses the defaults
+
+    Returns:
+        New message list; ``messages`` itself is not modified
+    """
+    policy = resolve_history_compaction(policy)
+    keep_last = max(int(policy.get("keep_last_steps", 0)), 0)
+    if not policy.get("enabled", True) or len(messages) <= 1 + 2 * keep_last:
+        return list(messages)
+
+    head, steps = messages[:1], messages[1:]
+    n_older = len(steps) - 2 * keep_last
+
+    # 最后一次出现持仓的工具结果之前的持仓都已过时
+    last_positions = -1
+    if policy.get("drop_stale_positions", True):
+        for i, msg in enumerate(steps):
+            content = msg.get("content") or ""
+            if msg.get("role") == "user" and any(_has_positions(line) for line in content.split("\n")):
+                last_positions = i
+
+    compacted = list(head)
+    for i, msg in enumerate(steps):
+        content = msg.get("content") or ""
+        if i >= n_older or msg.get("role") != "user" or not content.startswith(TOOL_RESULTS_PREFIX):
+            compacted.append(msg)
+            continue
+        body = content[len(TOOL_RESULTS_PREFIX):]
+        if i < last_positions:
+            body = "\n".join(_drop_positions(line) for line in body.split("\n"))
+        body = _truncate(body, policy.get("max_tool_result_chars"))
+        compacted.append({**msg, "content": TOOL_RESULTS_PREFIX + body})
+    return compacted
@@ -0,0 +1,196 @@
+"""
+In-process transport for the MCP tool servers in agent_tools/.
+
+A connection {"transport": "inproc", "module": "agent_tools.tool_trade"} imports the module and
+exposes the tools of its FastMCP server (``mcp``) directly as LangChain tools, with the same names,
+descriptions and input schemas as over streamable HTTP. Tool calls skip HTTP, JSON-RPC and the MCP
+session per call: they run the FastMCP tool on a background event loop thread in this process,
+inside the trading context carried by the connection's headers (see tools/trading_context.py), and
+return the same content an HTTP call would. Tool interceptors (e.g. task_context_interceptor) are
+applied as with MultiServerMCPClient.
+
+Selected for the default agent configs with MCP_TRANSPORT=inproc; backtests then need no MCP
+services and no ports. MCP_TRANSPORT=combined instead connects to the single-process server of
+agent_tools/mcp_server.py (one port, one path per toolset).
+"""
+
+import asyncio
+import importlib
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import jsonschema
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from mcp.types import CallToolResult, TextContent
+
+try:
+    from langchain_mcp_adapters.interceptors import MCPToolCallRequest
+except ImportError:  # 旧版 langchain-mcp-adapters 不支持工具拦截器
+    MCPToolCallRequest = None
+
+from tools.general_tools import request_context
+from tools.trading_context import context_from_headers
+
+INPROC_TRANSPORT = "inproc"
+COMBINED_TRANSPORT = "combined"
+
+# 工具服务 -> FastMCP 服务器所在模块（与 start_mcp_services.py 的服务一致）
+TOOL_SERVICES = {
+    "math": "agent_tools.tool_math",
+    "search": "agent_tools.tool_alphavantage_news",
+    "trade": "agent_tools.tool_trade",
+    "price": "agent_tools.tool_get_price_local",
+    "crypto": "agent_tools.tool_crypto_trade",
+}
+
+_TOOL_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_TOOL_LOOP_LOCK = threading.Lock()
+
+
+def mcp_connection(service: str, port_env: str, default_port: str) -> Dict[str, Any]:
+    """
+    Connection config of one tool service for the default MCP configs.
+
+    Args:
+        service: Tool service, a key of TOOL_SERVICES (e.g. "trade")
+        port_env: Environment variable holding the service's HTTP port
+        default_port: Port used when ``port_env`` is not set
+
+    Returns:
+        Depending on MCP_TRANSPORT: an in-process connection ("inproc"), the service's path on the
+        combined server ("combined", port MCP_HTTP_PORT), else the service's own streamable_http port
+    """
+    transport = os.getenv("MCP_TRANSPORT", "streamable_http")
+    if transport == INPROC_TRANSPORT:
+        return {"transport": INPROC_TRANSPORT, "module": TOOL_SERVICES[service]}
+    if transport == COMBINED_TRANSPORT:
+        return {"transport": "streamable_http", "url": f"http://localhost:{os.getenv('MCP_HTTP_PORT', '8010')}/{service}/mcp"}
+    return {"transport": "streamable_http", "url": f"http://localhost:{os.getenv(port_env, default_port)}/mcp"}
+
+
+def _tool_loop() -> asyncio.AbstractEventLoop:
+    """Event loop thread running in-process tool calls (like the loop of an MCP server process)."""
+    global _TOOL_LOOP
+    with _TOOL_LOOP_LOCK:
+        if _TOOL_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="inproc-tools", daemon=True).start()
+            _TOOL_LOOP = loop
+    return _TOOL_LOOP
+
+
+def _error_result(text: str) -> CallToolResult:
+    return CallToolResult(content=[TextContent(type="text", text=text)], isError=True)
+
+
+async def _run_tool(tool: Any, input_schema: Dict[str, Any], arguments: Dict[str, Any], values: Dict[str, Any]) -> CallToolResult:
+    """Run a FastMCP tool the way its server does and return the MCP result."""
+    # 与 MCP 服务端一致：先按 inputSchema 严格校验参数（不做类型转换）
+    try:
+        jsonschema.validate(instance=arguments, schema=input_schema)
+    except jsonschema.ValidationError as e:
+        return _error_result(f"Input validation error: {e.message}")
+    try:
+        with request_context(values):
+            result = await tool.run(arguments)
+    except Exception as e:
+        return _error_result(f"Error calling tool {tool.name!r}: {e}")
+    return CallToolResult(content=result.content, structuredContent=result.structured_content)
+
+
+def _convert_result(result: Any) -> Tuple[Any, Optional[List[Any]]]:
+    """CallToolResult -> (text content, non-text artifacts), as langchain-mcp-adapters does."""
+    if not isinstance(result, CallToolResult):
+        # 拦截器直接返回了 ToolMessage / Command
+        return result, None
+    texts = [c.text for c in result.content if isinstance(c, TextContent)]
+    others = [c for c in result.content if not isinstance(c, TextContent)]
+    content: Any = texts[0] if len(texts) == 1 else (texts or "")
+    if result.isError:
+        raise ToolException(content)
+    return content, others or None
+
+
+def _to_langchain_tool(tool: Any, server_name: str, connection: Dict[str, Any], interceptors: List[Any]) -> BaseTool:
+    mcp_tool = tool.to_mcp_tool()
+
+    async def execute(arguments: Dict[str, Any], request_headers: Optional[Dict[str, Any]]) -> CallToolResult:
+        # 连接的请求头每次调用时读取，update_context_headers 的修改立即生效
+        headers = {**(connection.get("headers") or {}), **(request_headers or {})}
+        future = asyncio.run_coroutine_threadsafe(
+            _run_tool(tool, mcp_tool.inputSchema, arguments, context_from_headers(headers)), _tool_loop()
+        )
+        return await asyncio.wrap_future(future)
+
+    handler = lambda request: execute(request.args, request.headers)
+    for interceptor in reversed(interceptors):
+        handler = (lambda i, h: lambda request: i(request, h))(interceptor, handler)
+
+    async def call_tool(runtime: Any = None, **arguments: Any) -> Tuple[Any, Optional[List[Any]]]:
+        if not interceptors:
+            return _convert_result(await execute(arguments, None))
+        request = MCPToolCallRequest(
+            name=tool.name, args=arguments, server_name=server_name, headers=None, runtime=runtime
+        )
+        return _convert_result(await handler(request))
+
+    metadata = mcp_tool.annotations.model_dump() if mcp_tool.annotations is not None else None
+    return StructuredTool(
+        name=mcp_tool.name,
+        description=mcp_tool.description or "",
+        args_schema=mcp_tool.inputSchema,
+        coroutine=call_tool,
+        response_format="content_and_artifact",
+        metadata=metadata,
+    )
+
+
+async def load_inproc_tools(
+    connections: Dict[str, Dict[str, Any]], tool_interceptors: Optional[List[Any]] = None
+) -> List[BaseTool]:
+    """
+    Load the tools of in-process connections.
+
+    Args:
+        connections: {server_name: {"transport": "inproc", "module": ..., "headers": {...}}}
+        tool_interceptors: Interceptors applied to every tool call (MultiServerMCPClient semantics)
+
+    Returns:
+        LangChain tools with the same schemas as the servers' MCP tools
+    """
+    if tool_interceptors and MCPToolCallRequest is None:
+        raise TypeError("tool_interceptors require a langchain-mcp-adapters version with interceptors")
+    tools: List[BaseTool] = []
+    for server_name, connection in connections.items():
+        server = importlib.import_module(connection["module"]).mcp
+        for tool in (await server.get_tools()).values():
+            if tool.enabled:
+                tools.append(_to_langchain_tool(tool, server_name, connection, list(tool_interceptors or [])))
+    return tools
+
+
+async def get_mcp_tools(
+    mcp_config: Dict[str, Dict[str, Any]], tool_interceptors: Optional[List[Any]] = None
+) -> Tuple[Optional[MultiServerMCPClient], List[BaseTool]]:
+    """
+    Load the tools of an MCP config that may mix HTTP and in-process connections.
+
+    Returns:
+        (MultiServerMCPClient of the remote connections or None, all tools)
+    """
+    remote = {name: c for name, c in mcp_config.items() if c.get("transport") != INPROC_TRANSPORT}
+    local = {name: c for name, c in mcp_config.items() if c.get("transport") == INPROC_TRANSPORT}
+
+    client = None
+    tools: List[BaseTool] = []
+    if remote:
+        if tool_interceptors:
+            client = MultiServerMCPClient(remote, tool_interceptors=tool_interceptors)
+        else:
+            client = MultiServerMCPClient(remote)
+        tools.extend(await client.get_tools())
+    if local:
+        tools.extend(await load_inproc_tools(local, tool_interceptors))
+    return client, tools
@@ -0,0 +1,187 @@
+import json
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
+
+def index_path_for(data_path: Union[str, Path]) -> Path:
+    """Sidecar index path for a merged JSONL file, e.g. merged.jsonl -> merged.jsonl.idx"""
+    data_path = Path(data_path)
+    return data_path.with_name(data_path.name + INDEX_SUFFIX)
+
+
+def _fingerprint(data_path: Path) -> Tuple[int, int]:
+    stat = data_path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _scan_offsets(data_path: Path) -> Dict[str, Tuple[int, int]]:
+    """Scan the JSONL file once and record symbol -> (byte offset, byte length) of its line."""
+    offsets: Dict[str, Tuple[int, int]] = {}
+    offset = 0
+    with data_path.open("rb") as f:
+        for raw in f:
+            length = len(raw)
+            if raw.strip():
+                try:
+                    doc = json.loads(raw)
+                except Exception:
+                    doc = None
+                if isinstance(doc, dict):
+                    sym = doc.get("Meta Data", {}).get("2. Symbol")
+                    # 与逐行扫描保持一致：同一代码出现多次时以第一行为准
+                    if sym and sym not in offsets:
+                        offsets[sym] = (offset, length)
+            offset += length
+    return offsets
+
+
+def build_symbol_index(data_path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Build the symbol -> byte-range index for ``data_path`` and write it next to the file.
+
+    Args:
+        data_path: Path to a merged JSONL file (one symbol per line)
+
+    Returns:
+        Index dict: {"version", "mtime_ns", "size", "offsets": {symbol: [offset, length]}}
+    """
+    data_path = Path(data_path)
+    mtime_ns, size = _fingerprint(data_path)
+    index = {
+        "version": INDEX_VERSION,
+        "mtime_ns": mtime_ns,
+        "size": size,
+        "offsets": {sym: [off, length] for sym, (off, length) in _scan_offsets(data_path).items()},
+    }
+
+    sidecar = index_path_for(data_path)
+    tmp_path = sidecar.with_name(f"{sidecar.name}.{os.getpid()}.tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(tmp_path, sidecar)
+    except OSError as e:
+        # 只读目录等情况下仅在内存中使用索引
+        print(f"⚠️  Could not write symbol index {sidecar}: {e}")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+    return index
+
+
+def _load_sidecar(data_path: Path, fingerprint: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+    sidecar = index_path_for(data_path)
+    try:
+        with sidecar.open("r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        not isinstance(index, dict)
+        or index.get("version") != INDEX_VERSION
+        or (index.get("mtime_ns"), index.get("size")) != fingerprint
+    ):
+        return None
+    return index
+
+
+class _MappedFile:
+    """A memory-mapped merged file plus its symbol index, valid for one (mtime, size) fingerprint."""
+
+    def __init__(self, data_path: Path, fingerprint: Tuple[int, int], offsets: Dict[str, Any]):
+        self.fingerprint = fingerprint
+        self.offsets = offsets
+        with data_path.open("rb") as f:
+            # 空文件无法 mmap
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if fingerprint[1] > 0 else None
+
+    def read(self, symbol: str) -> Optional[bytes]:
+        entry = self.offsets.get(symbol)
+        if entry is None or self.mm is None:
+            return None
+        offset, length = entry
+        return self.mm[offset : offset + length]
+
+    def close(self) -> None:
+        if self.mm is not None:
+            self.mm.close()
+
+
+_MAPPED: Dict[str, _MappedFile] = {}
+_MAPPED_LOCK = threading.Lock()
+
+
+def _get_mapped(data_path: Union[str, Path]) -> Optional[_MappedFile]:
+    path = Path(data_path).resolve()
+    key = str(path)
+    try:
+        fingerprint = _fingerprint(path)
+    except OSError:
+        return None
+
+    mapped = _MAPPED.get(key)
+    if mapped is not None and mapped.fingerprint == fingerprint:
+        return mapped
+
+    with _MAPPED_LOCK:
+        mapped = _MAPPED.get(key)
+        if mapped is not None and mapped.fingerprint == fingerprint:
+            return mapped
+        index = _load_sidecar(path, fingerprint) or build_symbol_index(path)
+        if (index["mtime_ns"], index["size"]) != fingerprint:
+            # 文件在建索引期间被改写，下次调用时重建
+            return None
+        new_mapped = _MappedFile(path, fingerprint, index["offsets"])
+        old = _MAPPED.pop(key, None)
+        if old is not None:
+            old.close()
+        _MAPPED[key] = new_mapped
+        return new_mapped
+
+
+def load_symbol_document(data_path: Union[str, Path], symbol: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the decoded JSON document for ``symbol`` from a merged JSONL file.
+
+    Only the symbol's own line is decoded: its byte range is looked up in the sidecar
+    index (built on first use and rebuilt whenever the file's mtime/size change) and
+    sliced out of a memory-mapped view of the file.
+
+    Args:
+        data_path: Path to a merged JSONL file
+        symbol: Symbol to look up, matched against "Meta Data" -> "2. Symbol"
+
+    Returns:
+        The symbol's document, or None if the file or the symbol is missing
+    """
+    mapped = _get_mapped(data_path)
+    if mapped is None:
+        return _scan_for_symbol(Path(data_path), symbol)
+    raw = mapped.read(symbol)
+    if raw is None:
+        return None
+    doc = json.loads(raw)
+    # 防御：索引与内容不一致时退回逐行扫描
+    if doc.get("Meta Data", {}).get("2. Symbol") != symbol:
+        return _scan_for_symbol(Path(data_path), symbol)
+    return doc
+
+
+def _scan_for_symbol(data_path: Path, symbol: str) -> Optional[Dict[str, Any]]:
+    if not data_path.exists():
+        return None
+    with data_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            doc = json.loads(line)
+            if doc.get("Meta Data", {}).get("2. Symbol") == symbol:
+                return doc
+    return None
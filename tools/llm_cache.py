@@ -0,0 +1,178 @@
+"""
+Record/replay cache for LLM calls.
+
+The chat models of all agents are created with ``cache=get_llm_cache()``. Depending on the
+LLM_CACHE_MODE environment variable the cache:
+    off     (default) is not used at all
+    record  serves responses it has seen before and stores every new response
+    replay  serves stored responses only and raises LLMCacheMiss for anything else (no API calls)
+
+Entries are keyed by a SHA-256 over (model, sampling settings, tool schemas and other call
+parameters, messages) and stored as one JSON file per response under LLM_CACHE_DIR (default
+data/llm_cache):
+    data/llm_cache/ab/ab12...ef.json
+Re-running a date range in record or replay mode with the same ledger state therefore reproduces
+the original run without paying for (or waiting on) the LLM again.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+_PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+CACHE_MODES = ("off", "record", "replay")
+DEFAULT_CACHE_DIR = "data/llm_cache"
+# 不影响模型输出的连接参数，不参与缓存键
+TRANSPORT_KWARGS = {
+    "api_key",
+    "openai_api_key",
+    "base_url",
+    "openai_api_base",
+    "timeout",
+    "request_timeout",
+    "max_retries",
+    "http_client",
+    "http_async_client",
+}
+
+
+class LLMCacheMiss(RuntimeError):
+    """Raised in replay mode when a call has no recorded response."""
+
+
+def _model_and_params(llm_string: str) -> Dict[str, Any]:
+    """
+    Reduce LangChain's llm_string to what determines the response: the model name, its sampling
+    settings (temperature, top_p, max_tokens, ...) and the call parameters (tools, tool_choice,
+    stop, ...). Transport settings (API key, endpoint, timeout, retries, HTTP client) are dropped so
+    that recordings stay valid when those change.
+    """
+    constructor, _, params = llm_string.partition("---")
+    try:
+        kwargs = json.loads(constructor).get("kwargs", {})
+        model = kwargs.get("model_name") or kwargs.get("model")
+        settings = {k: v for k, v in kwargs.items() if k not in TRANSPORT_KWARGS and k not in ("model_name", "model")}
+    except (ValueError, AttributeError):
+        model = constructor
+        settings = {}
+    return {"model": model, "settings": settings, "params": params}
+
+
+class FileLLMCache(BaseCache):
+    """Content-addressed LangChain cache storing one JSON file per recorded response."""
+
+    def __init__(self, cache_dir: Union[str, Path], mode: str = "record"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unsupported LLM cache mode: {mode}")
+        cache_dir = Path(cache_dir)
+        if not cache_dir.is_absolute():
+            cache_dir = _PROJECT_ROOT / cache_dir
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def cache_key(self, prompt: str, llm_string: str) -> str:
+        payload = json.dumps({**_model_and_params(llm_string), "messages": prompt}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self.cache_key(prompt, llm_string)
+        try:
+            with self._entry_path(key).open("r", encoding="utf-8") as f:
+                entry = json.load(f)
+            generations = [
+                ChatGeneration(message=messages_from_dict([gen["message"]])[0], generation_info=gen.get("generation_info"))
+                for gen in entry["generations"]
+            ]
+        except (OSError, ValueError, KeyError):
+            generations = None
+
+        with self._lock:
+            if generations is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if generations is None and self.mode == "replay":
+            model = _model_and_params(llm_string)["model"]
+            raise LLMCacheMiss(f"No recorded LLM response for {model} (key {key}) in {self.cache_dir}")
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.mode != "record":
+            return
+        key = self.cache_key(prompt, llm_string)
+        path = self._entry_path(key)
+        entry = {
+            "model": _model_and_params(llm_string)["model"],
+            "generations": [
+                {"message": message_to_dict(gen.message), "generation_info": gen.generation_info}
+                for gen in return_val
+                if isinstance(gen, ChatGeneration)
+            ],
+        }
+        if len(entry["generations"]) != len(return_val):
+            # 只缓存聊天模型的输出
+            return
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  Could not write LLM cache entry {path}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+
+    def clear(self, **kwargs: Any) -> None:
+        """Delete all recorded responses."""
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+_CACHES: Dict[tuple, FileLLMCache] = {}
+
+
+def get_llm_cache(mode: Optional[str] = None, cache_dir: Optional[str] = None) -> Optional[FileLLMCache]:
+    """
+    Return the process-wide LLM cache for the configured mode, or None when caching is off.
+
+    Args:
+        mode: "off", "record" or "replay"; defaults to the LLM_CACHE_MODE environment variable
+        cache_dir: Cache directory; defaults to LLM_CACHE_DIR or data/llm_cache
+
+    Returns:
+        FileLLMCache to pass as ``cache=`` to the chat model, or None
+    """
+    mode = (mode or os.getenv("LLM_CACHE_MODE") or "off").strip().lower()
+    if mode not in CACHE_MODES:
+        print(f"⚠️  Unknown LLM_CACHE_MODE '{mode}', LLM cache disabled (expected one of {CACHE_MODES})")
+        return None
+    if mode == "off":
+        return None
+    cache_dir = cache_dir or os.getenv("LLM_CACHE_DIR") or DEFAULT_CACHE_DIR
+    key = (mode, str(cache_dir))
+    cache = _CACHES.get(key)
+    if cache is None:
+        cache = FileLLMCache(cache_dir, mode)
+        _CACHES[key] = cache
+        print(f"🗄️  LLM cache: {mode} mode, store {cache.cache_dir}")
+    return cache
@@ -0,0 +1,224 @@
+"""
+Shared per-(market, date) market context for prompt construction.
+
+Every model running the same date needs the same market data in its system prompt: the previous
+timestamp, yesterday's buy/sell prices, today's buy prices and (for A-shares) stock names. This
+module computes that once for the whole symbol universe of the market's merged file and caches it
+under data/market_context/{market}/{date}.json. Prompts then slice the symbols they need out of
+one small file instead of loading the price data in every process. A cached context is rebuilt
+when the merged file it was computed from changes.
+
+The agents' run_date_range prefetches the context of the next date in a worker thread while the
+current date's session runs (prefetch_market_day_context), so loading stays off the critical path.
+
+Usage (precompute a date range before launching several models):
+    python tools/market_context.py --market us --start "2025-10-01 10:00:00" --end "2025-10-31 15:00:00"
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Add project root directory to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from tools.price_store import get_price_store
+from tools.price_tools import (_resolve_merged_file_path_for_date,
+                               get_open_prices, get_stock_name_mapping,
+                               get_trading_calendar, get_yesterday_date,
+                               get_yesterday_open_and_close_price)
+
+CONTEXT_VERSION = 1
+CONTEXT_DIR = Path(project_root) / "data" / "market_context"
+
+# 同一进程内对同一 (market, date) 只构建一次；其他线程等待后直接读缓存
+_BUILD_LOCKS: Dict[Tuple[str, str], threading.Lock] = {}
+_BUILD_LOCKS_GUARD = threading.Lock()
+
+
+def _context_path(market: str, today_date: str) -> Path:
+    # '2025-10-30 10:00:00' -> '2025-10-30_100000.json'
+    safe_date = today_date.replace(" ", "_").replace(":", "")
+    return CONTEXT_DIR / market / f"{safe_date}.json"
+
+
+def _source_fingerprint(merged_file: Path) -> Optional[Dict[str, Any]]:
+    try:
+        stat = merged_file.stat()
+    except OSError:
+        return None
+    return {"path": str(merged_file), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def build_market_day_context(today_date: str, market: str = "us") -> Optional[Dict[str, Any]]:
+    """
+    Compute the market context of one (market, date) for every symbol in the merged file.
+
+    Args:
+        today_date: Trading date/timestamp
+        market: Market type ("us", "cn", or "crypto")
+
+    Returns:
+        Context dict, or None if the merged file does not exist
+    """
+    merged_file = _resolve_merged_file_path_for_date(today_date, market)
+    source = _source_fingerprint(merged_file)
+    store = get_price_store(merged_file)
+    if source is None or store is None:
+        return None
+
+    symbols = list(store.symbols)
+    yesterday_buy, yesterday_sell = get_yesterday_open_and_close_price(today_date, symbols, market=market)
+    return {
+        "version": CONTEXT_VERSION,
+        "market": market,
+        "date": today_date,
+        "yesterday_date": get_yesterday_date(today_date, market=market),
+        "source": source,
+        "yesterday_buy": yesterday_buy,
+        "yesterday_sell": yesterday_sell,
+        "today_buy": get_open_prices(today_date, symbols, market=market),
+        "names": get_stock_name_mapping(market),
+    }
+
+
+def _write_context(path: Path, context: Dict[str, Any]) -> None:
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(context, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️  Could not write market context {path}: {e}")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+
+
+def _read_context(path: Path, source: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            context = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if context.get("version") == CONTEXT_VERSION and context.get("source") == source:
+        return context
+    return None
+
+
+def get_market_day_context(today_date: str, market: str = "us") -> Optional[Dict[str, Any]]:
+    """
+    Return the cached market context for (market, today_date), computing and caching it if needed.
+
+    Args:
+        today_date: Trading date/timestamp
+        market: Market type ("us", "cn", or "crypto")
+
+    Returns:
+        Context dict, or None if the market's merged file does not exist
+    """
+    merged_file = _resolve_merged_file_path_for_date(today_date, market)
+    source = _source_fingerprint(merged_file)
+    if source is None:
+        return None
+
+    path = _context_path(market, today_date)
+    context = _read_context(path, source)
+    if context is not None:
+        return context
+
+    with _BUILD_LOCKS_GUARD:
+        lock = _BUILD_LOCKS.setdefault((market, today_date), threading.Lock())
+    with lock:
+        # 等锁期间可能已由其他线程（如预取任务）构建完成
+        context = _read_context(path, source)
+        if context is None:
+            context = build_market_day_context(today_date, market)
+            if context is not None:
+                _write_context(path, context)
+    return context
+
+
+async def prefetch_market_day_context(today_date: str, market: str = "us") -> None:
+    """
+    Build and cache the market context of ``today_date`` in a worker thread.
+
+    Used to warm the next date while the current session is running. Failures only print a
+    warning; the session then builds the context itself.
+    """
+    try:
+        await asyncio.to_thread(get_market_day_context, today_date, market)
+    except Exception as e:
+        print(f"⚠️  Could not prefetch market context for {market} {today_date}: {e}")
+
+
+def get_prompt_prices(
+    today_date: str, symbols: List[str], market: str = "us"
+) -> Tuple[Dict[str, Optional[float]], Dict[str, Optional[float]], Dict[str, Optional[float]]]:
+    """
+    Yesterday's buy prices, yesterday's sell prices and today's buy prices for ``symbols``.
+
+    Same results as get_yesterday_open_and_close_price + get_open_prices, served from the
+    shared market context.
+
+    Returns:
+        (yesterday_buy_prices, yesterday_sell_prices, today_buy_prices), keyed "{symbol}_price"
+    """
+    context = get_market_day_context(today_date, market)
+    if context is None:
+        yesterday_buy, yesterday_sell = get_yesterday_open_and_close_price(today_date, symbols, market=market)
+        return yesterday_buy, yesterday_sell, get_open_prices(today_date, symbols, market=market)
+
+    def _select(prices: Dict[str, Optional[float]]) -> Dict[str, Optional[float]]:
+        return {f"{sym}_price": prices[f"{sym}_price"] for sym in symbols if f"{sym}_price" in prices}
+
+    return _select(context["yesterday_buy"]), _select(context["yesterday_sell"]), _select(context["today_buy"])
+
+
+def get_context_name_mapping(today_date: str, market: str = "us") -> Dict[str, str]:
+    """Symbol -> name mapping stored in the market context (empty if unavailable)."""
+    context = get_market_day_context(today_date, market)
+    return context.get("names", {}) if context else {}
+
+
+def precompute_market_contexts(market: str, start: str, end: str) -> int:
+    """
+    Build and cache market contexts for every trading date/timestamp in [start, end].
+
+    Args:
+        market: Market type ("us", "cn", or "crypto")
+        start: First date/timestamp (date-only strings select trading days, timestamps select bars)
+        end: Last date/timestamp
+
+    Returns:
+        Number of contexts available after the call
+    """
+    calendar = get_trading_calendar(market, start)
+    if calendar is None:
+        return 0
+    dates = calendar.range(start, end) if " " in start else calendar.trading_days(start, end)
+    count = 0
+    for date in dates:
+        if get_market_day_context(date, market) is not None:
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute shared market contexts for prompts")
+    parser.add_argument("--market", default="us", choices=["us", "cn", "crypto"])
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument("--end", required=True, help="YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS'")
+    args = parser.parse_args()
+
+    n = precompute_market_contexts(args.market, args.start, args.end)
+    print(f"✅ {n} market contexts ready under {CONTEXT_DIR / args.market}")
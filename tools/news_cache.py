@@ -0,0 +1,152 @@
+"""
+On-disk cache for Alpha Vantage NEWS_SENTIMENT responses.
+
+Entries are keyed by a SHA-256 over the request parameters that determine the response
+(tickers, topics, time_from, time_to, sort, limit; never the API key) and stored as one JSON file
+per response under NEWS_CACHE_DIR (default data/news_cache):
+    data/news_cache/ab/ab12...ef.json
+
+A window that ended more than a day ago (in real time) is immutable, so its feed is served from
+disk forever. A window without time_to, or ending in the real present, can still gain articles
+and is refetched once its entry is older than NEWS_CACHE_TTL seconds (default 3600). API errors
+and rate-limit notes are never cached. Set NEWS_CACHE_MODE=off to always call the API.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+_PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+DEFAULT_CACHE_DIR = "data/news_cache"
+DEFAULT_TTL_SECONDS = 3600
+# 结束时间早于 (现在 - 1 天) 的窗口视为历史窗口，结果不再变化（留出文章延迟入库的余量）
+HISTORICAL_MARGIN = timedelta(days=1)
+KEY_FIELDS = ("tickers", "topics", "time_from", "time_to", "sort", "limit")
+
+
+def _parse_av_time(value: Optional[str]) -> Optional[datetime]:
+    """Alpha Vantage time ("YYYYMMDDTHHMM" or "YYYYMMDDTHHMMSS") -> datetime, None if unparsable."""
+    for fmt in ("%Y%m%dT%H%M", "%Y%m%dT%H%M%S"):
+        try:
+            return datetime.strptime(value or "", fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def is_historical_window(time_to: Optional[str], now: Optional[datetime] = None) -> bool:
+    """True when the window ends far enough in the past that its news feed can no longer change."""
+    end = _parse_av_time(time_to)
+    if end is None:
+        return False
+    return end < (now or datetime.now()) - HISTORICAL_MARGIN
+
+
+class NewsCache:
+    """Content-addressed store of NEWS_SENTIMENT feeds, one JSON file per request."""
+
+    def __init__(self, cache_dir: Union[str, Path], ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        cache_dir = Path(cache_dir)
+        if not cache_dir.is_absolute():
+            cache_dir = _PROJECT_ROOT / cache_dir
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(params: Dict[str, Any]) -> str:
+        payload = json.dumps({field: params.get(field) for field in KEY_FIELDS}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return the cached feed for these request parameters, or None on a miss or an expired entry.
+
+        Args:
+            params: NEWS_SENTIMENT request parameters (extra keys such as apikey are ignored)
+
+        Returns:
+            List of news articles as returned by the API, or None
+        """
+        key = self.cache_key(params)
+        feed = None
+        try:
+            with self._entry_path(key).open("r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # 仍在变化的窗口只在 TTL 内有效；历史窗口永久有效
+            if is_historical_window(params.get("time_to")) or time.time() - entry["fetched_at"] < self.ttl_seconds:
+                feed = entry["feed"]
+        except (OSError, ValueError, KeyError, TypeError):
+            feed = None
+
+        with self._lock:
+            if feed is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return feed
+
+    def put(self, params: Dict[str, Any], feed: List[Dict[str, Any]]) -> None:
+        """Store a successfully fetched feed (possibly empty) for these request parameters."""
+        key = self.cache_key(params)
+        path = self._entry_path(key)
+        entry = {
+            "params": {field: params.get(field) for field in KEY_FIELDS},
+            "fetched_at": time.time(),
+            "feed": feed,
+        }
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  Could not write news cache entry {path}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+
+
+_CACHES: Dict[tuple, NewsCache] = {}
+
+
+def get_news_cache(cache_dir: Optional[str] = None) -> Optional[NewsCache]:
+    """
+    Return the process-wide news cache, or None when NEWS_CACHE_MODE=off.
+
+    Args:
+        cache_dir: Cache directory; defaults to NEWS_CACHE_DIR or data/news_cache
+
+    Returns:
+        NewsCache shared by all news tool calls of this process, or None
+    """
+    mode = (os.getenv("NEWS_CACHE_MODE") or "on").strip().lower()
+    if mode == "off":
+        return None
+    if mode != "on":
+        print(f"⚠️  Unknown NEWS_CACHE_MODE '{mode}', using the news cache (expected 'on' or 'off')")
+    cache_dir = cache_dir or os.getenv("NEWS_CACHE_DIR") or DEFAULT_CACHE_DIR
+    try:
+        ttl_seconds = float(os.getenv("NEWS_CACHE_TTL", DEFAULT_TTL_SECONDS))
+    except ValueError:
+        ttl_seconds = DEFAULT_TTL_SECONDS
+    key = (str(cache_dir), ttl_seconds)
+    cache = _CACHES.get(key)
+    if cache is None:
+        cache = NewsCache(cache_dir, ttl_seconds)
+        _CACHES[key] = cache
+        print(f"🗄️  News cache: store {cache.cache_dir} (TTL {ttl_seconds:g}s for windows ending now)")
+    return cache
@@ -0,0 +1,426 @@
+"""
+Offline point-in-time news corpus for backtests.
+
+Alpha Vantage NEWS_SENTIMENT articles are stored in a local SQLite database (NEWS_CORPUS_PATH,
+default data/news_corpus.db) with a full-text index over title and summary (FTS5) and one row per
+article ticker and topic. With NEWS_BACKEND=local, get_market_news answers from this corpus
+instead of the API: only articles with time_published strictly before TODAY_DATE are visible, so
+a run sees the same news every time it is repeated, without network calls or rate limits.
+
+Query semantics follow the API: tickers and topics are comma-separated and an article must match
+all of them; results are sorted latest first. Without tickers and topics, the query text is
+matched against title and summary (any term, ranked by relevance).
+
+Usage:
+    # Bulk-download the news of a universe (or of --tickers / --topics) for a date range
+    python tools/news_corpus.py download --universe us --start 2025-09-01 --end 2025-11-01
+    python tools/news_corpus.py download --topics economy_macro,financial_markets --start 2025-09-01 --end 2025-11-01
+    # Import saved feeds: API responses (.json), article lists, .jsonl files or the news cache
+    python tools/news_corpus.py import data/news_cache
+    python tools/news_corpus.py stats
+    python tools/news_corpus.py search "chip export" --before "2025-10-15 10:00:00" --tickers NVDA
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+# Add project root directory to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+load_dotenv()
+
+DEFAULT_CORPUS_PATH = "data/news_corpus.db"
+API_URL = "https://www.alphavantage.co/query"
+API_MAX_LIMIT = 1000
+
+# Alpha Vantage 返回的主题名称 -> 查询参数中的主题（其余主题按规则转换，例如 "Economy - Monetary" -> economy_monetary）
+TOPIC_KEYS = {
+    "Mergers & Acquisitions": "mergers_and_acquisitions",
+    "Real Estate & Construction": "real_estate",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    time_published TEXT NOT NULL,
+    title TEXT,
+    summary TEXT,
+    source TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_articles_time ON articles(time_published);
+CREATE TABLE IF NOT EXISTS article_tickers (
+    ticker TEXT NOT NULL,
+    article_id INTEGER NOT NULL,
+    PRIMARY KEY (ticker, article_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS article_topics (
+    topic TEXT NOT NULL,
+    article_id INTEGER NOT NULL,
+    PRIMARY KEY (topic, article_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    title, summary, content='articles', content_rowid='id'
+);
+"""
+
+
+def normalize_time(value: Optional[str]) -> Optional[str]:
+    """
+    Convert a time to the corpus format YYYYMMDDTHHMMSS (sortable as text).
+
+    Args:
+        value: Alpha Vantage time ("20250410T0130", "20250410T013000") or "YYYY-MM-DD[ HH:MM:SS]"
+
+    Returns:
+        Time such as "20250410T013000", or None if ``value`` cannot be parsed
+    """
+    for fmt in ("%Y%m%dT%H%M%S", "%Y%m%dT%H%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value or "", fmt).strftime("%Y%m%dT%H%M%S")
+        except ValueError:
+            continue
+    return None
+
+
+def topic_key(topic: str) -> str:
+    """Topic name of an article ("Economy - Monetary") -> API topic parameter ("economy_monetary")."""
+    return TOPIC_KEYS.get(topic) or re.sub(r"[^a-z0-9]+", "_", topic.lower()).strip("_")
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+class NewsCorpus:
+    """SQLite store of news articles with FTS5 search and point-in-time filtering."""
+
+    def __init__(self, db_path: str):
+        path = Path(db_path)
+        if not path.is_absolute():
+            path = Path(project_root) / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = path
+        # 同一连接在 MCP 服务端的工作线程间共享，访问由锁串行化
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def add_articles(self, articles: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert articles in Alpha Vantage feed format; articles already stored (same URL) are skipped.
+
+        Returns:
+            Number of new articles
+        """
+        added = 0
+        with self._lock, self._conn:
+            for article in articles:
+                url = article.get("url")
+                published = normalize_time(article.get("time_published"))
+                if not url or not published:
+                    continue
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO articles (url, time_published, title, summary, source, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        url,
+                        published,
+                        article.get("title"),
+                        article.get("summary"),
+                        article.get("source"),
+                        json.dumps(article, ensure_ascii=False),
+                    ),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                article_id = cursor.lastrowid
+                self._conn.execute(
+                    "INSERT INTO articles_fts (rowid, title, summary) VALUES (?, ?, ?)",
+                    (article_id, article.get("title") or "", article.get("summary") or ""),
+                )
+                tickers = {t.get("ticker", "").upper() for t in article.get("ticker_sentiment") or []} - {""}
+                topics = {topic_key(t.get("topic", "")) for t in article.get("topics") or []} - {""}
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO article_tickers (ticker, article_id) VALUES (?, ?)",
+                    [(ticker, article_id) for ticker in tickers],
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO article_topics (topic, article_id) VALUES (?, ?)",
+                    [(topic, article_id) for topic in topics],
+                )
+                added += 1
+        return added
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        tickers: Optional[str] = None,
+        topics: Optional[str] = None,
+        time_from: Optional[str] = None,
+        time_to: Optional[str] = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """
+        Find articles published in [time_from, time_to).
+
+        Args:
+            query: Free-text query, used when neither tickers nor topics are given
+            tickers: Comma-separated symbols, all of which an article must mention (e.g. "COIN,CRYPTO:BTC")
+            topics: Comma-separated API topics, all of which an article must cover (e.g. "technology,ipo")
+            time_from: Earliest publication time (inclusive), any format accepted by normalize_time
+            time_to: Publication time bound (exclusive): only news visible before this time is returned
+            limit: Maximum number of articles
+
+        Returns:
+            Articles in Alpha Vantage feed format, latest first (or most relevant first for text queries)
+        """
+        where, args = [], []
+        if time_from:
+            where.append("a.time_published >= ?")
+            args.append(normalize_time(time_from) or time_from)
+        if time_to:
+            where.append("a.time_published < ?")
+            args.append(normalize_time(time_to) or time_to)
+        for ticker in _split(tickers):
+            where.append("a.id IN (SELECT article_id FROM article_tickers WHERE ticker = ?)")
+            args.append(ticker.upper())
+        for topic in _split(topics):
+            where.append("a.id IN (SELECT article_id FROM article_topics WHERE topic = ?)")
+            args.append(topic_key(topic))
+
+        terms = re.findall(r"\w+", query or "") if not (tickers or topics) else []
+        if terms:
+            # 任一词命中即可，按 bm25 相关度排序
+            match = " OR ".join(f'"{term}"' for term in terms)
+            sql = (
+                "SELECT a.data FROM articles_fts JOIN articles a ON a.id = articles_fts.rowid "
+                f"WHERE articles_fts MATCH ?{''.join(' AND ' + w for w in where)} "
+                "ORDER BY bm25(articles_fts), a.time_published DESC LIMIT ?"
+            )
+            args = [match, *args, limit]
+        else:
+            sql = (
+                f"SELECT a.data FROM articles a{' WHERE ' + ' AND '.join(where) if where else ''} "
+                "ORDER BY a.time_published DESC LIMIT ?"
+            )
+            args.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, first, last = self._conn.execute(
+                "SELECT COUNT(*), MIN(time_published), MAX(time_published) FROM articles"
+            ).fetchone()
+            tickers = self._conn.execute("SELECT COUNT(DISTINCT ticker) FROM article_tickers").fetchone()[0]
+        return {"articles": count, "first": first, "last": last, "tickers": tickers, "path": str(self.db_path)}
+
+
+_CORPORA: Dict[str, NewsCorpus] = {}
+_CORPORA_LOCK = threading.Lock()
+
+
+def get_news_corpus(db_path: Optional[str] = None) -> NewsCorpus:
+    """
+    Return the process-wide corpus used by the local news backend.
+
+    Args:
+        db_path: Database file; defaults to NEWS_CORPUS_PATH or data/news_corpus.db
+
+    Raises:
+        FileNotFoundError: if the corpus has not been built yet
+    """
+    db_path = db_path or os.getenv("NEWS_CORPUS_PATH") or DEFAULT_CORPUS_PATH
+    with _CORPORA_LOCK:
+        corpus = _CORPORA.get(db_path)
+        if corpus is None:
+            path = Path(db_path) if Path(db_path).is_absolute() else Path(project_root) / db_path
+            if not path.exists():
+                raise FileNotFoundError(
+                    f"News corpus {path} not found. Build it with: python tools/news_corpus.py download --universe us --start ... --end ..."
+                )
+            corpus = NewsCorpus(db_path)
+            _CORPORA[db_path] = corpus
+    return corpus
+
+
+def universe_tickers(universe: str) -> List[str]:
+    """Alpha Vantage tickers of a trading universe ("us": NASDAQ 100, "crypto": the crypto agent's coins)."""
+    if universe == "us":
+        from tools.price_tools import all_nasdaq_100_symbols
+
+        return list(all_nasdaq_100_symbols)
+    if universe == "crypto":
+        from agent.base_agent_crypto.base_agent_crypto import BaseAgentCrypto
+
+        # "BTC-USDT" -> "CRYPTO:BTC"
+        return [f"CRYPTO:{symbol.split('-')[0]}" for symbol in BaseAgentCrypto.DEFAULT_CRYPTO_SYMBOLS]
+    raise ValueError(f"Unknown universe: {universe}")
+
+
+def _fetch_feed(api_key: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    response = requests.get(API_URL, params={"function": "NEWS_SENTIMENT", "apikey": api_key, **params}, timeout=60)
+    response.raise_for_status()
+    data = response.json()
+    if "Error Message" in data:
+        raise RuntimeError(f"Alpha Vantage API error: {data['Error Message']}")
+    for key in ("Note", "Information"):
+        if key in data:
+            # 配额用尽或请求过快
+            raise RuntimeError(f"Alpha Vantage API {key.lower()}: {data[key]}")
+    return data.get("feed", [])
+
+
+def download_news(
+    corpus: NewsCorpus,
+    start: str,
+    end: str,
+    tickers: List[str],
+    topics: List[str],
+    window_days: int = 30,
+    pause: float = 1.0,
+) -> int:
+    """
+    Download the news of each ticker and each topic between start and end into the corpus.
+
+    Windows are requested oldest first with the API's maximum page size; a full page continues
+    from the time of its last article, so busy tickers are not truncated.
+
+    Returns:
+        Number of new articles
+    """
+    api_key = os.getenv("ALPHAADVANTAGE_API_KEY")
+    if not api_key:
+        raise ValueError("Alpha Vantage API key not provided! Please set ALPHAADVANTAGE_API_KEY environment variable.")
+    start_dt = datetime.strptime(normalize_time(start), "%Y%m%dT%H%M%S")
+    end_dt = datetime.strptime(normalize_time(end), "%Y%m%dT%H%M%S")
+
+    jobs: List[Tuple[str, str]] = [("tickers", t) for t in tickers] + [("topics", t) for t in topics]
+    added = 0
+    for n, (field, value) in enumerate(jobs, 1):
+        job_added = 0
+        window_start = start_dt
+        while window_start < end_dt:
+            window_end = min(window_start + timedelta(days=window_days), end_dt)
+            time_from = window_start.strftime("%Y%m%dT%H%M")
+            while True:
+                feed = _fetch_feed(
+                    api_key,
+                    {
+                        field: value,
+                        "time_from": time_from,
+                        "time_to": window_end.strftime("%Y%m%dT%H%M"),
+                        "sort": "EARLIEST",
+                        "limit": API_MAX_LIMIT,
+                    },
+                )
+                job_added += corpus.add_articles(feed)
+                time.sleep(pause)
+                last = normalize_time(feed[-1].get("time_published")) if feed else None
+                if len(feed) < API_MAX_LIMIT or not last or last[:13] <= time_from:
+                    break
+                time_from = last[:13]
+            window_start = window_end
+        added += job_added
+        print(f"[{n}/{len(jobs)}] {field}={value}: {job_added} new articles")
+    return added
+
+
+def _load_articles(path: str) -> List[Dict[str, Any]]:
+    """Articles of a saved API response / news cache entry ({"feed": [...]}), article list or .jsonl file."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        data = json.load(f)
+    if isinstance(data, dict):
+        return data.get("feed") or []
+    return data if isinstance(data, list) else []
+
+
+def import_news(corpus: NewsCorpus, paths: List[str]) -> int:
+    """Import articles from files or directories (searched recursively for .json/.jsonl files)."""
+    files: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += glob.glob(os.path.join(path, "**", "*.json"), recursive=True)
+            files += glob.glob(os.path.join(path, "**", "*.jsonl"), recursive=True)
+        else:
+            files.append(path)
+    added = 0
+    for path in sorted(files):
+        try:
+            added += corpus.add_articles(_load_articles(path))
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Skipping {path}: {e}")
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the offline news corpus")
+    parser.add_argument("--db", default=None, help="Corpus database (default: NEWS_CORPUS_PATH or data/news_corpus.db)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    download = sub.add_parser("download", help="Download news from Alpha Vantage")
+    download.add_argument("--universe", choices=["us", "crypto"], default=None)
+    download.add_argument("--tickers", default="", help="Comma-separated tickers, e.g. AAPL,CRYPTO:BTC")
+    download.add_argument("--topics", default="", help="Comma-separated topics, e.g. economy_macro,financial_markets")
+    download.add_argument("--start", required=True, help="YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS'")
+    download.add_argument("--end", required=True, help="YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS'")
+    download.add_argument("--window-days", type=int, default=30, help="Days per API request window")
+    download.add_argument("--pause", type=float, default=1.0, help="Seconds between API requests")
+
+    importer = sub.add_parser("import", help="Import saved feeds (.json/.jsonl files or directories)")
+    importer.add_argument("paths", nargs="+")
+
+    sub.add_parser("stats", help="Show corpus size and time range")
+
+    search = sub.add_parser("search", help="Query the corpus like get_market_news with NEWS_BACKEND=local")
+    search.add_argument("query", nargs="?", default="")
+    search.add_argument("--tickers", default=None)
+    search.add_argument("--topics", default=None)
+    search.add_argument("--before", default=None, help="Only articles published before this time")
+    search.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = NewsCorpus(args.db or os.getenv("NEWS_CORPUS_PATH") or DEFAULT_CORPUS_PATH)
+    if args.command == "download":
+        tickers = (universe_tickers(args.universe) if args.universe else []) + _split(args.tickers)
+        topics = _split(args.topics)
+        if not tickers and not topics:
+            parser.error("download needs --universe, --tickers or --topics")
+        n = download_news(corpus, args.start, args.end, tickers, topics, args.window_days, args.pause)
+        print(f"✅ {n} new articles in {corpus.db_path}")
+    elif args.command == "import":
+        n = import_news(corpus, args.paths)
+        print(f"✅ {n} new articles in {corpus.db_path}")
+    elif args.command == "stats":
+        print(json.dumps(corpus.stats(), indent=2))
+    else:
+        start = time.perf_counter()
+        articles = corpus.search(args.query, args.tickers, args.topics, time_to=args.before, limit=args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for article in articles:
+            print(f"{article.get('time_published')}  {article.get('title')}")
+        print(f"🔎 {len(articles)} articles in {elapsed_ms:.1f} ms")
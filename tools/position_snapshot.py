@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from tools.price_store import _normalize_timestamp_str, _parse_timestamp_to_dt
+
+SNAPSHOT_FILENAME = "latest.json"
+SNAPSHOT_VERSION = 2
+
+
+def snapshot_path_for(position_file: Path) -> Path:
+    """position/position.jsonl -> position/latest.json"""
+    return Path(position_file).with_name(SNAPSHOT_FILENAME)
+
+
+def _empty_snapshot() -> Dict[str, Any]:
+    return {
+        "version": SNAPSHOT_VERSION,
+        # 已折叠进快照的账本字节数（总是停在完整行的末尾）
+        "ledger_offset": 0,
+        # 最后一行已折叠记录的长度和 CRC，用于发现账本被重写
+        "last_line_len": 0,
+        "last_line_crc": 0,
+        "max_id": -1,
+        "latest": None,
+        # 账本日期是否单调不减；出现乱序记录后查询交给账本扫描
+        "ordered": True,
+        # 最新日期的明细: {"date", "last_id", "positions", "nonempty_id", "nonempty_positions", "buys": {symbol: amount}}
+        "current": None,
+        # 最新日期之前一个日期的最后一条记录: {"date", "last_id", "positions"}
+        "previous": None,
+        # 最新日期之前最近的非空持仓: {"date", "id", "positions"}
+        "earlier_nonempty": None,
+    }
+
+
+def _date_entry(date: str) -> Dict[str, Any]:
+    return {"date": date, "last_id": -1, "positions": {}, "nonempty_id": None, "nonempty_positions": {}, "buys": {}}
+
+
+def _fold_record(snapshot: Dict[str, Any], doc: Dict[str, Any]) -> None:
+    """Apply one ledger record to the snapshot, mirroring the selection rules of the ledger scans."""
+    date = doc.get("date")
+    if not date:
+        return
+    current_id = doc.get("id", -1)
+    positions = doc.get("positions", {})
+
+    entry = snapshot["current"]
+    if entry is None or date > entry["date"]:
+        # 进入新的日期：旧日期只保留查询需要的摘要
+        if entry is not None:
+            snapshot["previous"] = {"date": entry["date"], "last_id": entry["last_id"], "positions": entry["positions"]}
+            if entry["nonempty_id"] is not None:
+                snapshot["earlier_nonempty"] = {
+                    "date": entry["date"],
+                    "id": entry["nonempty_id"],
+                    "positions": entry["nonempty_positions"],
+                }
+        entry = _date_entry(date)
+        snapshot["current"] = entry
+    elif date < entry["date"]:
+        snapshot["ordered"] = False
+
+    if date == entry["date"]:
+        # 同一日期取 id 最大的记录；id 相同时保留文件中靠前的一条
+        if current_id > entry["last_id"]:
+            entry["last_id"] = current_id
+            entry["positions"] = positions
+        if positions:
+            sort_id = doc.get("id", 0)
+            if entry["nonempty_id"] is None or sort_id > entry["nonempty_id"]:
+                entry["nonempty_id"] = sort_id
+                entry["nonempty_positions"] = positions
+
+        this_action = doc.get("this_action", {})
+        if this_action.get("action") == "buy":
+            symbol = this_action.get("symbol")
+            entry["buys"][symbol] = entry["buys"].get(symbol, 0) + this_action.get("amount", 0)
+
+    if current_id > snapshot["max_id"]:
+        snapshot["max_id"] = current_id
+    snapshot["latest"] = doc
+
+
+def _load_snapshot_file(position_file: Path, ledger_size: int) -> Optional[Dict[str, Any]]:
+    try:
+        with snapshot_path_for(position_file).open("r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    offset = snapshot.get("ledger_offset", 0)
+    if offset > ledger_size:
+        return None
+    # 账本被截断或重写时，快照最后折叠的那一行必须仍在原位置
+    line_len = snapshot.get("last_line_len", 0)
+    if line_len > offset:
+        return None
+    if line_len:
+        with position_file.open("rb") as f:
+            f.seek(offset - line_len)
+            if zlib.crc32(f.read(line_len)) != snapshot.get("last_line_crc"):
+                return None
+    return snapshot
+
+
+def _write_snapshot(position_file: Path, snapshot: Dict[str, Any]) -> None:
+    """Atomically replace latest.json (temp file + rename) so readers never see a partial snapshot."""
+    path = snapshot_path_for(position_file)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️  Could not write position snapshot {path}: {e}")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+
+
+def refresh_position_snapshot(position_file: Path) -> Optional[Dict[str, Any]]:
+    """
+    Return an up-to-date snapshot of ``position_file`` and persist it as position/latest.json.
+
+    The stored snapshot is reused when its ledger offset still matches the ledger. Lines appended
+    since then are folded in incrementally. If the ledger was truncated or rewritten, the snapshot
+    is rebuilt from scratch.
+
+    Args:
+        position_file: Path to position.jsonl
+
+    Returns:
+        Snapshot dict, or None if the ledger does not exist
+    """
+    position_file = Path(position_file)
+    try:
+        ledger_size = position_file.stat().st_size
+    except OSError:
+        return None
+
+    snapshot = _load_snapshot_file(position_file, ledger_size)
+    if snapshot is None:
+        snapshot = _empty_snapshot()
+    offset = snapshot["ledger_offset"]
+    if offset == ledger_size:
+        return snapshot
+
+    with position_file.open("rb") as f:
+        f.seek(offset)
+        tail = f.read(ledger_size - offset)
+    # 只折叠以换行结尾的完整行，未写完的最后一行留给下次
+    complete = tail[: tail.rfind(b"\n") + 1]
+    if not complete:
+        return snapshot
+
+    for raw in complete.splitlines(keepends=True):
+        if raw.strip():
+            try:
+                _fold_record(snapshot, json.loads(raw))
+            except Exception:
+                pass
+        offset += len(raw)
+        snapshot["last_line_len"] = len(raw)
+        snapshot["last_line_crc"] = zlib.crc32(raw)
+    snapshot["ledger_offset"] = offset
+
+    _write_snapshot(position_file, snapshot)
+    return snapshot
+
+
+def _covers(snapshot: Dict[str, Any], today_date: str) -> bool:
+    """Whether the snapshot can answer queries for ``today_date`` (the latest ledger date or later)."""
+    current = snapshot["current"]
+    return snapshot["ordered"] and (current is None or today_date >= current["date"])
+
+
+def snapshot_latest_position(
+    snapshot: Dict[str, Any], today_date: str, prev_date: str
+) -> Optional[Tuple[Dict[str, float], int]]:
+    """
+    Same selection as get_latest_position: today's last record, else the previous day's, else the latest earlier non-empty one.
+
+    Returns:
+        (positions, max_id), or None if the snapshot does not cover ``today_date`` (scan the ledger instead)
+    """
+    if not _covers(snapshot, today_date):
+        return None
+    current = snapshot["current"]
+    if current is None:
+        return {}, -1
+    previous = snapshot["previous"]
+
+    if today_date == current["date"] and current["last_id"] >= 0 and current["positions"]:
+        return current["positions"], current["last_id"]
+
+    prev = None
+    for entry in (current, previous):
+        if entry is not None and entry["date"] == prev_date and entry["date"] < today_date:
+            prev = entry
+    if prev is None and previous is not None and prev_date < previous["date"]:
+        # 前一交易日早于快照保留的日期
+        return None
+    max_id_prev = prev["last_id"] if prev else -1
+    positions_prev = prev["positions"] if prev else {}
+    if max_id_prev >= 0 and positions_prev:
+        return positions_prev, max_id_prev
+
+    if today_date > current["date"] and current["nonempty_id"] is not None:
+        return current["nonempty_positions"], current["nonempty_id"]
+    earlier = snapshot["earlier_nonempty"]
+    if earlier is not None:
+        return earlier["positions"], earlier["id"]
+
+    return positions_prev, max_id_prev
+
+
+def snapshot_init_position(snapshot: Dict[str, Any], today_date: str) -> Optional[Dict[str, float]]:
+    """Same selection as get_today_init_position: the last record of the latest date before ``today_date``; None if not covered."""
+    if not _covers(snapshot, today_date):
+        return None
+    current = snapshot["current"]
+    if current is None:
+        return {}
+    if today_date > current["date"]:
+        return current["positions"]
+    previous = snapshot["previous"]
+    return previous["positions"] if previous else {}
+
+
+def snapshot_buy_amount(snapshot: Dict[str, Any], today_date: str, symbol: str) -> Optional[int]:
+    """Total amount of ``symbol`` bought on ``today_date`` (used for the A-share T+1 check); None if not covered."""
+    if not _covers(snapshot, today_date):
+        return None
+    current = snapshot["current"]
+    if current is None or current["date"] != today_date:
+        return 0
+    return current["buys"].get(symbol, 0)
@@ -0,0 +1,338 @@
+import bisect
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+def _normalize_timestamp_str(ts: str) -> str:
+    """
+    Normalize timestamp string to zero-padded HH for robust string/chrono comparisons.
+    - If ts has time part like 'YYYY-MM-DD H:MM:SS', pad hour to 'HH'.
+    - If ts is date-only, return as-is.
+    """
+    try:
+        if " " not in ts:
+            return ts
+        date_part, time_part = ts.split(" ", 1)
+        parts = time_part.split(":")
+        if len(parts) != 3:
+            return ts
+        hour, minute, second = parts
+        hour = hour.zfill(2)
+        return f"{date_part} {hour}:{minute}:{second}"
+    except Exception:
+        return ts
+
+
+def _parse_timestamp_to_dt(ts: str) -> datetime:
+    """
+    Parse timestamp string to datetime, supporting both date-only and datetime.
+    Assumes ts is already normalized if time exists.
+    """
+    if " " in ts:
+        return datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")
+    return datetime.strptime(ts, "%Y-%m-%d")
+
+
+def _to_datetime64(ts: str) -> np.datetime64:
+    """Convert a 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' string to second-resolution datetime64."""
+    return np.datetime64(_normalize_timestamp_str(ts).replace(" ", "T"), "s")
+
+
+class TradingCalendar:
+    """
+    Sorted trading-time axis of one merged file.
+
+    Holds the timestamps both as a datetime64[s] array (for O(log n) bisection) and as the
+    original strings (for returning values in the same format the data and ledgers use).
+    Date-only query strings are compared as midnight of that day.
+    """
+
+    def __init__(self, times: np.ndarray, timestamps: List[str]):
+        self.times = times
+        self.timestamps = timestamps
+        self._index: Dict[str, int] = {ts: i for i, ts in enumerate(timestamps)}
+        # Also index zero-padded variants so lookups tolerate 'H:MM:SS' vs 'HH:MM:SS'
+        for i, ts in enumerate(timestamps):
+            self._index.setdefault(_normalize_timestamp_str(ts), i)
+        self.days: List[str] = sorted({ts.split(" ", 1)[0] for ts in timestamps})
+        self._day_set = set(self.days)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def index(self, ts: str) -> Optional[int]:
+        """Return the position of an exact timestamp, or None if it is not on the calendar."""
+        idx = self._index.get(ts)
+        if idx is None:
+            idx = self._index.get(_normalize_timestamp_str(ts))
+        return idx
+
+    def contains(self, ts: str) -> bool:
+        return self.index(ts) is not None
+
+    def has_date(self, date: str) -> bool:
+        """True if ``date`` is on the calendar or is the date part of any intraday timestamp."""
+        return date in self._day_set or self.contains(date)
+
+    def prev_index(self, ts: str) -> Optional[int]:
+        pos = int(np.searchsorted(self.times, _to_datetime64(ts), side="left"))
+        return pos - 1 if pos > 0 else None
+
+    def prev(self, ts: str) -> Optional[str]:
+        """Latest timestamp strictly earlier than ``ts``, or None."""
+        idx = self.prev_index(ts)
+        return self.timestamps[idx] if idx is not None else None
+
+    def next(self, ts: str) -> Optional[str]:
+        """Earliest timestamp strictly later than ``ts``, or None."""
+        pos = int(np.searchsorted(self.times, _to_datetime64(ts), side="right"))
+        return self.timestamps[pos] if pos < len(self.timestamps) else None
+
+    def range(self, start: str, end: str, include_start: bool = True) -> List[str]:
+        """Timestamps within [start, end] (or (start, end] when ``include_start`` is False)."""
+        lo = int(np.searchsorted(self.times, _to_datetime64(start), side="left" if include_start else "right"))
+        hi = int(np.searchsorted(self.times, _to_datetime64(end), side="right"))
+        return self.timestamps[lo:hi]
+
+    def trading_days(self, start_date: str, end_date: str, include_start: bool = True) -> List[str]:
+        """Distinct 'YYYY-MM-DD' days with at least one timestamp, within [start_date, end_date]."""
+        start_date = start_date.split(" ", 1)[0]
+        end_date = end_date.split(" ", 1)[0]
+        lo = bisect.bisect_left(self.days, start_date) if include_start else bisect.bisect_right(self.days, start_date)
+        hi = bisect.bisect_right(self.days, end_date)
+        return self.days[lo:hi]
+
+
+class PriceStore:
+    """
+    Columnar in-memory view of one merged.jsonl file.
+
+    The file is parsed once into:
+      - a sorted timestamp axis (``times`` as datetime64[s], ``timestamps`` as the original strings)
+      - per-field float64 matrices of shape (n_symbols, n_timestamps) for open/high/low/close/volume,
+        with NaN where the source bar has no value
+      - a boolean ``present`` matrix marking which (symbol, timestamp) bars exist in the source
+
+    Lookups by (symbol, timestamp) are O(1) dict + array indexing; calendar walks go through
+    ``calendar`` (a TradingCalendar) in O(log n).
+    """
+
+    FIELDS = ("open", "high", "low", "close", "volume")
+    FIELD_KEYS = {
+        "open": "1. buy price",
+        "high": "2. high",
+        "low": "3. low",
+        "close": "4. sell price",
+        "volume": "5. volume",
+    }
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        stat = self.path.stat()
+        self.fingerprint: Tuple[int, int] = (stat.st_mtime_ns, stat.st_size)
+
+        self.series_key: Optional[str] = None
+        self.symbols: List[str] = []
+        self.names: Dict[str, str] = {}
+        self.timestamps: List[str] = []
+        self.times: np.ndarray = np.array([], dtype="datetime64[s]")
+        self.columns: Dict[str, np.ndarray] = {}
+        self.present: np.ndarray = np.zeros((0, 0), dtype=bool)
+
+        self.calendar = TradingCalendar(self.times, self.timestamps)
+
+        self._symbol_index: Dict[str, int] = {}
+
+        self._load()
+
+    def _load(self) -> None:
+        docs: List[Tuple[str, Dict[str, dict]]] = []
+        all_timestamps = set()
+
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    doc = json.loads(line)
+                except Exception:
+                    continue
+                if not isinstance(doc, dict):
+                    continue
+                meta = doc.get("Meta Data", {})
+                sym = meta.get("2. Symbol")
+                if not sym or sym in self._symbol_index:
+                    continue
+                # 查找所有以 "Time Series" 开头的键
+                series = None
+                for key, value in doc.items():
+                    if key.startswith("Time Series"):
+                        if self.series_key is None:
+                            self.series_key = key
+                        series = value
+                        break
+                if not isinstance(series, dict):
+                    series = {}
+                name = meta.get("2.1. Name", "")
+                if name:
+                    self.names[sym] = name
+                self._symbol_index[sym] = len(self.symbols)
+                self.symbols.append(sym)
+                docs.append((sym, series))
+                all_timestamps.update(series.keys())
+
+        parsed = []
+        for ts in all_timestamps:
+            try:
+                parsed.append((_to_datetime64(ts), ts))
+            except ValueError:
+                continue
+        parsed.sort()
+
+        self.timestamps = [ts for _, ts in parsed]
+        self.times = np.array([t for t, _ in parsed], dtype="datetime64[s]")
+        self.calendar = TradingCalendar(self.times, self.timestamps)
+
+        shape = (len(self.symbols), len(self.timestamps))
+        self.columns = {field: np.full(shape, np.nan, dtype=np.float64) for field in self.FIELDS}
+        self.present = np.zeros(shape, dtype=bool)
+
+        for row, (_, series) in enumerate(docs):
+            for ts, bar in series.items():
+                col = self.calendar.index(ts)
+                if col is None or not isinstance(bar, dict):
+                    continue
+                self.present[row, col] = True
+                for field, key in self.FIELD_KEYS.items():
+                    val = bar.get(key)
+                    if val is None:
+                        continue
+                    try:
+                        self.columns[field][row, col] = float(val)
+                    except (TypeError, ValueError):
+                        continue
+
+    @property
+    def is_daily(self) -> bool:
+        return self.series_key == "Time Series (Daily)"
+
+    def has_symbol(self, symbol: str) -> bool:
+        return symbol in self._symbol_index
+
+    def timestamp_index(self, ts: str) -> Optional[int]:
+        """Return the column index for an exact timestamp, or None if it is not on the axis."""
+        return self.calendar.index(ts)
+
+    def has_bar(self, symbol: str, ts: str) -> bool:
+        row = self._symbol_index.get(symbol)
+        col = self.timestamp_index(ts)
+        if row is None or col is None:
+            return False
+        return bool(self.present[row, col])
+
+    def value(self, symbol: str, ts: str, field: str) -> Optional[float]:
+        """Return one field of one bar as float, or None if the bar or the value is missing."""
+        row = self._symbol_index.get(symbol)
+        col = self.timestamp_index(ts)
+        if row is None or col is None:
+            return None
+        val = self.columns[field][row, col]
+        return None if np.isnan(val) else float(val)
+
+    def bar(self, symbol: str, ts: str) -> Optional[Dict[str, Optional[float]]]:
+        """Return {field: value} for one bar, or None if the symbol has no bar at ``ts``."""
+        row = self._symbol_index.get(symbol)
+        col = self.timestamp_index(ts)
+        if row is None or col is None or not self.present[row, col]:
+            return None
+        out: Dict[str, Optional[float]] = {}
+        for field in self.FIELDS:
+            val = self.columns[field][row, col]
+            out[field] = None if np.isnan(val) else float(val)
+        return out
+
+    def field_at(self, ts: str, symbols: List[str], field: str) -> Dict[str, Optional[float]]:
+        """
+        Vectorized cross-section of one field at one timestamp.
+
+        Returns {symbol: value} for every requested symbol that has a bar at ``ts``;
+        symbols without a bar there are omitted, missing values inside a bar are None.
+        """
+        col = self.timestamp_index(ts)
+        if col is None:
+            return {}
+        out: Dict[str, Optional[float]] = {}
+        # One C-level slice per call; the per-symbol loop then works on plain Python floats
+        column = self.columns[field][:, col].tolist()
+        present = self.present[:, col].tolist()
+        for sym in symbols:
+            row = self._symbol_index.get(sym)
+            if row is None or not present[row]:
+                continue
+            val = column[row]
+            out[sym] = None if val != val else val
+        return out
+
+
+    def history(
+        self, symbol: str, start: str, end: str, fields: Tuple[str, ...] = FIELDS
+    ) -> Optional[Dict[str, list]]:
+        """
+        Columnar slice of one symbol over [start, end].
+
+        Returns {"dates": [...], field: [...], ...} restricted to timestamps where the symbol
+        has a bar (missing values are None), or None if the symbol is unknown.
+        """
+        row = self._symbol_index.get(symbol)
+        if row is None:
+            return None
+        lo = int(np.searchsorted(self.times, _to_datetime64(start), side="left"))
+        hi = int(np.searchsorted(self.times, _to_datetime64(end), side="right"))
+        cols = np.flatnonzero(self.present[row, lo:hi]) + lo
+        out: Dict[str, list] = {"dates": [self.timestamps[c] for c in cols]}
+        for field in fields:
+            values = self.columns[field][row, cols]
+            out[field] = [None if v != v else v for v in values.tolist()]
+        return out
+
+_STORES: Dict[str, PriceStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_price_store(path: Union[str, Path]) -> Optional[PriceStore]:
+    """
+    Return the process-wide PriceStore for ``path``, loading it on first use.
+
+    The cached store is reused while the file's (mtime, size) fingerprint is unchanged and
+    transparently rebuilt after the merged file is regenerated. Returns None if the file is missing.
+    """
+    key = str(Path(path).resolve())
+    try:
+        stat = os.stat(key)
+    except OSError:
+        _STORES.pop(key, None)
+        return None
+    fingerprint = (stat.st_mtime_ns, stat.st_size)
+
+    store = _STORES.get(key)
+    if store is not None and store.fingerprint == fingerprint:
+        return store
+
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None or store.fingerprint != fingerprint:
+            store = PriceStore(key)
+            _STORES[key] = store
+    return store
+
+
+def clear_price_stores() -> None:
+    """Drop all cached stores (mainly useful after rewriting data files in-process)."""
+    with _STORES_LOCK:
+        _STORES.clear()
@@ -14,34 +14,24 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 from tools.general_tools import get_config_value
+from tools.position_snapshot import (refresh_position_snapshot,
+                                     snapshot_init_position,
+                                     snapshot_latest_position)
+from tools.price_store import (TradingCalendar, _normalize_timestamp_str,
+                               _parse_timestamp_to_dt, get_price_store)
 
-def _normalize_timestamp_str(ts: str) -> str:
+def _previous_timestamp_fallback(input_dt: datetime, date_only: bool) -> str:
     """
-    Normalize timestamp string to zero-padded HH for robust string/chrono comparisons.
-    - If ts has time part like 'YYYY-MM-DD H:MM:SS', pad hour to 'HH'.
-    - If ts is date-only, return as-is.
+    无法从行情数据确定上一个时间点时的回退逻辑：
+    日线回退到上一个工作日，小时线回退一小时。
     """
-    try:
-        if " " not in ts:
-            return ts
-        date_part, time_part = ts.split(" ", 1)
-        parts = time_part.split(":")
-        if len(parts) != 3:
-            return ts
-        hour, minute, second = parts
-        hour = hour.zfill(2)
-        return f"{date_part} {hour}:{minute}:{second}"
-    except Exception:
-        return ts
-
-def _parse_timestamp_to_dt(ts: str) -> datetime:
-    """
-    Parse timestamp string to datetime, supporting both date-only and datetime.
-    Assumes ts is already normalized if time exists.
-    """
-    if " " in ts:
-        return datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")
-    return datetime.strptime(ts, "%Y-%m-%d")
+    if date_only:
+        yesterday_dt = input_dt - timedelta(days=1)
+        while yesterday_dt.weekday() >= 5:
+            yesterday_dt -= timedelta(days=1)
+        return yesterday_dt.strftime("%Y-%m-%d")
+    yesterday_dt = input_dt - timedelta(hours=1)
+    return yesterday_dt.strftime("%Y-%m-%d %H:%M:%S")
 
 
 def get_market_type() -> str:
@@ -264,6 +254,28 @@ def _resolve_merged_file_path_for_date(
     return get_merged_file_path(market)
 
 
+def get_trading_calendar(
+    market: str = "us", today_date: Optional[str] = None, merged_path: Optional[str] = None
+) -> Optional[TradingCalendar]:
+    """Get the cached trading calendar for a market.
+
+    The calendar is built once per process from the market's merged file and is rebuilt
+    automatically when that file's mtime/size changes.
+
+    Args:
+        market: Market type ("us", "cn", or "crypto")
+        today_date: Optional date used to pick the granularity; A-shares timestamps with a
+            time part select the hourly file
+        merged_path: Optional custom merged.jsonl path, takes precedence
+
+    Returns:
+        TradingCalendar, or None if the merged file does not exist
+    """
+    merged_file = _resolve_merged_file_path_for_date(today_date, market, merged_path)
+    store = get_price_store(merged_file)
+    return store.calendar if store is not None else None
+
+
 def is_trading_day(date: str, market: str = "us") -> bool:
     """Check if a given date is a trading day by looking up merged.jsonl.
 
@@ -307,27 +319,9 @@ def is_trading_day(date: str, market: str = "us") -> bool:
         return False
 
     try:
-        with open(merged_file_path, "r", encoding="utf-8") as f:
-            # Read first line to check if date exists
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    # Check for daily time series first
-                    time_series = data.get("Time Series (Daily)", {})
-                    if date in time_series:
-                        return True
-
-                    # If no daily data, check for hourly data (e.g., "Time Series (60min)")
-                    for key, value in data.items():
-                        if key.startswith("Time Series") and isinstance(value, dict):
-                            # Check if any hourly timestamp starts with the date
-                            for timestamp in value.keys():
-                                if timestamp.startswith(date):
-                                    return True
-                except json.JSONDecodeError:
-                    continue
-            # If we get here, checked all stocks and date was not found in any
-            return False
+        calendar = get_trading_calendar(market)
+        # 日线直接命中时间轴；小时线只要有任一时间点属于该日期即可
+        return calendar is not None and calendar.has_date(date)
     except Exception as e:
         print(f"⚠️  Error checking trading day: {e}")
         return False
@@ -348,18 +342,11 @@ def get_all_trading_days(market: str = "us") -> List[str]:
         print(f"⚠️  Warning: {merged_file_path} not found")
         return []
 
-    trading_days = set()
     try:
-        with open(merged_file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    time_series = data.get("Time Series (Daily)", {})
-                    # Add all dates from this stock's time series
-                    trading_days.update(time_series.keys())
-                except json.JSONDecodeError:
-                    continue
-        return sorted(list(trading_days))
+        store = get_price_store(merged_file_path)
+        if store is None or not store.is_daily:
+            return []
+        return list(store.calendar.timestamps)
     except Exception as e:
         print(f"⚠️  Error reading trading days: {e}")
         return []
@@ -379,33 +366,23 @@ def get_stock_name_mapping(market: str = "us") -> Dict[str, str]:
     if not merged_file_path.exists():
         return {}
 
-    name_map = {}
     try:
-        with open(merged_file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    data = json.loads(line.strip())
-                    meta = data.get("Meta Data", {})
-                    symbol = meta.get("2. Symbol")
-                    name = meta.get("2.1. Name", "")
-                    if symbol and name:
-                        name_map[symbol] = name
-                except json.JSONDecodeError:
-                    continue
-        return name_map
+        store = get_price_store(merged_file_path)
+        return dict(store.names) if store is not None else {}
     except Exception as e:
         print(f"⚠️  Error reading stock names: {e}")
         return {}
 
 
 def format_price_dict_with_names(
-    price_dict: Dict[str, Optional[float]], market: str = "us"
+    price_dict: Dict[str, Optional[float]], market: str = "us", name_map: Optional[Dict[str, str]] = None
 ) -> Dict[str, Optional[float]]:
     """Format price dictionary to include stock names for display.
 
     Args:
         price_dict: Original price dictionary with keys like "600519.SH_price"
         market: Market type ("us" or "cn")
+        name_map: Optional {symbol: name} mapping; loaded from the merged file if not given
 
     Returns:
         New dictionary with keys like "600519.SH (贵州茅台)_price" for CN market,
@@ -414,7 +391,8 @@ def format_price_dict_with_names(
     if market != "cn":
         return price_dict
 
-    name_map = get_stock_name_mapping(market)
+    if name_map is None:
+        name_map = get_stock_name_mapping(market)
     if not name_map:
         return price_dict
 
@@ -437,7 +415,7 @@ def format_price_dict_with_names(
 def get_yesterday_date(today_date: str, merged_path: Optional[str] = None, market: str = "us") -> str:
     """
     获取输入日期的上一个交易日或时间点。
-    从 merged.jsonl 读取所有可用的交易时间，然后找到 today_date 的上一个时间。
+    基于进程内缓存的 TradingCalendar，二分查找 today_date 的上一个时间。
     
     Args:
         today_date: 日期字符串，格式 YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS。
@@ -461,66 +439,17 @@ def get_yesterday_date(today_date: str, merged_path: Optional[str] = None, marke
     if not merged_file.exists():
         # 如果文件不存在，根据输入类型回退
         print(f"merged.jsonl file does not exist at {merged_file}")
-        if date_only:
-            yesterday_dt = input_dt - timedelta(days=1)
-            while yesterday_dt.weekday() >= 5:
-                yesterday_dt -= timedelta(days=1)
-            return yesterday_dt.strftime("%Y-%m-%d")
-        else:
-            yesterday_dt = input_dt - timedelta(hours=1)
-            return yesterday_dt.strftime("%Y-%m-%d %H:%M:%S")
+        return _previous_timestamp_fallback(input_dt, date_only)
     
-    # 从 merged.jsonl 读取所有可用的交易时间
-    all_timestamps = set()
-    
-    with merged_file.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            try:
-                doc = json.loads(line)
-                # 查找所有以 "Time Series" 开头的键
-                for key, value in doc.items():
-                    if key.startswith("Time Series"):
-                        if isinstance(value, dict):
-                            all_timestamps.update(value.keys())
-                        break
-            except Exception:
-                continue
-    
-    if not all_timestamps:
-        # 如果没有找到任何时间戳，根据输入类型回退
-        if date_only:
-            yesterday_dt = input_dt - timedelta(days=1)
-            while yesterday_dt.weekday() >= 5:
-                yesterday_dt -= timedelta(days=1)
-            return yesterday_dt.strftime("%Y-%m-%d")
-        else:
-            yesterday_dt = input_dt - timedelta(hours=1)
-            return yesterday_dt.strftime("%Y-%m-%d %H:%M:%S")
-    
-    # 将所有时间戳转换为 datetime 对象，并找到小于 today_date 的最大时间戳
-    previous_timestamp = None
-    
-    for ts_str in all_timestamps:
-        try:
-            ts_dt = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-            if ts_dt < input_dt:
-                if previous_timestamp is None or ts_dt > previous_timestamp:
-                    previous_timestamp = ts_dt
-        except Exception:
-            continue
+    # 在已排序的交易日历上二分查找小于 today_date 的最大时间戳
+    calendar = get_trading_calendar(market, today_date, merged_path)
+    previous_ts = calendar.prev(today_date) if calendar is not None else None
     
     # 如果没有找到更早的时间戳，根据输入类型回退
-    if previous_timestamp is None:
-        if date_only:
-            yesterday_dt = input_dt - timedelta(days=1)
-            while yesterday_dt.weekday() >= 5:
-                yesterday_dt -= timedelta(days=1)
-            return yesterday_dt.strftime("%Y-%m-%d")
-        else:
-            yesterday_dt = input_dt - timedelta(hours=1)
-            return yesterday_dt.strftime("%Y-%m-%d %H:%M:%S")
+    if previous_ts is None:
+        return _previous_timestamp_fallback(input_dt, date_only)
+
+    previous_timestamp = _parse_timestamp_to_dt(_normalize_timestamp_str(previous_ts))
 
     # 返回结果
     if date_only:
@@ -529,7 +458,6 @@ def get_yesterday_date(today_date: str, merged_path: Optional[str] = None, marke
         return previous_timestamp.strftime("%Y-%m-%d %H:%M:%S")
 
 
-
 def get_open_prices(
     today_date: str, symbols: List[str], merged_path: Optional[str] = None, market: str = "us"
 ) -> Dict[str, Optional[float]]:
@@ -544,45 +472,14 @@ def get_open_prices(
     Returns:
         {symbol_price: open_price 或 None} 的字典；若未找到对应日期或标的，则值为 None。
     """
-    wanted = set(symbols)
-    results: Dict[str, Optional[float]] = {}
-
     merged_file = _resolve_merged_file_path_for_date(today_date, market, merged_path)
 
-    if not merged_file.exists():
-        return results
-
-    with merged_file.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            try:
-                doc = json.loads(line)
-            except Exception:
-                continue
-            meta = doc.get("Meta Data", {}) if isinstance(doc, dict) else {}
-            sym = meta.get("2. Symbol")
-            if sym not in wanted:
-                continue
-            # 查找所有以 "Time Series" 开头的键
-            series = None
-            for key, value in doc.items():
-                if key.startswith("Time Series"):
-                    series = value
-                    break
-            if not isinstance(series, dict):
-                continue
-            bar = series.get(today_date)
-            
-            if isinstance(bar, dict):
-                open_val = bar.get("1. buy price")
-                
-                try:
-                    results[f"{sym}_price"] = float(open_val) if open_val is not None else None
-                except Exception:
-                    results[f"{sym}_price"] = None
+    store = get_price_store(merged_file)
+    if store is None:
+        return {}
 
-    return results
+    open_prices = store.field_at(today_date, symbols, "open")
+    return {f"{sym}_price": price for sym, price in open_prices.items()}
 
 
 def get_yesterday_open_and_close_price(
@@ -599,89 +496,25 @@ def get_yesterday_open_and_close_price(
     Returns:
         (买入价字典, 卖出价字典) 的元组；若未找到对应日期或标的，则值为 None。
     """
-    wanted = set(symbols)
     buy_results: Dict[str, Optional[float]] = {}
     sell_results: Dict[str, Optional[float]] = {}
 
     merged_file = _resolve_merged_file_path_for_date(today_date, market, merged_path)
 
-    if not merged_file.exists():
+    store = get_price_store(merged_file)
+    if store is None:
         return buy_results, sell_results
 
     yesterday_date = get_yesterday_date(today_date, merged_path=merged_path, market=market)
 
-    with merged_file.open("r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            try:
-                doc = json.loads(line)
-            except Exception:
-                continue
-            meta = doc.get("Meta Data", {}) if isinstance(doc, dict) else {}
-            sym = meta.get("2. Symbol")
-            if sym not in wanted:
-                continue
-            # 查找所有以 "Time Series" 开头的键
-            series = None
-            for key, value in doc.items():
-                if key.startswith("Time Series"):
-                    series = value
-                    break
-            if not isinstance(series, dict):
-                continue
-
-            # 尝试获取昨日买入价和卖出价
-            bar = series.get(yesterday_date)
-            if isinstance(bar, dict):
-                buy_val = bar.get("1. buy price")  # 买入价字段
-                sell_val = bar.get("4. sell price")  # 卖出价字段
-
-                try:
-                    buy_price = float(buy_val) if buy_val is not None else None
-                    sell_price = float(sell_val) if sell_val is not None else None
-                    buy_results[f"{sym}_price"] = buy_price
-                    sell_results[f"{sym}_price"] = sell_price
-                except Exception:
-                    buy_results[f"{sym}_price"] = None
-                    sell_results[f"{sym}_price"] = None
-            else:
-                # 如果昨日没有数据，尝试向前查找最近的交易日
-                # raise ValueError(f"No data found for {sym} on {yesterday_date}")
-                # print(f"No data found for {sym} on {yesterday_date}")
-                buy_results[f'{sym}_price'] = None
-                sell_results[f'{sym}_price'] = None
-                # today_dt = datetime.strptime(today_date, "%Y-%m-%d")
-                # yesterday_dt = today_dt - timedelta(days=1)
-                # current_date = yesterday_dt
-                # found_data = False
-                
-                # # 最多向前查找5个交易日
-                # for _ in range(5):
-                #     current_date -= timedelta(days=1)
-                #     # 跳过周末
-                #     while current_date.weekday() >= 5:
-                #         current_date -= timedelta(days=1)
-                    
-                #     check_date = current_date.strftime("%Y-%m-%d")
-                #     bar = series.get(check_date)
-                #     if isinstance(bar, dict):
-                #         buy_val = bar.get("1. buy price")
-                #         sell_val = bar.get("4. sell price")
-                        
-                #         try:
-                #             buy_price = float(buy_val) if buy_val is not None else None
-                #             sell_price = float(sell_val) if sell_val is not None else None
-                #             buy_results[f'{sym}_price'] = buy_price
-                #             sell_results[f'{sym}_price'] = sell_price
-                #             found_data = True
-                #             break
-                #         except Exception:
-                #             continue
-                
-                # if not found_data:
-                #     buy_results[f'{sym}_price'] = None
-                #     sell_results[f'{sym}_price'] = None
+    # 尝试获取昨日买入价和卖出价；昨日没有数据的标的值为 None
+    yesterday_buy = store.field_at(yesterday_date, symbols, "open")
+    yesterday_sell = store.field_at(yesterday_date, symbols, "close")
+    for sym in symbols:
+        if not store.has_symbol(sym):
+            continue
+        buy_results[f"{sym}_price"] = yesterday_buy.get(sym)
+        sell_results[f"{sym}_price"] = yesterday_sell.get(sym)
 
     return buy_results, sell_results
 
@@ -773,13 +606,16 @@ def get_today_init_position(today_date: str, signature: str) -> Dict[str, float]
     if not position_file.exists():
         print(f"Position file {position_file} does not exist")
         return {}
+
+    try:
+        snapshot = refresh_position_snapshot(position_file)
+        if snapshot is not None:
+            positions = snapshot_init_position(snapshot, today_date)
+            if positions is not None:
+                return positions
+    except Exception as e:
+        print(f"⚠️  Position snapshot unavailable, scanning ledger: {e}")
     
-    # 获取市场类型，智能判断
-    market = get_market_type()
-    yesterday_date = get_yesterday_date(today_date, market=market)
-    
-    max_id = -1
-    latest_positions = {}
     all_records = []
   
     with position_file.open("r", encoding="utf-8") as f:
@@ -843,7 +679,112 @@ def get_latest_position(today_date: str, signature: str) -> Tuple[Dict[str, floa
 
     # 获取市场类型，智能判断
     market = get_market_type()
-    
+    prev_date = get_yesterday_date(today_date, market=market)
+
+    # 优先使用 position/latest.json 快照（只折叠新追加的行）
+    try:
+        snapshot = refresh_position_snapshot(position_file)
+        if snapshot is not None:
+            result = snapshot_latest_position(snapshot, today_date, prev_date)
+            if result is not None:
+                return result
+    except Exception as e:
+        print(f"⚠️  Position snapshot unavailable, scanning ledger: {e}")
+
+    # 账本只追加且按时间排序，优先从文件末尾倒序读取；顺序异常时回退到全量扫描
+    result = _latest_position_from_tail(position_file, today_date, prev_date)
+    if result is not None:
+        return result
+    return _latest_position_full_scan(position_file, today_date, prev_date)
+
+
+def _read_lines_reversed(path: Path, block_size: int = 64 * 1024):
+    """Yield the raw lines of ``path`` from last to first, reading fixed-size blocks backwards from EOF."""
+    with path.open("rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        remainder = b""
+        while pos > 0:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            lines = (f.read(read_size) + remainder).split(b"\n")
+            # 第一段可能是被块边界截断的半行，留到下一块拼接
+            remainder = lines[0]
+            for line in reversed(lines[1:]):
+                yield line
+        yield remainder
+
+
+def _latest_position_from_tail(
+    position_file: Path, today_date: str, prev_date: str
+) -> Optional[Tuple[Dict[str, float], int]]:
+    """
+    Reverse-reading fast path of get_latest_position.
+
+    Walks the ledger from EOF and stops as soon as the today / previous-day / latest-earlier
+    candidates can no longer change. Returns None if the ledger turns out not to be
+    time-ordered, in which case the caller falls back to the full scan.
+    """
+    try:
+        today_dt = _parse_timestamp_to_dt(_normalize_timestamp_str(today_date))
+        prev_dt = _parse_timestamp_to_dt(_normalize_timestamp_str(prev_date))
+    except (TypeError, ValueError):
+        return None
+
+    max_id_today, positions_today = -1, {}
+    max_id_prev, positions_prev = -1, {}
+    # 早于 today_date 的最新非空记录: (时间, 排序用 id, 记录)
+    latest_earlier: Optional[Tuple[datetime, Any, Dict[str, Any]]] = None
+    last_dt: Optional[datetime] = None
+
+    for raw in _read_lines_reversed(position_file):
+        if not raw.strip():
+            continue
+        try:
+            doc = json.loads(raw)
+            doc_date = doc.get("date")
+            if not doc_date:
+                continue
+            doc_dt = _parse_timestamp_to_dt(_normalize_timestamp_str(doc_date))
+        except Exception:
+            continue
+
+        if last_dt is not None and doc_dt > last_dt:
+            return None
+        last_dt = doc_dt
+
+        if doc_dt < today_dt:
+            # 当天的记录已全部读到
+            if max_id_today >= 0 and positions_today:
+                break
+            # 前一交易日和更早的候选都已确定
+            if doc_dt < prev_dt and latest_earlier is not None and doc_dt < latest_earlier[0]:
+                break
+
+        current_id = doc.get("id", -1)
+        positions = doc.get("positions", {})
+        if doc_date == today_date and current_id > max_id_today:
+            max_id_today, positions_today = current_id, positions
+        if doc_date == prev_date and current_id > max_id_prev:
+            max_id_prev, positions_prev = current_id, positions
+        if doc_dt < today_dt and positions:
+            sort_id = doc.get("id", 0)
+            # >=：同一时间同一 id 时与全量扫描一样取文件中靠前的记录
+            if latest_earlier is None or (doc_dt, sort_id) >= latest_earlier[:2]:
+                latest_earlier = (doc_dt, sort_id, doc)
+
+    if max_id_today >= 0 and positions_today:
+        return positions_today, max_id_today
+    if max_id_prev >= 0 and positions_prev:
+        return positions_prev, max_id_prev
+    if latest_earlier is not None:
+        return latest_earlier[2].get("positions", {}), latest_earlier[2].get("id", -1)
+    return positions_prev, max_id_prev
+
+
+def _latest_position_full_scan(position_file: Path, today_date: str, prev_date: str) -> Tuple[Dict[str, float], int]:
+    """Full-file scan of get_latest_position, used when the ledger is not time-ordered."""
     # Step 1: 先查找当天的记录
     max_id_today = -1
     latest_positions_today: Dict[str, float] = {}
@@ -867,8 +808,6 @@ def get_latest_position(today_date: str, signature: str) -> Tuple[Dict[str, floa
         return latest_positions_today, max_id_today
     
     # Step 2: 当天没有记录，则回退到上一个交易日
-    prev_date = get_yesterday_date(today_date, market=market)
-    
     max_id_prev = -1
     latest_positions_prev: Dict[str, float] = {}
 
@@ -966,6 +905,7 @@ def add_no_trade_record(today_date: str, signature: str):
 
     with position_file.open("a", encoding="utf-8") as f:
         f.write(json.dumps(save_item) + "\n")
+    refresh_position_snapshot(position_file)
     return
 
 
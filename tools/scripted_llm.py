@@ -0,0 +1,108 @@
+"""
+Scripted stand-in chat model for running the agent loop without an LLM.
+
+Selected with ``basemodel="scripted:<policy.json>"``. BaseAgent then uses ScriptedChatModel instead
+of ChatOpenAI, which plays back the tool calls of a policy file, for example:
+
+    {
+        "latency": 0.0,
+        "steps": [
+            {"tool_calls": [{"name": "get_price_local", "args": {"symbol": "NVDA", "date": "{today}"}}]},
+            {"tool_calls": [{"name": "buy", "args": {"symbol": "NVDA", "amount": 1}}]},
+            {"content": "Done for today. <FINISH_SIGNAL>"}
+        ]
+    }
+
+Each model call returns the next step. A session starts over at the first step whenever the model
+sees a conversation without assistant messages. Once the steps are used up, every call returns the
+finish signal. "{today}" and "{signature}" in string arguments/contents are replaced by the current
+TODAY_DATE and SIGNATURE. ``latency`` (seconds) is slept on every call to imitate a remote model.
+"""
+
+import asyncio
+import copy
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from tools.general_tools import get_config_value
+
+SCRIPTED_MODEL_PREFIX = "scripted:"
+FINISH_CONTENT = "<FINISH_SIGNAL>"
+
+
+def is_scripted_model(basemodel: str) -> bool:
+    return basemodel.startswith(SCRIPTED_MODEL_PREFIX)
+
+
+def _fill_placeholders(value: Any, values: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        for key, replacement in values.items():
+            value = value.replace("{" + key + "}", replacement)
+        return value
+    if isinstance(value, dict):
+        return {k: _fill_placeholders(v, values) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill_placeholders(v, values) for v in value]
+    return value
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Chat model that replays the steps of a policy instead of calling an LLM."""
+
+    steps: List[Dict[str, Any]]
+    latency: float = 0.0
+
+    _step: int = PrivateAttr(default=0)
+
+    @classmethod
+    def from_policy_file(cls, policy_path: str) -> "ScriptedChatModel":
+        with open(Path(policy_path), "r", encoding="utf-8") as f:
+            policy = json.load(f)
+        return cls(steps=policy.get("steps", []), latency=float(policy.get("latency", 0.0)))
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ScriptedChatModel":
+        # 工具调用来自脚本，不需要把工具 schema 发给模型
+        return self
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        if not any(isinstance(m, AIMessage) for m in messages):
+            self._step = 0
+        step_index = self._step
+        self._step += 1
+
+        step = self.steps[step_index] if step_index < len(self.steps) else {"content": FINISH_CONTENT}
+        values = {
+            "today": str(get_config_value("TODAY_DATE") or ""),
+            "signature": str(get_config_value("SIGNATURE") or ""),
+        }
+        step = _fill_placeholders(copy.deepcopy(step), values)
+        tool_calls = [
+            {"name": call["name"], "args": call.get("args", {}), "id": f"call_{step_index}_{i}", "type": "tool_call"}
+            for i, call in enumerate(step.get("tool_calls", []))
+        ]
+        return AIMessage(content=step.get("content", ""), tool_calls=tool_calls)
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
@@ -0,0 +1,128 @@
+"""
+Buffered asynchronous writer for the session logs (log/<date>/log.jsonl).
+
+Agents queue log entries instead of opening and appending to the file for every message. One
+background task per event loop drains the bounded queue in batches, groups the lines by file and
+appends them in a worker thread, so file I/O never runs on the event loop. Written files are
+fsynced on a timer and whenever a caller asks for a durable flush (end of a session, errors).
+"""
+
+import asyncio
+import json
+import os
+import weakref
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_FSYNC_INTERVAL = 5.0
+
+
+def _append_lines(batches: Dict[str, List[str]]) -> None:
+    for path, lines in batches.items():
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+        except OSError as e:
+            print(f"⚠️  Could not write session log {path}: {e}")
+
+
+def _fsync_files(paths: Set[str]) -> None:
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+class AsyncLogWriter:
+    """Bounded queue of (path, line) plus the background task that writes it."""
+
+    def __init__(
+        self,
+        max_queue: int = DEFAULT_QUEUE_SIZE,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        fsync_interval: float = DEFAULT_FSYNC_INTERVAL,
+    ):
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._dirty: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_task(self) -> None:
+        if self._task is None or self._task.done():
+            if self._task is not None and not self._task.cancelled() and self._task.exception() is not None:
+                print(f"⚠️  Session log writer stopped ({self._task.exception()!r}), restarting it")
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def write(self, path: str, entry: Dict[str, Any]) -> None:
+        """Queue one JSON line for ``path``; waits only if the queue is full."""
+        self._ensure_task()
+        await self._queue.put((path, json.dumps(entry, ensure_ascii=False) + "\n"))
+
+    async def flush(self, fsync: bool = False) -> None:
+        """Wait until every queued entry is written; with ``fsync`` also sync the written files to disk."""
+        while True:
+            if not self._queue.empty():
+                # 写入任务已退出时重新启动，避免队列中的日志被静默丢弃
+                self._ensure_task()
+            join = asyncio.ensure_future(self._queue.join())
+            if self._task is None:
+                await join
+                break
+            done, _ = await asyncio.wait({join, self._task}, return_when=asyncio.FIRST_COMPLETED)
+            if join in done:
+                break
+            # 等待期间写入任务退出：取消这次等待，重启任务后继续
+            join.cancel()
+        if fsync and self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            await asyncio.to_thread(_fsync_files, dirty)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), timeout=self.fsync_interval)
+            except asyncio.TimeoutError:
+                # 空闲时定期把已写入的日志落盘
+                if self._dirty:
+                    dirty, self._dirty = self._dirty, set()
+                    await asyncio.to_thread(_fsync_files, dirty)
+                continue
+
+            items: List[Tuple[str, str]] = [first]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            batches: Dict[str, List[str]] = {}
+            for path, line in items:
+                batches.setdefault(path, []).append(line)
+            try:
+                await asyncio.to_thread(_append_lines, batches)
+                self._dirty.update(batches)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+
+_WRITERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncLogWriter]" = weakref.WeakKeyDictionary()
+
+
+def get_log_writer() -> AsyncLogWriter:
+    """Return the log writer of the running event loop (shared by all agents in the process)."""
+    loop = asyncio.get_running_loop()
+    writer = _WRITERS.get(loop)
+    if writer is None:
+        writer = AsyncLogWriter()
+        _WRITERS[loop] = writer
+    return writer
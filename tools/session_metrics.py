@@ -0,0 +1,293 @@
+"""
+Structured timing/token metrics for trading sessions, plus a summarizer.
+
+Every session writes metrics.jsonl next to its log.jsonl (log/<date>/metrics.jsonl), one JSON
+record per event:
+    {"type": "llm", "step", "latency_s", "prompt_tokens", "completion_tokens", ...}
+    {"type": "tool", "step", "tool", "latency_s", "bytes", "error"}
+    {"type": "retry", "step", "attempt", "error"}
+    {"type": "step", "step", "wall_s", "history_tokens", "llm_calls", "tool_calls", "retries"}
+    {"type": "session", "wall_s", "setup_s", "steps", "llm_calls", "tool_calls", "retries",
+     "prompt_tokens", "completion_tokens", "status"}
+All records also carry signature, basemodel and date. LLM and tool events are collected through
+LangChain callbacks (SessionMetrics is passed in the agent's invoke config). Records are written by
+the background session log writer.
+
+Usage (summarize p50/p95 per model and per tool):
+    python tools/session_metrics.py
+    python tools/session_metrics.py data/agent_data_astock --json
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackHandler
+
+# Add project root directory to Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from tools.session_log import get_log_writer
+
+METRICS_FILENAME = "metrics.jsonl"
+
+
+def metrics_path_for(log_file: str) -> str:
+    """log/<date>/log.jsonl -> log/<date>/metrics.jsonl"""
+    return os.path.join(os.path.dirname(log_file), METRICS_FILENAME)
+
+
+def _token_usage(response: Any) -> Dict[str, Optional[int]]:
+    """Prompt/completion tokens of an LLMResult (usage_metadata first, then the provider's token_usage)."""
+    try:
+        message = response.generations[0][0].message
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            return {"prompt_tokens": usage.get("input_tokens"), "completion_tokens": usage.get("output_tokens")}
+    except (AttributeError, IndexError, TypeError):
+        pass
+    token_usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    return {"prompt_tokens": token_usage.get("prompt_tokens"), "completion_tokens": token_usage.get("completion_tokens")}
+
+
+def _output_bytes(output: Any) -> int:
+    content = getattr(output, "content", output)
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False, default=str)
+    return len(content.encode("utf-8"))
+
+
+class SessionMetrics(AsyncCallbackHandler):
+    """Collects the metrics of one trading session and writes them to metrics.jsonl."""
+
+    def __init__(self, metrics_file: str, signature: str, basemodel: str, today_date: str):
+        self.metrics_file = metrics_file
+        self.base = {"signature": signature, "basemodel": basemodel, "date": today_date}
+        self.session_start = time.perf_counter()
+        self.setup_s: Optional[float] = None
+        self.step = 0
+        self._step_start: Optional[float] = None
+        self._step_counts = {"llm_calls": 0, "tool_calls": 0, "retries": 0}
+        self.totals = {"steps": 0, "llm_calls": 0, "tool_calls": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._llm_start: Dict[Any, float] = {}
+        self._tool_start: Dict[Any, tuple] = {}
+
+    async def _emit(self, record: Dict[str, Any]) -> None:
+        await get_log_writer().write(self.metrics_file, {**self.base, **record})
+
+    def _count(self, key: str) -> None:
+        self._step_counts[key] += 1
+        self.totals[key] += 1
+
+    # ---- LangChain callbacks ----
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._llm_start[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        start = self._llm_start.pop(run_id, None)
+        if start is None:
+            return
+        self._count("llm_calls")
+        usage = _token_usage(response)
+        self.totals["prompt_tokens"] += usage["prompt_tokens"] or 0
+        self.totals["completion_tokens"] += usage["completion_tokens"] or 0
+        await self._emit({"type": "llm", "step": self.step, "latency_s": round(time.perf_counter() - start, 6), **usage})
+
+    async def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        start = self._llm_start.pop(run_id, None)
+        if start is None:
+            return
+        await self._emit(
+            {"type": "llm", "step": self.step, "latency_s": round(time.perf_counter() - start, 6), "error": str(error)[:200]}
+        )
+
+    async def on_tool_start(self, serialized, input_str, *, run_id, **kwargs) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        self._tool_start[run_id] = (time.perf_counter(), name)
+
+    async def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        started = self._tool_start.pop(run_id, None)
+        if started is None:
+            return
+        start, name = started
+        self._count("tool_calls")
+        await self._emit(
+            {
+                "type": "tool",
+                "step": self.step,
+                "tool": name,
+                "latency_s": round(time.perf_counter() - start, 6),
+                "bytes": _output_bytes(output),
+                "error": None,
+            }
+        )
+
+    async def on_tool_error(self, error, *, run_id, **kwargs) -> None:
+        started = self._tool_start.pop(run_id, None)
+        if started is None:
+            return
+        start, name = started
+        self._count("tool_calls")
+        await self._emit(
+            {
+                "type": "tool",
+                "step": self.step,
+                "tool": name,
+                "latency_s": round(time.perf_counter() - start, 6),
+                "bytes": 0,
+                "error": str(error)[:200],
+            }
+        )
+
+    # ---- session loop hooks ----
+    def start_step(self, step: int) -> None:
+        if self.setup_s is None:
+            # 第一步之前的时间：构建系统提示词和创建 agent
+            self.setup_s = round(time.perf_counter() - self.session_start, 6)
+        self.step = step
+        self._step_start = time.perf_counter()
+        self._step_counts = {"llm_calls": 0, "tool_calls": 0, "retries": 0}
+
+    async def record_retry(self, attempt: int, error: Exception) -> None:
+        self._count("retries")
+        await self._emit({"type": "retry", "step": self.step, "attempt": attempt, "error": str(error)[:200]})
+
+    async def end_step(self, history_tokens: Optional[int] = None) -> None:
+        if self._step_start is None:
+            return
+        self.totals["steps"] += 1
+        await self._emit(
+            {
+                "type": "step",
+                "step": self.step,
+                "wall_s": round(time.perf_counter() - self._step_start, 6),
+                "history_tokens": history_tokens,
+                **self._step_counts,
+            }
+        )
+        self._step_start = None
+
+    async def end_session(self, status: str = "ok") -> None:
+        await self._emit(
+            {
+                "type": "session",
+                "wall_s": round(time.perf_counter() - self.session_start, 6),
+                "setup_s": self.setup_s,
+                **self.totals,
+                "status": status,
+            }
+        )
+
+
+def _percentiles(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    arr = np.array(values, dtype=float)
+    return {
+        "count": len(values),
+        "p50": round(float(np.percentile(arr, 50)), 4),
+        "p95": round(float(np.percentile(arr, 95)), 4),
+        "max": round(float(arr.max()), 4),
+    }
+
+
+def summarize_metrics(roots: List[str]) -> Dict[str, Any]:
+    """
+    Aggregate all metrics.jsonl files under ``roots`` (agent data directories).
+
+    Returns:
+        {"models": {basemodel: {...}}, "tools": {tool: {...}}} with p50/p95/max per measure
+    """
+    per_model: Dict[str, Dict[str, List[float]]] = {}
+    per_tool: Dict[str, Dict[str, List[float]]] = {}
+    tool_errors: Dict[str, int] = {}
+
+    for root in roots:
+        for path in glob.glob(os.path.join(root, "*", "log", "*", METRICS_FILENAME)):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    model = record.get("basemodel") or record.get("signature") or "unknown"
+                    m = per_model.setdefault(
+                        model, {"session_s": [], "step_s": [], "llm_s": [], "prompt_tokens": [], "completion_tokens": [], "retries": []}
+                    )
+                    kind = record.get("type")
+                    if kind == "session":
+                        m["session_s"].append(record["wall_s"])
+                        m["retries"].append(record.get("retries", 0))
+                    elif kind == "step":
+                        m["step_s"].append(record["wall_s"])
+                    elif kind == "llm" and not record.get("error"):
+                        m["llm_s"].append(record["latency_s"])
+                        if record.get("prompt_tokens") is not None:
+                            m["prompt_tokens"].append(record["prompt_tokens"])
+                        if record.get("completion_tokens") is not None:
+                            m["completion_tokens"].append(record["completion_tokens"])
+                    elif kind == "tool":
+                        name = record.get("tool", "unknown")
+                        t = per_tool.setdefault(name, {"latency_s": [], "bytes": []})
+                        t["latency_s"].append(record["latency_s"])
+                        t["bytes"].append(record.get("bytes", 0))
+                        if record.get("error"):
+                            tool_errors[name] = tool_errors.get(name, 0) + 1
+
+    return {
+        "models": {
+            model: {**{k: _percentiles(v) for k, v in values.items()}, "retries_total": int(sum(values["retries"]))}
+            for model, values in sorted(per_model.items())
+        },
+        "tools": {
+            name: {**{k: _percentiles(v) for k, v in values.items()}, "errors": tool_errors.get(name, 0)}
+            for name, values in sorted(per_tool.items())
+        },
+    }
+
+
+def _print_summary(summary: Dict[str, Any]) -> None:
+    def cell(stats: Dict[str, Any], key: str) -> str:
+        return f"{stats[key]:.3f}" if stats.get("count") else "-"
+
+    print(f"{'model':<32}{'sessions':>9}{'session p50/p95 s':>20}{'llm p50/p95 s':>18}{'prompt tok p50':>16}{'retries':>9}")
+    for model, m in summary["models"].items():
+        print(
+            f"{model:<32}{m['session_s'].get('count', 0):>9}"
+            f"{cell(m['session_s'], 'p50') + '/' + cell(m['session_s'], 'p95'):>20}"
+            f"{cell(m['llm_s'], 'p50') + '/' + cell(m['llm_s'], 'p95'):>18}"
+            f"{cell(m['prompt_tokens'], 'p50'):>16}{m['retries_total']:>9}"
+        )
+    print()
+    print(f"{'tool':<32}{'calls':>9}{'latency p50/p95 s':>20}{'bytes p50/p95':>20}{'errors':>9}")
+    for name, t in summary["tools"].items():
+        print(
+            f"{name:<32}{t['latency_s'].get('count', 0):>9}"
+            f"{cell(t['latency_s'], 'p50') + '/' + cell(t['latency_s'], 'p95'):>20}"
+            f"{cell(t['bytes'], 'p50') + '/' + cell(t['bytes'], 'p95'):>20}{t['errors']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize per-model and per-tool session metrics")
+    parser.add_argument(
+        "roots",
+        nargs="*",
+        default=["./data/agent_data", "./data/agent_data_astock", "./data/agent_data_crypto"],
+        help="Agent data directories to scan",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    result = summarize_metrics(args.roots)
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    else:
+        _print_summary(result)
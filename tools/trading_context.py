@@ -0,0 +1,106 @@
+"""
+Request-scoped trading context for the MCP tool servers.
+
+Agents send "who is trading and when" (SIGNATURE, TODAY_DATE, LOG_PATH, ...) as HTTP headers on
+every MCP request. TradingContextMiddleware turns those headers into a request context, so
+get_config_value() inside a tool call resolves them from the request instead of the shared
+.runtime_env.json. One server fleet can then serve many concurrent agents. Requests without
+these headers fall back to the runtime config file as before.
+"""
+
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional
+
+from tools.general_tools import request_context
+
+# 通过请求头传递的配置键
+CONTEXT_KEYS = ("SIGNATURE", "TODAY_DATE", "LOG_PATH", "MARKET", "RUNTIME_ENV_PATH")
+HEADER_PREFIX = "x-trading-"
+
+# 共享 MCP 客户端时，当前 asyncio 任务（即当前 agent）要附加到工具调用上的请求头
+_TASK_HEADERS: ContextVar[Optional[Dict[str, str]]] = ContextVar("_TASK_HEADERS", default=None)
+
+
+def header_name(key: str) -> str:
+    """SIGNATURE -> x-trading-signature, TODAY_DATE -> x-trading-today-date"""
+    return HEADER_PREFIX + key.lower().replace("_", "-")
+
+
+def context_from_headers(headers: Dict[str, str]) -> Dict[str, Any]:
+    """Extract the trading context from (lower-cased) HTTP headers."""
+    context: Dict[str, Any] = {}
+    for key in CONTEXT_KEYS:
+        value = headers.get(header_name(key))
+        if value:
+            context[key] = value
+    return context
+
+
+def attach_context_headers(mcp_config: Dict[str, Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Give every HTTP (and in-process) connection in an MCP client config its own mutable headers dict.
+
+    langchain-mcp-adapters opens a session per tool call from the connection config, and in-process
+    tools (tools/inproc_tools.py) read the headers on every call, so updating the returned dicts in
+    place (see update_context_headers) changes the context sent with all subsequent tool calls.
+
+    Args:
+        mcp_config: MultiServerMCPClient connection config, modified in place
+
+    Returns:
+        The headers dicts of all HTTP connections
+    """
+    header_dicts = []
+    for connection in mcp_config.values():
+        if connection.get("transport") in ("streamable_http", "sse", "inproc"):
+            headers = dict(connection.get("headers") or {})
+            connection["headers"] = headers
+            header_dicts.append(headers)
+    return header_dicts
+
+
+def update_context_headers(header_dicts: Iterable[Dict[str, str]], **values: Any) -> None:
+    """Set the trading context headers, e.g. update_context_headers(dicts, SIGNATURE=..., TODAY_DATE=...)."""
+    for headers in header_dicts:
+        for key, value in values.items():
+            if value is None:
+                headers.pop(header_name(key), None)
+            else:
+                headers[header_name(key)] = str(value)
+
+
+def use_task_context_headers(headers: Dict[str, str]) -> None:
+    """
+    Send ``headers`` with every tool call made from the current asyncio task through a shared client.
+
+    Several agents can share one MultiServerMCPClient (and its tool list) when it is created with
+    ``tool_interceptors=[task_context_interceptor]``. Each agent task registers its own headers
+    dict here and keeps updating it with update_context_headers.
+    """
+    _TASK_HEADERS.set(headers)
+
+
+async def task_context_interceptor(request, handler):
+    """langchain-mcp-adapters tool interceptor adding the current task's trading context headers."""
+    headers = _TASK_HEADERS.get()
+    if headers:
+        request = request.override(headers={**(request.headers or {}), **headers})
+    return await handler(request)
+
+
+try:
+    from fastmcp.server.dependencies import get_http_headers
+    from fastmcp.server.middleware import Middleware, MiddlewareContext
+
+    class TradingContextMiddleware(Middleware):
+        """Run each tool call inside the trading context carried by its request headers."""
+
+        async def on_call_tool(self, context: MiddlewareContext, call_next):
+            values = context_from_headers(get_http_headers())
+            if not values:
+                return await call_next(context)
+            with request_context(values):
+                return await call_next(context)
+
+except ImportError:  # fastmcp 未安装时（如仅运行 agent 端）不提供中间件
+    TradingContextMiddleware = None